@@ -20,3 +20,13 @@
 from activipy.core import *
 from activipy.vocab import *
 
+
+
+def __getattr__(name):
+    # Lazily loaded module attributes (like AS2_CONTEXT) aren't picked
+    # up by the star import above, so forward them along.
+    from activipy import core
+    if name in core._LAZY_ATTRIBUTES:
+        return getattr(core, name)
+    raise AttributeError(
+        "module %r has no attribute %r" % (__name__, name))
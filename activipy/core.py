@@ -17,11 +17,184 @@
 ##   See the License for the specific language governing permissions and
 ##   limitations under the License.
 
-from pkg_resources import resource_filename
+from collections import namedtuple, OrderedDict
+from importlib import import_module
 import copy
+import hashlib
 import json
+import os
+import re
+import threading
+import time
+import weakref
 
-from pyld import jsonld
+
+# pyld is slow to import and plenty of programs (command line tools,
+# short-lived handlers) never expand anything, so we only pull it in
+# the first time it's actually needed.
+_jsonld = None
+
+def get_jsonld():
+    """
+    Return pyld's jsonld module, importing it on first use
+    """
+    global _jsonld
+    if _jsonld is None:
+        from pyld import jsonld
+        _jsonld = jsonld
+    return _jsonld
+
+
+def resource_filename(package, resource):
+    """
+    Get the path to a data file shipped inside a python package
+
+    (A lightweight stand-in for pkg_resources.resource_filename, which
+    is very slow to import.)
+    """
+    return os.path.join(
+        os.path.dirname(import_module(package).__file__), resource)
+
+
+
+# Instrumentation
+# ===============
+#
+# Opt-in counters and timers around activipy's hot paths.  Nothing is
+# recorded unless a sink is installed with set_instrumentation(); when
+# none is, each instrumented spot costs a single global lookup.
+#
+# Metric names currently emitted:
+#  - deepcopy_jsobj.in (ASObj ingest) / deepcopy_jsobj.out (timing)
+#  - jsonld.expand (timing)
+#  - loader.hit / loader.miss (count), loader.fetch (timing)
+#  - astypes.fast_path / astypes.expansion_fallback (count)
+#  - method.<method name> (timing, one per dispatch)
+#  - intern.hit / intern.miss (count)
+#  - expansion_cache.hit / expansion_cache.miss (count)
+
+_instrument = None
+
+
+class InstrumentationSink(object):
+    """
+    Base class for things that receive instrumentation data
+    """
+    def count(self, name, value=1):
+        pass
+
+    def timing(self, name, seconds):
+        pass
+
+
+class MemorySink(InstrumentationSink):
+    """
+    Aggregate instrumentation data in memory
+
+    report() gives {name: {"count": n, "total": seconds, "min": seconds,
+    "max": seconds}} for timings and {name: {"count": n}} for counts.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {}
+        self.timings = {}
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def timing(self, name, seconds):
+        with self._lock:
+            stats = self.timings.get(name)
+            if stats is None:
+                self.timings[name] = [1, seconds, seconds, seconds]
+            else:
+                stats[0] += 1
+                stats[1] += seconds
+                if seconds < stats[2]:
+                    stats[2] = seconds
+                if seconds > stats[3]:
+                    stats[3] = seconds
+
+    def report(self):
+        with self._lock:
+            report = {
+                name: {"count": count}
+                for name, count in self.counts.items()}
+            for name, (count, total, low, high) in self.timings.items():
+                report[name] = {
+                    "count": count, "total": total, "min": low, "max": high}
+        return report
+
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+            self.timings.clear()
+
+
+class StatsdSink(InstrumentationSink):
+    """
+    Pass instrumentation data along statsd-style
+
+    callback is called as callback(name, value, metric_type) where
+    metric_type is "c" for counts (value is the increment) or "ms"
+    for timings (value is in milliseconds).  An optional prefix is
+    prepended to every name, eg "activipy." .
+    """
+    def __init__(self, callback, prefix=""):
+        self.callback = callback
+        self.prefix = prefix
+
+    def count(self, name, value=1):
+        self.callback(self.prefix + name, value, "c")
+
+    def timing(self, name, seconds):
+        self.callback(self.prefix + name, seconds * 1000, "ms")
+
+
+def set_instrumentation(sink):
+    """
+    Install an InstrumentationSink (or None to turn it off)
+
+    Returns the previously installed sink.
+    """
+    global _instrument
+    previous = _instrument
+    _instrument = sink
+    return previous
+
+
+def get_instrumentation():
+    return _instrument
+
+
+def _timed_call(name, func, *args, **kwargs):
+    """
+    Call func, reporting how long it took to the installed sink
+
+    (Callers should check that there *is* an installed sink first, so
+    the uninstrumented path doesn't pay for this extra call.)
+    """
+    start = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        sink = _instrument
+        if sink is not None:
+            sink.timing(name, time.perf_counter() - start)
+
+
+async def _timed_coroutine(name, coroutine):
+    """
+    Await coroutine, reporting how long it took to the installed sink
+    """
+    start = time.perf_counter()
+    try:
+        return await coroutine
+    finally:
+        sink = _instrument
+        if sink is not None:
+            sink.timing(name, time.perf_counter() - start)
 
 
 # The actual instances of these are defined in vocab.py
@@ -35,18 +208,27 @@ class ASType(object):
     can have multiple types listed under @type.  So our inheritance
     model is a bit different than python's.
     """
-    def __init__(self, id_uri, parents, id_short=None, notes=None):
+    def __init__(self, id_uri, parents, id_short=None, notes=None,
+                 props=None):
         self.id_uri = id_uri
         self.parents = parents
         self.id_short = id_short
         self.notes = notes
+        # ASProps declared directly on this type (not its parents)
+        self.props = props or []
 
         self._inheritance = None
 
     def validate(self, asobj):
-        validator = self.methods.get("validate")
-        if validator is not None:
-            validator(asobj)
+        """
+        Check asobj against the constraints of this type (and its parents)
+
+        Raises InvalidASObj if there are any problems.
+        """
+        errors = asobj.env._validator_for(
+            tuple(self.inheritance_chain))(asobj._ASObj__jsobj)
+        if errors:
+            raise InvalidASObj(errors)
 
     def __repr__(self):
         return "<ASType %s>" % (self.id_short or self.id_uri)
@@ -82,6 +264,137 @@ class ASType(object):
             return ASObj(jsobj)
 
 
+# Validation
+# ==========
+
+ValidationError = namedtuple("ValidationError", ["key", "message"])
+
+
+class InvalidASObj(Exception):
+    """
+    Raised when an ActivityStreams object fails validation.
+
+    The .errors attribute holds a list of ValidationErrors.
+    """
+    def __init__(self, errors):
+        self.errors = errors
+        Exception.__init__(self, "; ".join(
+            "%s: %s" % (error.key, error.message) for error in errors))
+
+
+_DATETIME_RE = re.compile(
+    r"^-?\d{4,}-\d\d-\d\dT\d\d:\d\d:\d\d(\.\d+)?(Z|[+-]\d\d:\d\d)?$")
+_DURATION_RE = re.compile(
+    r"^-?P(?=\d|T\d)(\d+Y)?(\d+M)?(\d+D)?"
+    r"(T(?=\d)(\d+H)?(\d+M)?(\d+(\.\d+)?S)?)?$")
+
+
+def _is_number(val):
+    return isinstance(val, (int, float)) and not isinstance(val, bool)
+
+def _is_object(val):
+    return isinstance(val, (dict, ASObj))
+
+# Checkers for the value_types an ASProp may list.  Each takes a
+# single (non-list) value and returns whether it's acceptable.
+VALUE_CHECKERS = {
+    "string": lambda val: isinstance(val, str),
+    "boolean": lambda val: isinstance(val, bool),
+    "number": _is_number,
+    "nonNegativeInteger": lambda val: (
+        isinstance(val, int) and not isinstance(val, bool) and val >= 0),
+    "dateTime": lambda val: (
+        isinstance(val, str) and _DATETIME_RE.match(val) is not None),
+    "duration": lambda val: (
+        isinstance(val, str) and _DURATION_RE.match(val) is not None),
+    "mediaType": lambda val: isinstance(val, str) and "/" in val,
+    "iri": lambda val: isinstance(val, str),
+    "object": _is_object,
+    # An embedded object, or a reference to one by its IRI
+    "reference": lambda val: isinstance(val, str) or _is_object(val)}
+
+
+class ASProp(object):
+    """
+    A property an ASType declares, along with constraints on its value
+
+     - value_types: names from VALUE_CHECKERS; every value given must
+       match at least one of these.  (If empty, anything goes.)
+     - functional: the property may have at most one value
+     - required: objects of this type must have this property
+    """
+    def __init__(self, name, value_types=None, functional=False,
+                 required=False, notes=None):
+        for value_type in value_types or []:
+            if value_type not in VALUE_CHECKERS:
+                raise ValueError("Unknown value type: %s" % value_type)
+        self.name = name
+        self.value_types = tuple(value_types or [])
+        self.functional = functional
+        self.required = required
+        self.notes = notes
+
+    def __repr__(self):
+        return "<ASProp %s>" % self.name
+
+
+def compile_validator(astypes):
+    """
+    Compile the props of a full inheritance chain of ASTypes into a
+    single validator function.
+
+    The validator takes a json object and returns a list of
+    ValidationErrors (empty if everything's fine).  When a property is
+    declared by more than one type in the chain, the most specific
+    (earliest) one wins.
+    """
+    merged = {}
+    for astype in astypes:
+        for prop in astype.props:
+            merged.setdefault(prop.name, prop)
+
+    required = tuple(
+        name for name, prop in merged.items() if prop.required)
+    checks = tuple(
+        (name, prop.functional,
+         tuple(VALUE_CHECKERS[value_type]
+               for value_type in prop.value_types),
+         " or ".join(prop.value_types))
+        for name, prop in merged.items()
+        if prop.functional or prop.value_types)
+
+    def validator(jsobj):
+        errors = []
+        for name in required:
+            if name not in jsobj:
+                errors.append(ValidationError(
+                    name, "required property is missing"))
+
+        for name, functional, checkers, expected in checks:
+            if name not in jsobj:
+                continue
+            val = jsobj[name]
+            if isinstance(val, list):
+                if functional and len(val) > 1:
+                    errors.append(ValidationError(
+                        name, "functional property has %s values" % len(val)))
+                values = val
+            else:
+                values = (val,)
+
+            if checkers:
+                for item in values:
+                    for checker in checkers:
+                        if checker(item):
+                            break
+                    else:
+                        errors.append(ValidationError(
+                            name, "expected %s, got %r" % (expected, item)))
+        return errors
+
+    return validator
+
+
 def astype_inheritance_list(*astypes):
     """
     Gather the inheritance list for an ASType or multiple ASTypes
@@ -121,6 +434,8 @@ class ASVocab(object):
     """
     def __init__(self, vocabs):
         self.vocab_map = self._map_vocabs(vocabs)
+        # prefix: {short id: ASType}, see shortids_from_vocab
+        self._shortids_cache = {}
 
     def _map_vocabs(self, vocabs):
         return {
@@ -128,20 +443,131 @@ class ASVocab(object):
             for type in vocabs}
 
 
+class SingleFlightCache(object):
+    """
+    A dictionary-backed memo cache which is safe to share between threads
+
+    Reads of keys which are already filled never take a lock; they're
+    just a dictionary lookup.  When a key is missing, only one thread
+    at a time runs the (possibly expensive) fill function for that
+    key, and any other threads asking for the same key wait for that
+    result rather than computing it again.  Fills for different keys
+    don't block each other.
+
+    If the fill function raises an exception, nothing is cached and
+    the exception propagates to the thread that ran it; a waiting
+    thread will then try the fill itself.
+
+    .hits and .misses count lookups for statistics; they aren't
+    synchronized, so under heavy threading treat them as approximate.
+    """
+    def __init__(self, cache=None):
+        self.cache = {} if cache is None else cache
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, fill):
+        # Fast path: no locking at all
+        try:
+            val = self.cache[key]
+            self.hits += 1
+            return val
+        except KeyError:
+            self.misses += 1
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        try:
+            with key_lock:
+                # Someone may have beaten us to it while we waited
+                try:
+                    return self.cache[key]
+                except KeyError:
+                    pass
+                val = fill(key)
+                self.cache[key] = val
+                return val
+        finally:
+            with self._lock:
+                if self._key_locks.get(key) is key_lock:
+                    del self._key_locks[key]
+
+    def __contains__(self, key):
+        return key in self.cache
+
+    def __len__(self):
+        return len(self.cache)
+
+    def clear(self):
+        self.cache.clear()
+
+
+_package_json_cache = SingleFlightCache()
+
+def load_package_json(package, resource):
+    """
+    Load (once) and return a json file shipped inside a python package
+
+    The parsed result is shared, so don't mutate it.
+    """
+    def fill(key):
+        with open(resource_filename(*key), 'r') as json_file:
+            return json.load(json_file)
+    return _package_json_cache.get((package, resource), fill)
+
+
 # TODO: Add this one by default
-AS2_CONTEXT_FILE = resource_filename(
-    'activipy', 'activitystreams2-context.jsonld')
-AS2_CONTEXT = json.loads(open(AS2_CONTEXT_FILE, 'r').read())
 AS2_CONTEXT_URI = (
     "http://www.w3.org/TR/activitystreams-core/activitystreams2-context.jsonld")
-AS2_DEFAULT_URL_MAP = {
-    AS2_CONTEXT_URI: AS2_CONTEXT}
+
+# These are loaded lazily, on first access, by __getattr__ below, and
+# then kept as ordinary module globals.
+_LAZY_ATTRIBUTES = {
+    "AS2_CONTEXT_FILE": lambda: resource_filename(
+        'activipy', 'activitystreams2-context.jsonld'),
+    "AS2_CONTEXT": lambda: load_package_json(
+        'activipy', 'activitystreams2-context.jsonld'),
+    "AS2_DEFAULT_URL_MAP": lambda: {
+        AS2_CONTEXT_URI: load_package_json(
+            'activipy', 'activitystreams2-context.jsonld')}}
+
+def _lazy_attribute(name):
+    module_globals = globals()
+    if name not in module_globals:
+        module_globals[name] = _LAZY_ATTRIBUTES[name]()
+    return module_globals[name]
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        return _lazy_attribute(name)
+    raise AttributeError(
+        "module %r has no attribute %r" % (__name__, name))
 
 # Once things are cached, json-ld expansion seems to happen at about
 # 1250 douments / second on my laptop
 
 def make_simple_loader(url_map, load_unknown_urls=True,
-                       cache_externally_loaded=True):
+                       cache_externally_loaded=True, load_document=None):
+    """
+    Build a json-ld documentLoader which serves documents out of url_map
+
+    url_map may also be a function of no arguments returning the
+    mapping; either way, nothing is read or built until the loader is
+    first called.  (The AS2 context is always included.)
+
+    The returned loader is safe to share between threads.  If
+    cache_externally_loaded is set, concurrent requests for the same
+    unknown url will only fetch it once.  load_document is called
+    with just the url; it defaults to pyld's own default document
+    loader.
+    """
+    if load_document is None:
+        def load_document(url):
+            return get_jsonld().get_document_loader()(url, {})
+
     def _make_context(url, doc):
         return {
             "contextUrl": None,
@@ -150,26 +576,43 @@ def make_simple_loader(url_map, load_unknown_urls=True,
 
     # Wrap in the structure that's expected to come back from the
     # documentLoader
-    _pre_url_map = {}
-    _pre_url_map.update(AS2_DEFAULT_URL_MAP)
-    _pre_url_map.update(url_map)
-    _url_map = {
-        url: _make_context(url, doc)
-        for url, doc in _pre_url_map.items()}
-
-    def loader(url):
+    def build_url_map(key):
+        _pre_url_map = {}
+        _pre_url_map.update(_lazy_attribute("AS2_DEFAULT_URL_MAP"))
+        _pre_url_map.update(url_map() if callable(url_map) else url_map)
+        return SingleFlightCache({
+            url: _make_context(url, doc)
+            for url, doc in _pre_url_map.items()})
+
+    _lazy_url_map = SingleFlightCache()
+
+    def load_external(url):
+        if _instrument is not None:
+            doc = _timed_call("loader.fetch", load_document, url)
+        else:
+            doc = load_document(url)
+        # @@: Is this optimization safe in all cases?
+        if isinstance(doc["document"], str):
+            doc["document"] = json.loads(doc["document"])
+        return doc
+
+    # pyld passes along its options as well; we don't need them
+    def loader(url, options=None):
+        _url_map = _lazy_url_map.get("url_map", build_url_map)
         if url in _url_map:
-            return _url_map[url]
+            if _instrument is not None:
+                _instrument.count("loader.hit")
+            return _url_map.cache[url]
         elif load_unknown_urls:
-            doc = jsonld.load_document(url)
-            # @@: Is this optimization safe in all cases?
-            if isinstance(doc["document"], str):
-                doc["document"] = json.loads(doc["document"])
+            if _instrument is not None:
+                _instrument.count("loader.miss")
             if cache_externally_loaded:
-                _url_map[url] = doc
-            return doc
+                return _url_map.get(url, load_external)
+            return load_external(url)
         else:
-            raise jsonld.JsonLdError(
+            if _instrument is not None:
+                _instrument.count("loader.miss")
+            raise get_jsonld().JsonLdError(
                 "url not found and loader set to not load unknown URLs.",
                 {'url': url})
 
@@ -212,6 +655,11 @@ default_loader = make_simple_loader({})
 class ASObj(object):
     """
     The general ActivityStreams object that a user will work with
+
+    ASObj instances are immutable, so it's safe to share them between
+    threads.  Anything lazily computed and memoized on an ASObj is
+    computed from that immutable state, so if two threads race to fill
+    it in they'll both arrive at the same value.
     """
     def __init__(self, jsobj, env=None):
         if not env:
@@ -219,28 +667,44 @@ class ASObj(object):
             env = vocab.BasicEnv
         self.env = env
 
-        self.__jsobj = deepcopy_jsobj_in(jsobj, env)
+        if _instrument is not None:
+            self.__jsobj, self._index = _timed_call(
+                "deepcopy_jsobj.in", ingest_jsobj, jsobj, env)
+        else:
+            self.__jsobj, self._index = ingest_jsobj(jsobj, env)
 
-        assert (isinstance(self.__jsobj.get("@type"), str) or
-                isinstance(self.__jsobj.get("@type"), list))
+        assert self._index.type_ids is not None
 
-        self.m = self.env._build_m_map(self)
+        # Built on first access
+        self._m = None
+        # Results of pure methods, see pure_method
+        self._method_memo = None
+
+    @property
+    def m(self):
+        if self._m is None:
+            self._m = self.env._build_m_map(self)
+        return self._m
 
     def __getitem__(self, key):
         val = self.__jsobj[key]
         if isinstance(val, dict) and "@type" in val:
-            return ASObj(val, self.env)
+            return _wrap_jsobj(val, self.env)
         else:
             return deepcopy_jsobj_out(val, env=self.env)
 
     # META TODO: Convert some @property here to @memoized_property
     @property
     def types(self):
-        type_attr = self["@type"]
-        if isinstance(self["@type"], list):
-            return type_attr
-        else:
-            return [type_attr]
+        return list(self._index.type_ids)
+
+    @property
+    def embedded(self):
+        """
+        Every object with a @type nested inside this one, as a list of
+        EmbeddedRefs (path, type ids, id)
+        """
+        return list(self._index.embedded)
 
     @property
     def types_expanded(self):
@@ -256,6 +720,143 @@ class ASObj(object):
     def types_inheritance(self):
         return self.env.asobj_astype_inheritance(self)
 
+    def validation_errors(self):
+        """
+        Get a list of ValidationErrors for this object (maybe empty)
+        """
+        return self.env._validator_for(
+            tuple(self.types_inheritance))(self.__jsobj)
+
+    def validate(self):
+        """
+        Raise InvalidASObj if this object doesn't pass validation
+        """
+        errors = self.validation_errors()
+        if errors:
+            raise InvalidASObj(errors)
+
+    def _shareable_json(self):
+        """
+        Our internal json minus any @context, for embedding in another
+        ASObj.  Only the top level dict is new; everything under it is
+        shared, so never mutate it!
+        """
+        return {key: val for key, val in self.__jsobj.items()
+                if key != "@context"}
+
+    @classmethod
+    def _from_ingested(cls, jsobj, index, env):
+        # Build an ASObj around json that's already been ingested
+        asobj = cls.__new__(cls)
+        asobj.env = env
+        asobj._ASObj__jsobj = jsobj
+        asobj._index = index
+        asobj._m = None
+        asobj._method_memo = None
+        assert index.type_ids is not None
+        return asobj
+
+    def evolve(self, **changes):
+        """
+        Get a new ASObj like this one, but with some keys changed
+
+          note.evolve(content="Updated content!")
+
+        Only the changed values are copied in; everything else is
+        shared with this object, so this is cheap even for big
+        objects.  ("id" and "type" work as aliases for @id and
+        @type, as usual.)
+        """
+        return self.evolve_in_many(
+            [((key,), val) for key, val in changes.items()])
+
+    def evolve_in(self, path, value):
+        """
+        Get a new ASObj with the value at path (a sequence of keys and
+        list indexes) replaced with value
+
+          create.evolve_in(["object", "content"], "Updated content!")
+
+        Only the containers along path are copied.
+        """
+        return self.evolve_in_many([(path, value)])
+
+    def evolve_in_many(self, changes):
+        """
+        Like evolve_in, but for a list of (path, value) pairs
+        """
+        new_json = dict(self.__jsobj)
+        parts = dict(self._index._parts)
+
+        for path, value in changes:
+            # (id/type aliases work at any depth, like when ingesting)
+            path = tuple(_KEY_ALIASES.get(step, step)
+                         if isinstance(step, str) else step
+                         for step in path)
+            if not path:
+                raise ValueError("Can't evolve an empty path")
+
+            new_value, new_parts = _ingest(value, path, self.env)
+
+            # Copy the containers on the way down to where we're
+            # setting things.  (new_json itself is already a copy.)
+            container = new_json
+            for step in path[:-1]:
+                child = container[step]
+                if isinstance(child, dict):
+                    child = dict(child)
+                elif isinstance(child, list):
+                    child = list(child)
+                else:
+                    raise ValueError(
+                        "Can't evolve through a non-container at %r"
+                        % (path,))
+                container[step] = child
+                container = child
+            container[path[-1]] = new_value
+
+            # Anything which was at or below path is gone now.  If
+            # path goes into an embedded ASObj's index, open that up
+            # (one level at a time) so we can drop just what changed.
+            # Changing an embedded object's @type or @id changes its
+            # own EmbeddedRef too, so that's rebuilt below.
+            depth = len(path)
+            retyped = len(path) > 1 and path[-1] in ("@type", "@id")
+            to_check = list(parts.get(path[0], ()))
+            kept = []
+            while to_check:
+                part = to_check.pop()
+                part_path = _part_path(part)
+                if part_path[:depth] == path or (
+                        retyped and isinstance(part, EmbeddedRef) and
+                        part_path == path[:-1]):
+                    continue
+                if (not isinstance(part, EmbeddedRef) and
+                        path[:len(part_path)] == part_path):
+                    to_check.extend(JsobjIndex._expand_part(part))
+                    continue
+                kept.append(part)
+            kept.extend(new_parts)
+            if retyped and "@type" in container:
+                kept.append(EmbeddedRef(
+                    path[:-1], _type_ids(container["@type"]),
+                    container.get("@id")))
+
+            if kept:
+                # Keep parents listed before their children.  (Within
+                # one container, entries at the same depth are all
+                # keys or all indexes, so this never mixes the two.)
+                kept.sort(key=_part_path)
+                parts[path[0]] = tuple(kept)
+            else:
+                parts.pop(path[0], None)
+
+        return self._from_ingested(
+            new_json,
+            JsobjIndex(_type_ids(new_json.get("@type")),
+                       new_json.get("@id"), parts),
+            self.env)
+
     # Don't memoize this, users might mutate
     def json(self):
         return copy.deepcopy(self.__jsobj)
@@ -275,7 +876,28 @@ class ASObj(object):
         if document_loader:
             options["documentLoader"] = document_loader
 
-        return jsonld.expand(self.__jsobj, options)
+        cache = self.env.expansion_cache
+        key = None
+        if cache is not None:
+            key = expansion_key(self.__jsobj, self.env.implied_context)
+            if key is not None:
+                cached = cache.get(key)
+                if _instrument is not None:
+                    _instrument.count(
+                        "expansion_cache.miss" if cached is None
+                        else "expansion_cache.hit")
+                if cached is not None:
+                    return cached
+
+        if _instrument is not None:
+            expanded = _timed_call(
+                "jsonld.expand", get_jsonld().expand, self.__jsobj, options)
+        else:
+            expanded = get_jsonld().expand(self.__jsobj, options)
+
+        if key is not None:
+            cache.put(key, expanded)
+        return expanded
 
     def expanded(self):
         """
@@ -291,7 +913,7 @@ class ASObj(object):
 
     @property
     def id(self):
-        return self.__jsobj.get("@id")
+        return self._index.id
 
     def __repr__(self):
         if self.id:
@@ -302,6 +924,531 @@ class ASObj(object):
             return "<ASObj %s>" % ", ".join(self.types)
 
 
+# Where a typed object sits inside of another one: path is a tuple of
+# the keys and list indexes leading to it from the top.
+EmbeddedRef = namedtuple("EmbeddedRef", ["path", "type_ids", "id"])
+
+
+class JsobjIndex(object):
+    """
+    What ingest_jsobj learned while copying a json object
+
+     - type_ids: the top level type ids (a tuple, or None if @type is
+       missing or malformed)
+     - id: the top level @id
+     - embedded: a tuple of EmbeddedRefs for every nested typed object,
+       parents before children
+
+    Since embedded ASObjs are shared rather than copied, so are their
+    indexes: internally we keep "parts", each either an EmbeddedRef
+    or a (path prefix, JsobjIndex) pair for an embedded ASObj, grouped
+    by top level key, and only flatten them out when .embedded is
+    asked for.  That way deriving one ASObj from another only touches
+    the parts under the keys which changed.
+    """
+    __slots__ = ("type_ids", "id", "_parts", "_embedded")
+
+    def __init__(self, type_ids, id, parts):
+        self.type_ids = type_ids
+        self.id = id
+        # {top level key: tuple of parts}
+        self._parts = parts
+        self._embedded = None
+
+    @property
+    def embedded(self):
+        if self._embedded is None:
+            flat = []
+            for key_parts in self._parts.values():
+                for part in key_parts:
+                    if isinstance(part, EmbeddedRef):
+                        flat.append(part)
+                    else:
+                        flat.extend(self._expand_part(part, flatten=True))
+            self._embedded = tuple(flat)
+        return self._embedded
+
+    @staticmethod
+    def _expand_part(part, flatten=False):
+        """
+        Open up a (prefix, JsobjIndex) part by one level (or all the
+        way, if flatten)
+        """
+        prefix, child = part
+        expanded = [EmbeddedRef(prefix, child.type_ids, child.id)]
+        if flatten:
+            expanded.extend(
+                EmbeddedRef(prefix + ref.path, ref.type_ids, ref.id)
+                for ref in child.embedded)
+            return expanded
+
+        for key_parts in child._parts.values():
+            for child_part in key_parts:
+                if isinstance(child_part, EmbeddedRef):
+                    expanded.append(EmbeddedRef(
+                        prefix + child_part.path, child_part.type_ids,
+                        child_part.id))
+                else:
+                    expanded.append(
+                        (prefix + child_part[0], child_part[1]))
+        return expanded
+
+
+def _part_path(part):
+    if isinstance(part, EmbeddedRef):
+        return part.path
+    return part[0]
+
+
+def _type_ids(type_val):
+    if isinstance(type_val, str):
+        return (type_val,)
+    elif isinstance(type_val, list):
+        return tuple(type_val)
+    else:
+        return None
+
+
+_JSON_SCALAR_TYPES = frozenset([str, int, float, bool, type(None)])
+
+def _ingest(jsobj, path=(), env=None):
+    """
+    Copy a json value on its way into an ASObj, noting typed objects
+
+    Returns (copied value, list of JsobjIndex parts), with paths
+    starting from path.  If path isn't empty and jsobj is itself a
+    typed dict, it's included in the parts too.
+
+    Embedded ASObjs aren't copied at all: ASObjs are immutable, so we
+    share their (internal) json with them, minus the @context.  If env
+    has an intern table, embedded objects with an @id are swapped for
+    (and shared with) their interned ASObj as well.
+    """
+    embedded = []
+    intern_table = env.intern_table if env is not None else None
+
+    def copy_asobj(asobj, path):
+        embedded.append((path, asobj._index))
+        return asobj._shareable_json()
+
+    def copy_dict(this_dict, path):
+        # (only typed objects can be ASObjs, so only they're interned)
+        if intern_table is not None and path and (
+                "@id" in this_dict or "id" in this_dict) and (
+                    "@type" in this_dict or "type" in this_dict):
+            interned = intern_table.lookup(this_dict, env)
+            if interned is not None:
+                return copy_asobj(interned, path)
+
+        # so that parents are listed before their children
+        start = len(embedded)
+
+        # handle id/type aliases while copying
+        new_dict = {}
+        for key, val in this_dict.items():
+            if key == "id":
+                key = "@id"
+            elif key == "type":
+                key = "@type"
+            # (checking exact types first is quite a bit faster than
+            # isinstance, and this is the hottest loop around)
+            val_type = type(val)
+            if val_type is dict:
+                new_dict[key] = copy_dict(val, path + (key,))
+            elif val_type is list:
+                new_dict[key] = copy_list(val, path + (key,))
+            elif val_type in _JSON_SCALAR_TYPES:
+                # All other JSON type objects are immutable
+                new_dict[key] = val
+            else:
+                new_dict[key] = copy_main(val, path + (key,))
+
+        if path and "@type" in new_dict:
+            embedded.insert(start, EmbeddedRef(
+                path, _type_ids(new_dict["@type"]), new_dict.get("@id")))
+        return new_dict
+
+    def copy_list(this_list, path):
+        return [
+            item if type(item) in _JSON_SCALAR_TYPES
+            else copy_main(item, path + (i,))
+            for i, item in enumerate(this_list)]
+
+    def copy_main(val, path):
+        if isinstance(val, dict):
+            return copy_dict(val, path)
+        elif isinstance(val, ASObj):
+            return copy_asobj(val, path)
+        elif isinstance(val, list):
+            return copy_list(val, path)
+        else:
+            # @@: We could provide validation that it's
+            #   a valid json object here but that seems like
+            #   it would bring unnecessary performance penalties.
+            return val
+
+    return copy_main(jsobj, path), embedded
+
+
+def ingest_jsobj(jsobj, env):
+    """
+    Copy a json object (or ASObj) on its way into an ASObj
+
+    This does everything deepcopy_jsobj_in does (copying, rewriting
+    id/type aliases, dropping the @context of embedded ASObjs, adding
+    the environment's extra_context) but also records, in the same
+    traversal, where the typed objects are.  Returns a tuple of
+    (copied json, JsobjIndex) so later type and reference queries
+    don't have to walk the tree again.
+
+    ASObjs found in jsobj (or jsobj itself, if it's an ASObj) have
+    their json shared rather than copied.
+    """
+    # Should be a dictionary or ASObj on the way in for this
+    assert isinstance(jsobj, dict) or isinstance(jsobj, ASObj)
+
+    final_json, embedded = _ingest(jsobj, env=env)
+    if env.extra_context is not None:
+        final_json["@context"] = env.extra_context
+
+    return final_json, _make_index(final_json, embedded)
+
+
+def _make_index(jsobj, parts):
+    # Group parts by top level key.  (A part with an empty path means
+    # jsobj is a shallow copy of some ASObj, so start with its parts.)
+    grouped = {}
+    for part in parts:
+        path = _part_path(part)
+        if not path:
+            grouped.update(part[1]._parts)
+        else:
+            grouped.setdefault(path[0], []).append(part)
+    return JsobjIndex(
+        _type_ids(jsobj.get("@type")), jsobj.get("@id"),
+        {key: tuple(key_parts) for key, key_parts in grouped.items()})
+
+
+def _wrap_jsobj(jsobj, env):
+    """
+    Get an ASObj for a typed json object we're handing out, going
+    through env's intern table if it has one
+    """
+    if env.intern_table is not None and "@id" in jsobj:
+        interned = env.intern_table.lookup(jsobj, env)
+        if interned is not None:
+            return interned
+    return ASObj(jsobj, env)
+
+
+_KEY_ALIASES = {"id": "@id", "type": "@type"}
+
+
+class InternTable(object):
+    """
+    Dedupe identical embedded objects into one shared ASObj
+
+    In real feeds the same actors (and so on) turn up embedded in
+    thousands of activities.  Give an Environment an InternTable and
+    objects with an @id seen while constructing ASObjs, or handed out
+    by ASObj.__getitem__, are looked up by their @id plus a hash of
+    their content; identical ones resolve to the same (immutable)
+    ASObj instance and share its json.
+
+    Interned objects are held weakly, so they go away once nothing
+    else uses them, except that the max_size most recently used are
+    kept alive regardless.  hits and misses are counted for
+    statistics (approximately, like SingleFlightCache).
+    """
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._recent = OrderedDict()
+        self._alive = weakref.WeakValueDictionary()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _unalias(jsobj):
+        # id/type aliases become @id/@type, as they do when ingested,
+        # so both spellings of an object hash the same
+        if type(jsobj) is dict:
+            new_dict = {}
+            for key, val in jsobj.items():
+                key = _KEY_ALIASES.get(key, key)
+                new_dict[key] = InternTable._unalias(val)
+            return new_dict
+        elif type(jsobj) is list:
+            return [InternTable._unalias(item) for item in jsobj]
+        return jsobj
+
+    @staticmethod
+    def content_key(jsobj):
+        """
+        The (@id, content hash) key for jsobj, or None if it can't be
+        interned (eg, it has ASObjs or other non-json things in it)
+        """
+        canonical_json = InternTable._unalias(jsobj)
+        try:
+            canonical = json.dumps(
+                canonical_json, sort_keys=True, separators=(",", ":"))
+        except (TypeError, ValueError):
+            return None
+        return (canonical_json.get("@id"),
+                hashlib.blake2b(canonical.encode("utf-8"),
+                                digest_size=16).digest())
+
+    def lookup(self, jsobj, env):
+        """
+        Get the interned ASObj for jsobj, interning it if need be
+
+        Returns None if jsobj can't be interned.
+        """
+        key = self.content_key(jsobj)
+        if key is None:
+            return None
+
+        asobj = self._alive.get(key)
+        if asobj is not None:
+            self.hits += 1
+            if _instrument is not None:
+                _instrument.count("intern.hit")
+            self._remember(key, asobj)
+            return asobj
+
+        self.misses += 1
+        if _instrument is not None:
+            _instrument.count("intern.miss")
+        # Build it outside the lock; if someone beat us to it, use theirs
+        new_asobj = ASObj(jsobj, env)
+        with self._lock:
+            asobj = self._alive.setdefault(key, new_asobj)
+        self._remember(key, asobj)
+        return asobj
+
+    def _remember(self, key, asobj):
+        with self._lock:
+            self._recent[key] = asobj
+            self._recent.move_to_end(key)
+            while len(self._recent) > self.max_size:
+                self._recent.popitem(last=False)
+
+    def __len__(self):
+        return len(self._alive)
+
+    def clear(self):
+        with self._lock:
+            self._recent.clear()
+            self._alive.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": float(self.hits) / lookups if lookups else 0.0,
+            "size": len(self._alive),
+            "recent": len(self._recent)}
+
+
+# Expansion caching
+# =================
+#
+# json-ld expansion is by far the most expensive thing we do to a
+# document, and the same documents tend to come by over and over
+# (re-deliveries, retries, several workers seeing the same activity).
+# Give an Environment an expansion_cache and expanded results are
+# remembered, keyed by a hash of the document plus the contexts it
+# was expanded against.  Caches just need get(key) and put(key,
+# value); the ones here can be stacked up with TieredExpansionCache.
+#
+# Cached values are shared, so never mutate them.  (ASObj.expanded()
+# hands out copies.)
+
+def expansion_key(jsobj, implied_context):
+    """
+    Stable key for the expansion of jsobj against implied_context
+
+    Since extra_context is written into a document's @context as it
+    comes into an ASObj, it's covered by hashing the document.
+    Returns None if jsobj can't be hashed this way.
+    """
+    try:
+        canonical = json.dumps(
+            [implied_context, jsobj], sort_keys=True, separators=(",", ":"))
+    except (TypeError, ValueError):
+        return None
+    return hashlib.blake2b(
+        canonical.encode("utf-8"), digest_size=20).digest()
+
+
+class ExpansionCache(object):
+    """
+    Base class for expansion caches
+
+    .hits and .misses count lookups for statistics (approximately,
+    as with SingleFlightCache).
+    """
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Get the cached expansion for key, or None
+        """
+        value = self._get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        raise NotImplementedError()
+
+    def _get(self, key):
+        raise NotImplementedError()
+
+    def clear(self):
+        raise NotImplementedError()
+
+
+class MemoryExpansionCache(ExpansionCache):
+    """
+    An in-memory LRU expansion cache holding up to max_size entries
+    """
+    def __init__(self, max_size=1000):
+        ExpansionCache.__init__(self)
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def _get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SqliteExpansionCache(ExpansionCache):
+    """
+    An on-disk expansion cache in a sqlite database
+
+    Holds up to max_size entries, evicting the least recently used
+    ones.  Several processes can point at the same file.
+    """
+    def __init__(self, filename, max_size=100000):
+        import sqlite3
+
+        ExpansionCache.__init__(self)
+        self.filename = filename
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            filename, check_same_thread=False, isolation_level=None)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS expansions ("
+            " key BLOB PRIMARY KEY, value TEXT NOT NULL,"
+            " used INTEGER NOT NULL)")
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS expansions_used"
+            " ON expansions (used)")
+        self._clock = self._db.execute(
+            "SELECT COALESCE(MAX(used), 0) FROM expansions").fetchone()[0]
+        self._size = len(self)
+
+    def _tick(self):
+        self._clock += 1
+        return self._clock
+
+    def _get(self, key):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM expansions WHERE key = ?",
+                (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute(
+                "UPDATE expansions SET used = ? WHERE key = ?",
+                (self._tick(), key))
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        encoded = json.dumps(value, separators=(",", ":"))
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO expansions (key, value, used)"
+                " VALUES (?, ?, ?)", (key, encoded, self._tick()))
+            self._size += cursor.rowcount
+            if self._size > self.max_size:
+                self._db.execute(
+                    "DELETE FROM expansions WHERE key IN ("
+                    " SELECT key FROM expansions ORDER BY used LIMIT ?)",
+                    (self._size - self.max_size,))
+                self._size = len(self)
+
+    def __len__(self):
+        return self._db.execute(
+            "SELECT COUNT(*) FROM expansions").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM expansions")
+            self._size = 0
+
+    def close(self):
+        self._db.close()
+
+
+class TieredExpansionCache(ExpansionCache):
+    """
+    Several expansion caches, fastest first
+
+      TieredExpansionCache(
+          MemoryExpansionCache(1000),
+          SqliteExpansionCache("/var/cache/activipy/expansions.db"))
+
+    Lookups try each tier in turn, and a hit in a slower tier is
+    copied into the faster ones.  New entries go into every tier.
+    """
+    def __init__(self, *tiers):
+        ExpansionCache.__init__(self)
+        self.tiers = tiers
+
+    def _get(self, key):
+        for i, tier in enumerate(self.tiers):
+            value = tier.get(key)
+            if value is not None:
+                for faster_tier in self.tiers[:i]:
+                    faster_tier.put(key, value)
+                return value
+        return None
+
+    def put(self, key, value):
+        for tier in self.tiers:
+            tier.put(key, value)
+
+    def clear(self):
+        for tier in self.tiers:
+            tier.clear()
+
+
 def deepcopy_jsobj_base(jsobj, env, going_in=True):
     """
     Perform a deep copy of a JSON style object
@@ -326,7 +1473,7 @@ def deepcopy_jsobj_base(jsobj, env, going_in=True):
     def copy_dict(this_dict):
         # Looks like an ASObj
         if going_out and "@type" in this_dict:
-            return ASObj(this_dict, env)
+            return _wrap_jsobj(this_dict, env)
 
         # Otherwise, recursively copy the dict
         # but handle id/type aliases
@@ -374,9 +1521,15 @@ def deepcopy_jsobj_base(jsobj, env, going_in=True):
 
 
 def deepcopy_jsobj_in(jsobj, env):
-    return deepcopy_jsobj_base(jsobj, env, going_in=True)
+    if _instrument is not None:
+        return _timed_call("deepcopy_jsobj.in", ingest_jsobj,
+                           jsobj, env)[0]
+    return ingest_jsobj(jsobj, env)[0]
 
 def deepcopy_jsobj_out(jsobj, env):
+    if _instrument is not None:
+        return _timed_call("deepcopy_jsobj.out", deepcopy_jsobj_base,
+                           jsobj, env, going_in=False)
     return deepcopy_jsobj_base(jsobj, env, going_in=False)
 
 
@@ -419,6 +1572,8 @@ def handle_map(astype_methods, asobj):
 
 
 class HaltIteration(object):
+    # (fold handlers check for this with type(val) is HaltIteration,
+    # since it's done on every step; so don't subclass it)
     def __init__(self, val):
         self.val = val
 
@@ -431,13 +1586,174 @@ def handle_fold(astype_methods, asobj):
             val = method(asobj, val, *args, **kwargs)
             # Provide a way to break out of the loop early...?
             # @@: Is this a good idea, or even useful for anything?
-            if isinstance(val, HaltIteration):
+            if type(val) is HaltIteration:
                 val = val.val
                 break
         return val
     return func
 
 
+# Compiled method chains
+# ======================
+#
+# The handlers above get rebuilt around the list of (method, astype)
+# pairs on every call.  Environment.asobj_run_method instead compiles
+# the chain for each (MethodId, type signature) once, through the
+# handler's .compile attribute: that takes a tuple of methods (most
+# specific type first) and returns a runner, called as
+# runner(asobj, *args, **kwargs).  Handlers without a .compile still
+# work, the slow way.
+
+def _compile_one(methods):
+    if not methods:
+        def run(asobj, *args, **kwargs):
+            throw_no_method_error(asobj)
+        return run
+    # Nothing to wrap!
+    return methods[0]
+
+
+def _compile_map(methods):
+    def run(asobj, *args, **kwargs):
+        return [method(asobj, *args, **kwargs) for method in methods]
+    return run
+
+
+def _compile_fold(methods):
+    def run(asobj, initial=None, *args, **kwargs):
+        val = initial
+        for method in methods:
+            val = method(asobj, val, *args, **kwargs)
+            if type(val) is HaltIteration:
+                return val.val
+        return val
+    return run
+
+
+handle_one.compile = _compile_one
+handle_map.compile = _compile_map
+handle_fold.compile = _compile_fold
+
+
+# Asynchronous handlers
+# =====================
+#
+# Like handle_one, handle_map and handle_fold, but calling the method
+# gives a coroutine, for methods doing I/O:
+#
+#   save = MethodId("save", "Save things", handle_one_async)
+#   ...
+#   await asobj.m.save(db)
+#
+# The methods themselves may be coroutine functions or plain
+# functions (or a mix of the two); whatever they return is awaited if
+# it's awaitable.  They live in the same Environment.methods registry
+# as everything else.
+
+def _is_awaitable(val):
+    return hasattr(val, "__await__")
+
+
+def _compile_one_async(methods):
+    if not methods:
+        async def run(asobj, *args, **kwargs):
+            throw_no_method_error(asobj)
+        return run
+
+    method = methods[0]
+    async def run(asobj, *args, **kwargs):
+        val = method(asobj, *args, **kwargs)
+        if _is_awaitable(val):
+            val = await val
+        return val
+    return run
+
+
+def _compile_map_async(methods):
+    async def run(asobj, *args, **kwargs):
+        import asyncio
+
+        results = [method(asobj, *args, **kwargs) for method in methods]
+        # Run everything awaitable concurrently
+        pending = [(i, val) for i, val in enumerate(results)
+                   if _is_awaitable(val)]
+        if pending:
+            done = await asyncio.gather(*[val for i, val in pending])
+            for (i, val), result in zip(pending, done):
+                results[i] = result
+        return results
+    return run
+
+
+def _compile_fold_async(methods):
+    async def run(asobj, initial=None, *args, **kwargs):
+        val = initial
+        for method in methods:
+            val = method(asobj, val, *args, **kwargs)
+            if _is_awaitable(val):
+                val = await val
+            if type(val) is HaltIteration:
+                return val.val
+        return val
+    return run
+
+
+def _async_handler(compile_chain, needs_method=False):
+    def handler(astype_methods, asobj):
+        if needs_method and not astype_methods:
+            throw_no_method_error(asobj)
+        runner = compile_chain(
+            tuple(method for method, astype in astype_methods))
+        def func(*args, **kwargs):
+            return runner(asobj, *args, **kwargs)
+        return func
+    handler.compile = compile_chain
+    handler.is_async = True
+    return handler
+
+
+handle_one_async = _async_handler(_compile_one_async, needs_method=True)
+handle_map_async = _async_handler(_compile_map_async)
+handle_fold_async = _async_handler(_compile_fold_async)
+
+
+def pure_method(method):
+    """
+    Decorator marking a method as pure: its result depends only on the
+    (immutable) ASObj and the arguments it's given.
+
+    When every method in a chain is pure, results are memoized on the
+    ASObj, per method and (hashable) arguments.  Memoized results are
+    handed out again as-is, so don't mutate them.  (This only applies
+    to synchronous handlers.)
+    """
+    method.pure = True
+    return method
+
+
+def _memoized_runner(method_id, runner):
+    def run(asobj, *args, **kwargs):
+        memo = asobj._method_memo
+        if memo is None:
+            memo = asobj._method_memo = {}
+        try:
+            if kwargs:
+                key = (method_id, args, frozenset(kwargs.items()))
+            else:
+                key = (method_id, args)
+            return memo[key]
+        except KeyError:
+            pass
+        except TypeError:
+            # unhashable arguments; no memoizing this one
+            return runner(asobj, *args, **kwargs)
+
+        val = runner(asobj, *args, **kwargs)
+        memo[key] = val
+        return val
+    return run
+
+
 # TODO
 # @@: Can this be just an @property on Environment?
 class AttrMapper(object):
@@ -469,6 +1785,21 @@ class Environment(object):
     """
     An environment to collect vocabularies and provide
     methods for activitystream types
+
+    Thread safety: once constructed, an Environment may be shared
+    freely between threads (for example, a module level environment
+    like vocab.BasicEnv used by every worker of a WSGI server).
+    Vocabularies, short ids and methods are never mutated after
+    __init__.  The memo caches used for type resolution are filled
+    either by atomic dict operations or through SingleFlightCache, so
+    reads are lock-free and expensive entries are computed at most
+    once even under contention.  Don't mutate .methods, .shortids or
+    .vocabs after construction; build a new Environment instead.
+
+    If you construct lots of Environments over the same vocabularies,
+    pass in an EnvironmentSnapshot (see Environment.snapshot()) rather
+    than vocabs/shortids/c_accessors and the derived tables will be
+    reused rather than rebuilt.
     """
     def __init__(self, vocabs=None, methods=None,
                  # not ideal, I'd rather somehow load something
@@ -477,21 +1808,66 @@ class Environment(object):
                  shortids=None, c_accessors=None,
                  extra_context=None,
                  document_loader=default_loader,
-                 implied_context=AS2_CONTEXT_URI):
+                 implied_context=AS2_CONTEXT_URI,
+                 snapshot=None, intern_table=None, expansion_cache=None):
+        if snapshot is None:
+            snapshot = EnvironmentSnapshot.build(
+                vocabs or [], shortids or {}, c_accessors or {})
+        elif vocabs or shortids or c_accessors:
+            raise ValueError(
+                "Pass either a snapshot or vocabs/shortids/c_accessors, "
+                "not both")
+
         self.implied_context = implied_context
-        self.vocabs = vocabs or []
+        self.vocabs = snapshot.vocabs
         self.methods = methods or {}
         # @@: Should we make all short ids mandatorily contain
         #   the base schema?
-        self.shortids = shortids or {}
-        self.shortids_reversemap = {
-            val: key for key, val in self.shortids.items()}
+        self.shortids = snapshot.shortids
+        self.shortids_reversemap = snapshot.shortids_reversemap
         self.extra_context = extra_context
         self.document_loader = document_loader
-        self.c = self.__build_c_accessors(c_accessors or {})
-        self.m = self._build_m_map()
+        self.uri_map = snapshot.uri_map
+        self._c_accessors = snapshot.c_accessors
+        # See InternTable; None to not intern anything
+        self.intern_table = intern_table
+        # See ExpansionCache; None to expand every time
+        self.expansion_cache = expansion_cache
+
+        # Built on first access, see the c and m properties
+        self._c = None
+        self._m = None
+
+        # Memo caches, keyed by tuples of type ids / ASTypes
+        self._astypes_cache = {}
+        # [hits, misses]; approximate, see SingleFlightCache
+        self._astypes_stats = [0, 0]
+        self._inheritance_cache = SingleFlightCache()
+        self._validator_cache = SingleFlightCache()
+        # (MethodId, inheritance) -> runner; see "Compiled method chains"
+        self._method_chain_cache = SingleFlightCache()
 
-        self.uri_map = self.__build_uri_map()
+    @property
+    def c(self):
+        # Racing threads would both build an equivalent AttrMapper,
+        # so there's no need to lock here.
+        if self._c is None:
+            self._c = self.__build_c_accessors(self._c_accessors)
+        return self._c
+
+    @property
+    def m(self):
+        if self._m is None:
+            self._m = self._build_m_map()
+        return self._m
+
+    def snapshot(self):
+        """
+        Get an EnvironmentSnapshot of this environment's derived tables
+        """
+        return EnvironmentSnapshot(
+            self.vocabs, self.uri_map, self.shortids,
+            self.shortids_reversemap, self._c_accessors)
 
     def __build_c_accessors(self, c_accessors):
         return AttrMapper(
@@ -501,8 +1877,8 @@ class Environment(object):
     def _build_m_map(self, asobj=None):
         def make_method_dispatcher(method_id):
             def method_dispatcher(asobj, *args, **kwargs):
-                method = self.asobj_get_method(asobj, method_id)
-                return method(*args, **kwargs)
+                return self.asobj_run_method(
+                    asobj, method_id, *args, **kwargs)
             if asobj is None:
                 return method_dispatcher
             else:
@@ -520,13 +1896,6 @@ class Environment(object):
 
         return AttrMapper(m_mapping)
 
-    def __build_uri_map(self):
-        uri_map = {}
-        for vocab in self.vocabs:
-            uri_map.update(vocab.vocab_map)
-
-        return uri_map
-
     def _process_type_simple(self, type_id):
         # Try by short ID (in short IDs marked as acceptable for this)
         if type_id in self.shortids:
@@ -541,25 +1910,59 @@ class Environment(object):
             # about what's happening here in the code flow
             return None
 
-    def asobj_astypes(self, asobj):
+    def _astypes_simple(self, type_ids):
+        """
+        Resolve a tuple of type ids without json-ld expansion.
+
+        Returns None if any of them can't be resolved that way.
+        """
         final_types = []
-        process_as_jsonld = False
-        for type_id in asobj.types:
+        for type_id in type_ids:
             processed_type = self._process_type_simple(type_id)
-            if processed_type is not None:
-                final_types.append(processed_type)
-            else:
-                # We have to bail out
-                process_as_jsonld = True
-                break
+            if processed_type is None:
+                return None
+            final_types.append(processed_type)
+        return tuple(final_types)
+
+    def _astypes_for_ids(self, type_ids):
+        """
+        Memoized _astypes_simple
+        """
+        # Resolving is cheap, so no need for single-flight here; and
+        # we only remember successes so unknown (possibly hostile)
+        # type ids can't grow the cache.  Plain dict reads and
+        # writes are atomic.
+        simple_types = self._astypes_cache.get(type_ids)
+        if simple_types is None:
+            self._astypes_stats[1] += 1
+            simple_types = self._astypes_simple(type_ids)
+            if simple_types is not None:
+                self._astypes_cache[type_ids] = simple_types
+        else:
+            self._astypes_stats[0] += 1
+        return simple_types
+
+    def asobj_astypes(self, asobj):
+        simple_types = self._astypes_for_ids(asobj._index.type_ids)
+
+        if simple_types is not None:
+            if _instrument is not None:
+                _instrument.count("astypes.fast_path")
+            return list(simple_types)
 
         # Are there any remaining types to process here?
-        if process_as_jsonld:
+        # (This depends on the object's own @context, so we can't
+        # memoize it by type ids alone.)
+        else:
+            if _instrument is not None:
+                _instrument.count("astypes.expansion_fallback")
             # @@: We could do a version of this which didn't
             #   throw away the information we already had,
             #   maybe.  But it would be tricky.
+            # (Goes through the expansion cache, if there is one; we
+            #   only read from it so there's no need to copy.)
             final_types = []
-            asobj_jsonld = asobj.expanded()
+            asobj_jsonld = asobj._ASObj__expanded()
             for type_uri in asobj_jsonld[0]["@type"]:
                 processed_type = self._process_type_simple(type_uri)
                 if processed_type is not None:
@@ -567,9 +1970,90 @@ class Environment(object):
 
         return final_types
 
+    def _inheritance_for(self, astypes):
+        return tuple(astype_inheritance_list(*astypes))
+
+    def _asobj_inheritance(self, asobj):
+        # Shared tuple, don't hand out
+        type_ids = asobj._index.type_ids
+        astypes = self._astypes_for_ids(type_ids)
+        if astypes is None:
+            astypes = tuple(self.asobj_astypes(asobj))
+        elif _instrument is not None:
+            _instrument.count("astypes.fast_path")
+        return self._inheritance_cache.get(astypes, self._inheritance_for)
+
     def asobj_astype_inheritance(self, asobj):
-        return astype_inheritance_list(
-            *self.asobj_astypes(asobj))
+        return list(self._asobj_inheritance(asobj))
+
+    def cache_stats(self):
+        """
+        Get {cache name: (hits, misses)} for this Environment's memo caches
+        """
+        stats = {
+            "types": tuple(self._astypes_stats),
+            "inheritance": (self._inheritance_cache.hits,
+                            self._inheritance_cache.misses),
+            "validators": (self._validator_cache.hits,
+                           self._validator_cache.misses),
+            "method_chains": (self._method_chain_cache.hits,
+                              self._method_chain_cache.misses)}
+        if self.intern_table is not None:
+            stats["intern"] = (self.intern_table.hits,
+                               self.intern_table.misses)
+        if self.expansion_cache is not None:
+            stats["expansion"] = (self.expansion_cache.hits,
+                                  self.expansion_cache.misses)
+        return stats
+
+    def _validator_for(self, inheritance):
+        """
+        Get the compiled validator for a (tuple) inheritance chain
+        """
+        return self._validator_cache.get(inheritance, compile_validator)
+
+    def validate_many(self, objs):
+        """
+        Validate a batch of ASObjs and/or plain json objects
+
+        Returns a list with one entry per object given: a list of
+        ValidationErrors, empty if that object is valid.  Plain json
+        objects are checked without building an ASObj when their
+        types can be resolved without json-ld expansion.
+        """
+        results = []
+        for obj in objs:
+            if isinstance(obj, ASObj):
+                results.append(obj.validation_errors())
+            elif isinstance(obj, dict):
+                results.append(self._jsobj_validation_errors(obj))
+            else:
+                results.append([ValidationError(
+                    None, "not an object: %r" % (obj,))])
+        return results
+
+    def _jsobj_validation_errors(self, jsobj):
+        type_val = jsobj.get("@type", jsobj.get("type"))
+        if isinstance(type_val, str):
+            type_ids = (type_val,)
+        elif isinstance(type_val, list) and type_val:
+            type_ids = tuple(type_val)
+        else:
+            return [ValidationError("@type", "missing or invalid @type")]
+
+        try:
+            astypes = self._astypes_for_ids(type_ids)
+        except TypeError:
+            # unhashable junk in the @type list
+            return [ValidationError("@type", "missing or invalid @type")]
+
+        if astypes is None:
+            # Needs the full treatment (json-ld expansion)
+            return ASObj(jsobj, self).validation_errors()
+
+        inheritance = self._inheritance_cache.get(
+            astypes, self._inheritance_for)
+        return self._validator_for(inheritance)(jsobj)
 
     def is_astype(self, asobj, astype, inherit=True):
         """
@@ -583,6 +2067,76 @@ class Environment(object):
         else:
             return astype in self.asobj_astypes(asobj)
 
+    def _batch_astypes(self, objs):
+        """
+        Get the (tuple) ASTypes of each of objs, or None for things
+        which aren't ASObjs, resolving each distinct set of type ids
+        only once
+        """
+        by_ids = {}
+        results = []
+        for obj in objs:
+            if not isinstance(obj, ASObj):
+                results.append(None)
+                continue
+            type_ids = obj._index.type_ids
+            astypes = by_ids.get(type_ids)
+            if astypes is None:
+                astypes = self._astypes_for_ids(type_ids)
+                if astypes is None:
+                    # Depends on the object's own @context, so this
+                    # one can't be shared with the rest of the batch
+                    results.append(tuple(self.asobj_astypes(obj)))
+                    continue
+                by_ids[type_ids] = astypes
+            results.append(astypes)
+        return results
+
+    def classify(self, objs, astypes, inherit=True, masks=False):
+        """
+        Check a batch of objects against several ASTypes at once
+
+        Returns {astype: list of indexes into objs of the objects
+        which are of that type}, or, if masks is true, {astype: list
+        of booleans, one per object}.  The answers are the same as
+        is_astype would give for each object and type, but each
+        distinct type signature in the batch is only worked out once.
+        """
+        astypes = list(astypes)
+        # type signature: tuple of booleans, one per astype
+        answers = {}
+        signatures = self._batch_astypes(objs)
+
+        results = {astype: [] for astype in astypes}
+        for i, signature in enumerate(signatures):
+            answer = answers.get(signature)
+            if answer is None:
+                if signature is None:
+                    answer = (False,) * len(astypes)
+                else:
+                    if inherit:
+                        signature_types = self._inheritance_cache.get(
+                            signature, self._inheritance_for)
+                    else:
+                        signature_types = signature
+                    answer = tuple(astype in signature_types
+                                   for astype in astypes)
+                answers[signature] = answer
+
+            for astype, is_type in zip(astypes, answer):
+                if masks:
+                    results[astype].append(is_type)
+                elif is_type:
+                    results[astype].append(i)
+        return results
+
+    def filter_by_type(self, objs, astype, inherit=True, masks=False):
+        """
+        Like classify, but for a single ASType; returns just the list
+        of indexes (or booleans, if masks is true)
+        """
+        return self.classify(objs, [astype], inherit, masks)[astype]
+
     # @@: Should we drop the asobj_ from these method names?
     def asobj_get_method(self, asobj, method):
         if asobj.env is not self:
@@ -600,11 +2154,128 @@ class Environment(object):
              if (method, astype) in self.methods],
             asobj)
 
+    def _compile_method_chain(self, key):
+        method, inheritance = key
+        pairs = [(self.methods[(method, astype)], astype)
+                 for astype in inheritance
+                 if (method, astype) in self.methods]
+        methods = tuple(method_proc for method_proc, astype in pairs)
+
+        compile_chain = getattr(method.handler, "compile", None)
+        if compile_chain is None:
+            def runner(asobj, *args, **kwargs):
+                return method.handler(pairs, asobj)(*args, **kwargs)
+        else:
+            runner = compile_chain(methods)
+
+        if (methods and not getattr(method.handler, "is_async", False)
+                and all(getattr(method_proc, "pure", False)
+                        for method_proc in methods)):
+            runner = _memoized_runner(method, runner)
+        return runner
+
     def asobj_run_method(self, asobj, method, *args, **kwargs):
         # make note of why arguments make this slightly lossy
         # when passing on; eg, can't use asobj/method in the
         # arguments to this function
-        return self.asobj_get_method(asobj, method)(*args, **kwargs)
+        if asobj.env is not self:
+            raise EnvironmentMismatch(
+                "ASObj attempted to call method with an Environment "
+                "it was not bound to!")
+
+        runner = self._method_chain_cache.get(
+            (method, self._asobj_inheritance(asobj)),
+            self._compile_method_chain)
+        if _instrument is not None:
+            if getattr(method.handler, "is_async", False):
+                return _timed_coroutine(
+                    "method." + method.name, runner(asobj, *args, **kwargs))
+            return _timed_call(
+                "method." + method.name, runner, asobj, *args, **kwargs)
+        return runner(asobj, *args, **kwargs)
+
+
+class EnvironmentSnapshot(object):
+    """
+    The frozen, derived lookup tables of an Environment
+
+    Building an Environment means walking its vocabularies to build
+    up the uri map, short id maps and constructor accessors.  A
+    snapshot holds onto the results so that further Environments
+    (say, one per tenant, each with its own methods) can be built
+    from it without redoing that work:
+
+      snapshot = some_env.snapshot()
+      tenant_env = Environment(methods=tenant_methods, snapshot=snapshot)
+
+    Snapshots can also be written to disk with save() and read back
+    in with load(); since ASTypes are python objects, the file just
+    refers to them by URI, and load() needs the vocabularies to
+    resolve them against.
+    """
+    def __init__(self, vocabs, uri_map, shortids, shortids_reversemap,
+                 c_accessors):
+        self.vocabs = vocabs
+        self.uri_map = uri_map
+        self.shortids = shortids
+        self.shortids_reversemap = shortids_reversemap
+        self.c_accessors = c_accessors
+
+    @classmethod
+    def build(cls, vocabs, shortids, c_accessors):
+        uri_map = {}
+        for vocab in vocabs:
+            uri_map.update(vocab.vocab_map)
+
+        return cls(
+            vocabs, uri_map, shortids,
+            {val: key for key, val in shortids.items()},
+            c_accessors)
+
+    def to_json(self):
+        """
+        Serialize to a json-compatible structure referring to types by URI
+        """
+        return {
+            "shortids": {
+                key: astype.id_uri
+                for key, astype in self.shortids.items()},
+            "c_accessors": {
+                key: astype.id_uri
+                for key, astype in self.c_accessors.items()}}
+
+    @classmethod
+    def from_json(cls, jsobj, vocabs):
+        """
+        Rebuild a snapshot from to_json()'s output, resolving type
+        URIs against vocabs
+        """
+        uri_map = {}
+        for vocab in vocabs:
+            uri_map.update(vocab.vocab_map)
+
+        def resolve(mapping):
+            try:
+                return {key: uri_map[uri] for key, uri in mapping.items()}
+            except KeyError as error:
+                raise ValueError(
+                    "Snapshot refers to a type not in its vocabularies: %s"
+                    % error.args[0])
+
+        shortids = resolve(jsobj["shortids"])
+        return cls(
+            vocabs, uri_map, shortids,
+            {val: key for key, val in shortids.items()},
+            resolve(jsobj["c_accessors"]))
+
+    def save(self, filename):
+        with open(filename, 'w') as snapshot_file:
+            json.dump(self.to_json(), snapshot_file)
+
+    @classmethod
+    def load(cls, filename, vocabs):
+        with open(filename, 'r') as snapshot_file:
+            return cls.from_json(json.load(snapshot_file), vocabs)
 
 
 def shortids_from_vocab(vocab, prefix=None):
@@ -612,6 +2283,9 @@ def shortids_from_vocab(vocab, prefix=None):
     Get a mapping of all short ids to their ASType objects in a vocab
 
     Useful for mapping shortids to ASType objects!
+
+    (The mapping is computed once per vocab and prefix; you get a
+    fresh copy of it each time.)
     """
     def maybe_add_prefix(id_short):
         if prefix:
@@ -619,9 +2293,14 @@ def shortids_from_vocab(vocab, prefix=None):
         else:
             return id_short
 
-    return {
-        maybe_add_prefix(v.id_short): v
-        for v in vocab.vocab_map.values()}
+    shortids = vocab._shortids_cache.get(prefix)
+    if shortids is None:
+        shortids = {
+            maybe_add_prefix(v.id_short): v
+            for v in vocab.vocab_map.values()}
+        vocab._shortids_cache[prefix] = shortids
+
+    return dict(shortids)
 
 
 def chain_dicts(*dicts):
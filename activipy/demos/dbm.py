@@ -17,6 +17,11 @@
 ##   See the License for the specific language governing permissions and
 ##   limitations under the License.
 
+import array
+import base64
+import bisect
+import datetime
+import itertools
 import json
 
 import dbm
@@ -27,9 +32,13 @@ from activipy import core, vocab
 class JsonDBM(object):
     """
     json wrapper around a gdbm database
+
+    indexes is a list of DbmIndexes to keep up to date as objects are
+    saved and deleted through the dbm_* methods below.
     """
-    def __init__(self, db):
+    def __init__(self, db, indexes=()):
         self.db = db
+        self.indexes = list(indexes)
 
     def __getitem__(self, key):
         return json.loads(self.db[key.encode('utf-8')].decode('utf-8'))
@@ -44,10 +53,12 @@ class JsonDBM(object):
         return key in self.db
 
     @classmethod
-    def open(cls, filename):
-        return cls(dbm.open(filename, 'c'))
+    def open(cls, filename, indexes=()):
+        return cls(dbm.open(filename, 'c'), indexes)
 
     def close(self):
+        for index in self.indexes:
+            index.flush(self)
         self.db.close()
 
     def get(self, key, default=None):
@@ -59,6 +70,508 @@ class JsonDBM(object):
     def fetch_asobj(self, env):
         return core.ASObj(self[id], env)
 
+# Indexes
+# =======
+#
+# Indexes live in the same database as the objects, under keys
+# starting with INDEX_PREFIX (object ids are IRIs, so they won't
+# clash).  Each DbmIndex attached to a JsonDBM hears about every
+# object stored or removed through dbm_save, dbm_delete and friends.
+
+INDEX_PREFIX = "@index/"
+
+
+class DbmIndex(object):
+    """
+    Base class for indexes kept up to date by the dbm_* methods
+    """
+    def saved(self, db, id, new_json, old_json):
+        """
+        Called after new_json is stored under id; old_json is what was
+        there before, or None
+        """
+        pass
+
+    def deleted(self, db, id, old_json):
+        """
+        Called after the object stored under id (old_json) is deleted
+        """
+        pass
+
+    def flush(self, db):
+        """
+        Write out anything held back; called when db is closed
+        """
+        pass
+
+
+def _db_indexes(db):
+    return getattr(db, "indexes", ())
+
+
+def _dbm_store(db, id, new_json):
+    indexes = _db_indexes(db)
+    old_json = db.get(id) if indexes else None
+    db[id] = new_json
+    for index in indexes:
+        index.saved(db, id, new_json, old_json)
+
+
+def _dbm_remove(db, id):
+    indexes = _db_indexes(db)
+    old_json = db.get(id) if indexes else None
+    del db[id]
+    for index in indexes:
+        index.deleted(db, id, old_json)
+
+
+class DbmList(object):
+    """
+    A list of json values kept in a JsonDBM under key
+
+    Values are stored in segments of up to segment_size items each,
+    with a small metadata record listing them, so appending and
+    reading a page of values only loads the segments involved rather
+    than the whole list.
+    """
+    def __init__(self, db, key, segment_size=256):
+        self.db = db
+        self.key = key
+        self.segment_size = segment_size
+
+    def _meta(self):
+        # segments: segment numbers, oldest first; sizes: their lengths
+        return self.db.get(self.key) or {
+            "segments": [], "sizes": [], "next": 0}
+
+    def _segment_key(self, segment):
+        # (a NUL can't turn up in an IRI, so this can't collide with
+        # another list's key)
+        return "%s\x00%d" % (self.key, segment)
+
+    def _load_segment(self, segment_key):
+        return self.db[segment_key]
+
+    def _store_segment(self, segment_key, items):
+        self.db[segment_key] = items
+
+    def _save_meta(self, meta):
+        if meta["segments"]:
+            self.db[self.key] = meta
+        elif self.key in self.db:
+            del self.db[self.key]
+
+    def __len__(self):
+        return sum(self._meta()["sizes"])
+
+    def append(self, item):
+        self.extend([item])
+
+    def extend(self, items):
+        items = list(items)
+        if not items:
+            return
+        meta = self._meta()
+        while items:
+            if meta["sizes"] and meta["sizes"][-1] < self.segment_size:
+                segment_key = self._segment_key(meta["segments"][-1])
+                segment = self._load_segment(segment_key)
+            else:
+                meta["segments"].append(meta["next"])
+                meta["sizes"].append(0)
+                meta["next"] += 1
+                segment_key = self._segment_key(meta["segments"][-1])
+                segment = []
+            room = self.segment_size - len(segment)
+            segment.extend(items[:room])
+            del items[:room]
+            self._store_segment(segment_key, segment)
+            meta["sizes"][-1] = len(segment)
+        self._save_meta(meta)
+
+    def remove(self, item):
+        """
+        Remove every occurrence of item, returning how many there were
+        """
+        meta = self._meta()
+        removed = 0
+        for i, segment_num in reversed(list(enumerate(meta["segments"]))):
+            segment_key = self._segment_key(segment_num)
+            segment = self._load_segment(segment_key)
+            kept = [val for val in segment if val != item]
+            if len(kept) == len(segment):
+                continue
+            removed += len(segment) - len(kept)
+            if kept:
+                self._store_segment(segment_key, kept)
+                meta["sizes"][i] = len(kept)
+            else:
+                del self.db[segment_key]
+                del meta["segments"][i]
+                del meta["sizes"][i]
+        if removed:
+            self._save_meta(meta)
+        return removed
+
+    def trim(self, max_len):
+        """
+        Drop the oldest items so that at most max_len remain
+        """
+        meta = self._meta()
+        excess = sum(meta["sizes"]) - max_len
+        if excess <= 0:
+            return
+        while excess >= meta["sizes"][0]:
+            excess -= meta["sizes"].pop(0)
+            del self.db[self._segment_key(meta["segments"].pop(0))]
+        if excess:
+            segment_key = self._segment_key(meta["segments"][0])
+            self._store_segment(
+                segment_key, self._load_segment(segment_key)[excess:])
+            meta["sizes"][0] -= excess
+        self._save_meta(meta)
+
+    def page(self, start=0, count=None, reverse=False):
+        """
+        Get count items (or all of them) from position start on; with
+        reverse, positions count back from the newest item
+        """
+        meta = self._meta()
+        total = sum(meta["sizes"])
+        stop = total if count is None else min(total, start + count)
+        if start >= stop:
+            return []
+        if reverse:
+            low, high = total - stop, total - start
+        else:
+            low, high = start, stop
+
+        items = []
+        offset = 0
+        for segment_num, size in zip(meta["segments"], meta["sizes"]):
+            if offset + size > low:
+                segment = self._load_segment(self._segment_key(segment_num))
+                items.extend(segment[max(0, low - offset):high - offset])
+            offset += size
+            if offset >= high:
+                break
+
+        if reverse:
+            items.reverse()
+        return items
+
+    def __iter__(self):
+        meta = self._meta()
+        for segment_num in meta["segments"]:
+            for item in self._load_segment(
+                    self._segment_key(segment_num)):
+                yield item
+
+    def clear(self):
+        meta = self._meta()
+        for segment_num in meta["segments"]:
+            del self.db[self._segment_key(segment_num)]
+        if self.key in self.db:
+            del self.db[self.key]
+
+
+class DbmIntList(DbmList):
+    """
+    A DbmList of integers, with each segment stored as a packed array
+    of 64 bit integers (base64 encoded) rather than a json list.  Pair
+    with DbmIdTable to keep compact lists of object ids.
+    """
+    def _load_segment(self, segment_key):
+        return array.array(
+            "q", base64.b64decode(self.db[segment_key])).tolist()
+
+    def _store_segment(self, segment_key, items):
+        self.db[segment_key] = base64.b64encode(
+            array.array("q", items).tobytes()).decode("ascii")
+
+
+class DbmIdTable(object):
+    """
+    Assigns each id a small integer, so indexes can store integers in
+    place of (long) ids
+    """
+    def __init__(self, db, name="ids"):
+        self.db = db
+        self.prefix = "%s%s/" % (INDEX_PREFIX, name)
+
+    def number(self, id, create=True):
+        """
+        The number for id, assigning it one (unless create is false, in
+        which case you'll get None)
+        """
+        key = self.prefix + "number/" + id
+        number = self.db.get(key)
+        if number is None and create:
+            number = self.db.get(self.prefix + "next", 0)
+            self.db[self.prefix + "next"] = number + 1
+            self.db[key] = number
+            self.db[self.prefix + "id/%d" % number] = id
+        return number
+
+    def id(self, number):
+        return self.db.get(self.prefix + "id/%d" % number)
+
+    def ids(self, numbers):
+        return [self.id(number) for number in numbers]
+
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+def timestamp(val):
+    """
+    An ISO 8601 date/time (as in published or updated) as integer
+    microseconds since the epoch, or None if it isn't one.  Times
+    without a timezone are taken as UTC.
+    """
+    if not isinstance(val, str):
+        return None
+    try:
+        when = datetime.datetime.fromisoformat(val)
+    except ValueError:
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    delta = when - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def type_matcher(env, db, astype):
+    """
+    A function of (id, type ids) telling whether a stored object with
+    those @type ids is an astype (or a subtype of it), for indexes
+    which keep each entry's type ids alongside it.  Each distinct set
+    of type ids is only resolved once per matcher.
+    """
+    if astype is None:
+        return lambda id, type_ids: True
+    memo = {}
+    def matches(id, type_ids):
+        type_ids = tuple(type_ids)
+        answer = memo.get(type_ids)
+        if answer is None:
+            astypes = env._astypes_for_ids(type_ids)
+            if astypes is None:
+                # Needs the object's own @context; check it the slow
+                # way, and don't share the answer
+                jsobj = db.get(id)
+                return jsobj is not None and env.is_astype(
+                    core.ASObj(jsobj, env), astype)
+            answer = astype in env._inheritance_cache.get(
+                astypes, env._inheritance_for)
+            memo[type_ids] = answer
+        return answer
+    return matches
+
+
+# Counter for DbmSortedList generations
+GENERATIONS_KEY = INDEX_PREFIX + "sorted-generations"
+
+
+class DbmSortedList(object):
+    """
+    A sorted set of json values (usually lists, like [timestamp, id])
+    kept in a JsonDBM under key
+
+    Like DbmList, values are stored in segments, but here the metadata
+    also records the first value of each segment, so finding where a
+    value goes (or reading a page starting from one) only needs a
+    binary search over the metadata and a load of the segment or two
+    involved, however long the list gets.  Segments split in two when
+    they grow past segment_size.
+
+    The metadata's version is bumped on every change, for caches.
+    Each list also gets a new generation (from a counter shared by
+    the whole store) when its metadata is created, so that a list
+    which is emptied (and so dropped) and then refilled never repeats
+    an earlier (generation, version).
+    """
+    def __init__(self, db, key, segment_size=256):
+        self.db = db
+        self.key = key
+        self.segment_size = segment_size
+
+    def _meta(self):
+        return self.db.get(self.key) or {
+            "segments": [], "firsts": [], "sizes": [], "next": 0,
+            "version": 0}
+
+    def _segment_key(self, segment):
+        return "%s\x00%d" % (self.key, segment)
+
+    def _load_segment(self, segment_key):
+        return self.db[segment_key]
+
+    def _store_segment(self, segment_key, values):
+        self.db[segment_key] = values
+
+    def _save_meta(self, meta):
+        if "generation" not in meta:
+            generation = self.db.get(GENERATIONS_KEY, 0) + 1
+            self.db[GENERATIONS_KEY] = generation
+            meta["generation"] = generation
+        meta["version"] += 1
+        self.db[self.key] = meta
+
+    def _find_segment(self, meta, value):
+        # Index of the segment value belongs in
+        return max(0, bisect.bisect_right(meta["firsts"], value) - 1)
+
+    def version(self):
+        """
+        (generation, version) of the list; this changes whenever the
+        list does
+        """
+        meta = self._meta()
+        return (meta.get("generation", 0), meta["version"])
+
+    def __len__(self):
+        return sum(self._meta()["sizes"])
+
+    def __contains__(self, value):
+        meta = self._meta()
+        if not meta["segments"]:
+            return False
+        segment = self._load_segment(self._segment_key(
+            meta["segments"][self._find_segment(meta, value)]))
+        pos = bisect.bisect_left(segment, value)
+        return pos < len(segment) and segment[pos] == value
+
+    def add(self, value):
+        """
+        Add value, returning False if it was already there
+        """
+        meta = self._meta()
+        if not meta["segments"]:
+            meta["segments"].append(meta["next"])
+            meta["firsts"].append(value)
+            meta["sizes"].append(1)
+            meta["next"] += 1
+            self._store_segment(
+                self._segment_key(meta["segments"][0]), [value])
+            self._save_meta(meta)
+            return True
+
+        i = self._find_segment(meta, value)
+        segment_key = self._segment_key(meta["segments"][i])
+        segment = self._load_segment(segment_key)
+        pos = bisect.bisect_left(segment, value)
+        if pos < len(segment) and segment[pos] == value:
+            return False
+        segment.insert(pos, value)
+
+        if len(segment) > self.segment_size:
+            half = len(segment) // 2
+            new_segment = meta["next"]
+            meta["next"] += 1
+            meta["segments"].insert(i + 1, new_segment)
+            meta["firsts"].insert(i + 1, segment[half])
+            meta["sizes"].insert(i + 1, len(segment) - half)
+            self._store_segment(
+                self._segment_key(new_segment), segment[half:])
+            segment = segment[:half]
+
+        self._store_segment(segment_key, segment)
+        meta["firsts"][i] = segment[0]
+        meta["sizes"][i] = len(segment)
+        self._save_meta(meta)
+        return True
+
+    def remove(self, value):
+        """
+        Remove value, returning False if it wasn't there
+        """
+        meta = self._meta()
+        if not meta["segments"]:
+            return False
+        i = self._find_segment(meta, value)
+        segment_key = self._segment_key(meta["segments"][i])
+        segment = self._load_segment(segment_key)
+        pos = bisect.bisect_left(segment, value)
+        if pos == len(segment) or segment[pos] != value:
+            return False
+        del segment[pos]
+
+        if segment:
+            self._store_segment(segment_key, segment)
+            meta["firsts"][i] = segment[0]
+            meta["sizes"][i] = len(segment)
+        else:
+            del self.db[segment_key]
+            del meta["segments"][i]
+            del meta["firsts"][i]
+            del meta["sizes"][i]
+        if meta["segments"]:
+            self._save_meta(meta)
+        else:
+            del self.db[self.key]
+        return True
+
+    def clear(self):
+        meta = self._meta()
+        for segment_num in meta["segments"]:
+            del self.db[self._segment_key(segment_num)]
+        if self.key in self.db:
+            del self.db[self.key]
+
+    def iter_from(self, start=None, reverse=False, inclusive=False):
+        """
+        Iterate over values after start (or before it, with reverse),
+        loading one segment at a time.  With no start, begin at the
+        first (or last) value.
+        """
+        meta = self._meta()
+        segments = meta["segments"]
+        if not segments:
+            return
+        if start is None:
+            i = len(segments) - 1 if reverse else 0
+        else:
+            i = self._find_segment(meta, start)
+
+        step = -1 if reverse else 1
+        first = True
+        while 0 <= i < len(segments):
+            segment = self._load_segment(self._segment_key(segments[i]))
+            if first and start is not None:
+                if reverse:
+                    pos = (bisect.bisect_right if inclusive
+                           else bisect.bisect_left)(segment, start)
+                    segment = segment[:pos]
+                else:
+                    pos = (bisect.bisect_left if inclusive
+                           else bisect.bisect_right)(segment, start)
+                    segment = segment[pos:]
+            first = False
+            for value in (reversed(segment) if reverse else segment):
+                yield value
+            i += step
+
+    def page(self, start=None, count=20, reverse=False, inclusive=False):
+        """
+        Get up to count values after (or, with reverse, before) start
+        """
+        return list(itertools.islice(
+            self.iter_from(start, reverse, inclusive), count))
+
+    # Pages by position, counting from the start (or, with reverse,
+    # the end); the metadata's sizes mean only the segments holding
+    # the page get loaded, as with DbmList
+    page_at = DbmList.page
+
+
+class DbmIntSet(DbmSortedList):
+    """
+    A DbmSortedList of integers, stored packed like DbmIntList
+    """
+    _load_segment = DbmIntList._load_segment
+    _store_segment = DbmIntList._store_segment
+
+
 # Each of these returns the full object inserted into dbm
 
 def dbm_fetch(id, db, env):
@@ -67,12 +580,12 @@ def dbm_fetch(id, db, env):
 def dbm_save(asobj, db):
     assert asobj.id is not None
     new_val = asobj.json()
-    db[asobj.id] = new_val
+    _dbm_store(db, asobj.id, new_val)
     return new_val
 
 def dbm_delete(asobj, db):
     assert asobj.id is not None
-    del db[asobj.id]
+    _dbm_remove(db, asobj.id)
 
 
 dbm_save_method = core.MethodId(
@@ -118,7 +631,7 @@ def dbm_activity_normalized_save(asobj, db):
     maybe_normalize("actor")
     maybe_normalize("object")
     maybe_normalize("target")
-    db[asobj.id] = as_json
+    _dbm_store(db, asobj.id, as_json)
     return as_json
 
 
@@ -173,3 +686,48 @@ def dbm_fetch_denormalized(id, db, env):
     return env.asobj_run_method(
         dbm_fetch(id, db, env),
         dbm_denormalize_method, db)
+
+
+class _BatchLoader(object):
+    """
+    Read-only stand-in for a JsonDBM which loads each key at most
+    once, for denormalizing a batch of objects
+    """
+    def __init__(self, db):
+        self.db = db
+        self.loaded = {}
+
+    def get(self, key, default=None):
+        if key not in self.loaded:
+            self.loaded[key] = self.db.get(key)
+        val = self.loaded[key]
+        return default if val is None else val
+
+    def __getitem__(self, key):
+        val = self.get(key)
+        if val is None:
+            raise KeyError(key)
+        return val
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+
+def dbm_fetch_denormalized_many(ids, db, env):
+    """
+    Fetch a batch of ids, denormalized through env's denormalize
+    method, loading each distinct object from the database only once
+    for the whole batch.
+
+    Returns a list of ASObjs, one per id found in the database
+    (missing ids are skipped).
+    """
+    loader = _BatchLoader(db)
+    results = []
+    for id in ids:
+        as_json = loader.get(id)
+        if as_json is None:
+            continue
+        results.append(env.asobj_run_method(
+            core.ASObj(as_json, env), dbm_denormalize_method, loader))
+    return results
@@ -0,0 +1,241 @@
+## Activipy --- ActivityStreams 2.0 implementation and validator for Python
+## Copyright © 2015 Christopher Allan Webber <cwebber@dustycloud.org>
+##
+## This file is part of Activipy, which is GPLv3+ or Apache v2, your option
+## (see COPYING); since that means effectively Apache v2 here's those headers
+##
+## Apache v2 header:
+##   Licensed under the Apache License, Version 2.0 (the "License");
+##   you may not use this file except in compliance with the License.
+##   You may obtain a copy of the License at
+##
+##       http://www.apache.org/licenses/LICENSE-2.0
+##
+##   Unless required by applicable law or agreed to in writing, software
+##   distributed under the License is distributed on an "AS IS" BASIS,
+##   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##   See the License for the specific language governing permissions and
+##   limitations under the License.
+
+
+"""
+Working out who an activity goes to
+
+  audience = AudienceResolver(env)
+  db = JsonDBM.open(filename, indexes=[audience])
+  ...
+  recipients = audience.resolve(db, activity)
+  deliver(activity, recipients.inboxes)
+
+Collections named in to/cc/bto/bcc/audience are expanded through the
+store (their items, their pages, KeysetCollection and MembershipSet
+members, and any collections nested in those), and the resulting
+actors and inboxes are cached per collection.  Since the resolver is
+also a DbmIndex, saving Follow, Undo, Add and Remove activities (or
+collections themselves) drops the cached expansions they affect.
+"""
+
+from collections import namedtuple, OrderedDict
+
+from activipy import core, vocab
+from activipy.demos.dbm import DbmIndex
+from activipy.demos.dbm_membership import MembershipSet, actor_collection_id
+from activipy.demos.dbm_paging import KeysetCollection
+from activipy.demos.dbm_refs import ref_ids
+from activipy.demos.delivery import recipient_inbox
+
+AUDIENCE_PROPERTIES = ("to", "cc", "bto", "bcc", "audience")
+
+PUBLIC_IDS = frozenset([
+    "https://www.w3.org/ns/activitystreams#Public",
+    "as:Public", "Public"])
+
+# A resolved audience: frozensets of actor ids and of the (deduped,
+# shared where possible) inboxes to deliver to for them
+Recipients = namedtuple("Recipients", ["actors", "inboxes"])
+
+# A cached collection expansion; depends_on is the set of collection
+# and page ids it was built from
+Expansion = namedtuple("Expansion", ["actors", "inboxes", "depends_on"])
+
+
+class AudienceResolver(DbmIndex):
+    """
+    Resolve activities' audiences to actors and inboxes, caching
+    collection expansions for up to cache_size collections
+
+    .hits and .misses count collection expansions found in and missing
+    from the cache.
+    """
+    def __init__(self, env, cache_size=1000, use_shared_inbox=True):
+        self.env = env
+        self.cache_size = cache_size
+        self.use_shared_inbox = use_shared_inbox
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _is_a(self, jsobj, astype):
+        try:
+            asobj = core.ASObj(jsobj, self.env)
+        except (AssertionError, TypeError, ValueError):
+            return False
+        return self.env.is_astype(asobj, astype)
+
+    def _inboxes(self, db, actor_ids):
+        inboxes = set()
+        for actor_id in actor_ids:
+            inbox = recipient_inbox(
+                db.get(actor_id) or {}, self.use_shared_inbox)
+            if inbox is not None:
+                inboxes.add(inbox)
+        return frozenset(inboxes)
+
+    def _expand(self, db, collection_id, depends_on, seen):
+        """
+        Add the actor ids in collection_id (recursively) to a set,
+        noting every collection and page used in depends_on
+        """
+        actors = set()
+        to_visit = [collection_id]
+        while to_visit:
+            id = to_visit.pop()
+            if id in seen:
+                continue
+            seen.add(id)
+            cached = self._cache.get(id)
+            if cached is not None:
+                # A collection we've already expanded
+                self.hits += 1
+                actors |= cached.actors
+                depends_on |= cached.depends_on
+                continue
+            jsobj = db.get(id)
+            # Members kept in the store's indexes
+            indexed = False
+            for members in (KeysetCollection(db, id), MembershipSet(db, id)):
+                if len(members):
+                    indexed = True
+                    depends_on.add(id)
+                    to_visit.extend(members.members())
+            if not isinstance(jsobj, dict):
+                if not indexed:
+                    actors.add(id)
+                continue
+
+            if not (self._is_a(jsobj, vocab.Collection) or
+                    self._is_a(jsobj, vocab.CollectionPage)):
+                actors.add(id)
+                continue
+
+            depends_on.add(id)
+            for prop in ("items", "orderedItems", "first", "next"):
+                to_visit.extend(ref_ids(jsobj.get(prop)))
+        return actors
+
+    def expand(self, db, collection_id):
+        """
+        Get the (cached) Expansion for a collection id
+        """
+        expansion = self._cache.get(collection_id)
+        if expansion is not None:
+            self.hits += 1
+            self._cache.move_to_end(collection_id)
+            return expansion
+
+        depends_on = set()
+        actors = frozenset(
+            self._expand(db, collection_id, depends_on, set()))
+        expansion = Expansion(
+            actors, self._inboxes(db, actors), frozenset(depends_on))
+        if depends_on:
+            # (Only collections count towards the statistics)
+            self.misses += 1
+            self._cache[collection_id] = expansion
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return expansion
+
+    def resolve(self, db, activity, exclude_actor=True):
+        """
+        Get the Recipients for an activity (ASObj or json)
+        """
+        if isinstance(activity, core.ASObj):
+            activity = activity.json()
+
+        actors = set()
+        inboxes = set()
+        direct = set()
+        for prop in AUDIENCE_PROPERTIES:
+            for id in ref_ids(activity.get(prop)):
+                if id in PUBLIC_IDS:
+                    continue
+                expansion = self.expand(db, id)
+                if expansion.depends_on:
+                    actors |= expansion.actors
+                    inboxes |= expansion.inboxes
+                else:
+                    direct |= expansion.actors
+
+        if exclude_actor:
+            for own in ref_ids(activity.get("actor")):
+                direct.discard(own)
+                if own in actors:
+                    actors.discard(own)
+                    # Their own inbox can go too, but not a shared one
+                    own_json = db.get(own) or {}
+                    inbox = recipient_inbox(own_json, False)
+                    if inbox == recipient_inbox(
+                            own_json, self.use_shared_inbox):
+                        inboxes.discard(inbox)
+        actors |= direct
+        inboxes |= self._inboxes(db, direct)
+        return Recipients(frozenset(actors), frozenset(inboxes))
+
+    # Invalidation
+    # ------------
+
+    def invalidate(self, collection_id):
+        """
+        Forget cached expansions which used collection_id
+        """
+        for cached_id, expansion in list(self._cache.items()):
+            if (cached_id == collection_id or
+                    collection_id in expansion.depends_on):
+                del self._cache[cached_id]
+
+    def _affected(self, db, jsobj):
+        # Collections whose membership saving or deleting jsobj might
+        # change
+        if not isinstance(jsobj, dict):
+            return set()
+        affected = set()
+        if self._is_a(jsobj, vocab.Collection) or self._is_a(
+                jsobj, vocab.CollectionPage):
+            affected.update(ref_ids(jsobj.get("@id", jsobj.get("id"))))
+            affected.update(ref_ids(jsobj.get("partOf")))
+        elif self._is_a(jsobj, vocab.Add) or self._is_a(jsobj, vocab.Remove):
+            affected.update(ref_ids(jsobj.get("target")))
+            affected.update(ref_ids(jsobj.get("origin")))
+        elif self._is_a(jsobj, vocab.Follow):
+            for followed in ref_ids(jsobj.get("object")):
+                affected.add(actor_collection_id(db, followed, "followers"))
+            for follower in ref_ids(jsobj.get("actor")):
+                affected.add(actor_collection_id(db, follower, "following"))
+        elif self._is_a(jsobj, vocab.Undo):
+            undone = jsobj.get("object")
+            for undone_json in (undone if isinstance(undone, list)
+                                else [undone]):
+                if isinstance(undone_json, str):
+                    undone_json = db.get(undone_json)
+                affected |= self._affected(db, undone_json)
+        return affected
+
+    def saved(self, db, id, new_json, old_json):
+        for collection_id in (self._affected(db, new_json) |
+                              self._affected(db, old_json)):
+            self.invalidate(collection_id)
+
+    def deleted(self, db, id, old_json):
+        for collection_id in self._affected(db, old_json):
+            self.invalidate(collection_id)
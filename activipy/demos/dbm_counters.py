@@ -0,0 +1,247 @@
+## Activipy --- ActivityStreams 2.0 implementation and validator for Python
+## Copyright © 2015 Christopher Allan Webber <cwebber@dustycloud.org>
+##
+## This file is part of Activipy, which is GPLv3+ or Apache v2, your option
+## (see COPYING); since that means effectively Apache v2 here's those headers
+##
+## Apache v2 header:
+##   Licensed under the Apache License, Version 2.0 (the "License");
+##   you may not use this file except in compliance with the License.
+##   You may obtain a copy of the License at
+##
+##       http://www.apache.org/licenses/LICENSE-2.0
+##
+##   Unless required by applicable law or agreed to in writing, software
+##   distributed under the License is distributed on an "AS IS" BASIS,
+##   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##   See the License for the specific language governing permissions and
+##   limitations under the License.
+
+
+
+"""
+Like, announce and reply counts, kept up to date as activities come in
+
+  counters = EngagementCounters(env)
+  db = JsonDBM.open(filename, indexes=[counters])
+  ...
+  counters.counts(db, note_id)   # {"likes": 3, "shares": 1, "replies": 0}
+  counters.counts_many(db, [item["@id"] for item in page_items])
+
+Saving a Like or Announce counts it against its object, and saving
+a Create of something inReplyTo something else counts a reply to
+that.  Undoing (or Deleting) one of those activities, or deleting it
+from the store, takes it off again, as does a Delete of the reply
+itself; undoing the Undo puts it back.  Each counted activity keeps a
+record of what it counted, so saving the same activity twice only
+counts it once.
+
+Each object's counts are one key, so reading them is a single lookup.
+Under heavy load, pass batch_size to add up changes in memory and
+write them out every batch_size changes (or max_delay seconds, or on
+flush(db) or closing the database); reads include changes not yet
+written.
+"""
+
+import time
+
+from activipy import core, vocab
+from activipy.demos.dbm import DbmIndex, INDEX_PREFIX
+from activipy.demos.dbm_refs import ref_ids
+
+LIKES = "likes"
+SHARES = "shares"
+REPLIES = "replies"
+KINDS = (LIKES, SHARES, REPLIES)
+
+
+class EngagementCounters(DbmIndex):
+    """
+    Counts of likes, shares and replies of each object; see the module
+    docs
+    """
+    def __init__(self, env, batch_size=1, max_delay=1.0):
+        self.env = env
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.prefix = INDEX_PREFIX + "counters/"
+        # db: ({object id: {kind: change}}, changes, time of first)
+        self._pending = {}
+
+    def _types(self, jsobj):
+        if not isinstance(jsobj, dict):
+            return ()
+        try:
+            return core.ASObj(jsobj, self.env).types_inheritance
+        except (AssertionError, TypeError, ValueError):
+            return ()
+
+    def counted(self, db, jsobj):
+        """
+        The [kind, object id] pairs counted for jsobj
+        """
+        types = self._types(jsobj)
+        if vocab.Like in types:
+            return [[LIKES, id] for id in ref_ids(jsobj.get("object"))]
+        if vocab.Announce in types:
+            return [[SHARES, id] for id in ref_ids(jsobj.get("object"))]
+        if vocab.Create in types:
+            counted = []
+            for reply in self._objects(db, jsobj):
+                counted.extend(
+                    [REPLIES, id] for id in ref_ids(reply.get("inReplyTo")))
+            return counted
+        return []
+
+    def _objects(self, db, activity):
+        # The activity's objects as json, looking up ones only
+        # referred to by id (dbm_activity_normalized_save will just
+        # have stored them)
+        val = activity.get("object")
+        for item in (val if isinstance(val, list) else [val]):
+            if isinstance(item, str):
+                item = db.get(item)
+            if isinstance(item, dict):
+                yield item
+
+    def _record_key(self, activity_id):
+        return self.prefix + "activity/" + activity_id
+
+    def _reply_key(self, reply_id):
+        return self.prefix + "reply/" + reply_id
+
+    def _counts_key(self, id):
+        return self.prefix + "object/" + id
+
+    # Keeping count
+    # -------------
+
+    def _add(self, db, counted, change):
+        if not counted:
+            return
+        changes, count, first = self._pending.get(db, ({}, 0, None))
+        for kind, id in counted:
+            object_changes = changes.setdefault(id, {})
+            object_changes[kind] = object_changes.get(kind, 0) + change
+            count += 1
+        if first is None:
+            first = time.monotonic()
+        self._pending[db] = (changes, count, first)
+        if count >= self.batch_size or (
+                time.monotonic() - first >= self.max_delay):
+            self.flush(db)
+
+    def flush(self, db):
+        changes, count, first = self._pending.pop(db, ({}, 0, None))
+        for id, object_changes in changes.items():
+            key = self._counts_key(id)
+            counts = db.get(key, {})
+            for kind, change in object_changes.items():
+                counts[kind] = counts.get(kind, 0) + change
+                if not counts[kind]:
+                    del counts[kind]
+            if counts:
+                db[key] = counts
+            elif key in db:
+                del db[key]
+
+    def _retracted(self, db, jsobj):
+        # Id of the counted activity an Undo or Delete takes back
+        types = self._types(jsobj)
+        if vocab.Undo not in types and vocab.Delete not in types:
+            return None
+        for id in ref_ids(jsobj.get("object")):
+            if self._record_key(id) in db:
+                return id
+            if vocab.Delete in types:
+                # Deleting a reply takes back its Create
+                create_id = db.get(self._reply_key(id))
+                if create_id is not None:
+                    return create_id
+        return None
+
+    def _retract(self, db, activity_id, by):
+        key = self._record_key(activity_id)
+        record = db.get(key)
+        if record is not None and record["retracted_by"] is None:
+            self._add(db, record["counted"], -1)
+            record["retracted_by"] = by
+            db[key] = record
+
+    def _restore(self, db, activity_id, by):
+        key = self._record_key(activity_id)
+        record = db.get(key)
+        if record is not None and record["retracted_by"] == by:
+            self._add(db, record["counted"], 1)
+            record["retracted_by"] = None
+            db[key] = record
+
+    def _replies(self, db, jsobj, counted):
+        # Ids of the replies a Create counted
+        if jsobj is None or not any(kind == REPLIES for kind, id in counted):
+            return set()
+        return {reply_id for reply in self._objects(db, jsobj)
+                for reply_id in ref_ids(reply)}
+
+    def _update(self, db, id, old_json, new_json):
+        key = self._record_key(id)
+        record = db.get(key)
+        old_counted = record["counted"] if record else []
+        counted = self.counted(db, new_json)
+        retracted_by = record["retracted_by"] if record else None
+        if counted != old_counted:
+            if retracted_by is None:
+                self._add(db, old_counted, -1)
+                self._add(db, counted, 1)
+            if counted:
+                db[key] = {"counted": counted, "retracted_by": retracted_by}
+            elif record is not None:
+                del db[key]
+
+        old_replies = self._replies(db, old_json, old_counted)
+        new_replies = self._replies(db, new_json, counted)
+        for reply_id in old_replies - new_replies:
+            if db.get(self._reply_key(reply_id)) == id:
+                del db[self._reply_key(reply_id)]
+        for reply_id in new_replies - old_replies:
+            db[self._reply_key(reply_id)] = id
+
+    def saved(self, db, id, new_json, old_json):
+        self._update(db, id, old_json, new_json)
+        old_retracted = self._retracted(db, old_json)
+        new_retracted = self._retracted(db, new_json)
+        if old_retracted != new_retracted:
+            if old_retracted is not None:
+                self._restore(db, old_retracted, id)
+            if new_retracted is not None:
+                self._retract(db, new_retracted, id)
+
+    def deleted(self, db, id, old_json):
+        self._update(db, id, old_json, None)
+        retracted = self._retracted(db, old_json)
+        if retracted is not None:
+            self._restore(db, retracted, id)
+        # Deleting a reply from the store takes it off too
+        create_id = db.get(self._reply_key(id))
+        if create_id is not None:
+            self._retract(db, create_id, id)
+
+    # Reading
+    # -------
+
+    def counts(self, db, id):
+        """
+        {kind: count} for each of KINDS, for the object id
+        """
+        counts = dict.fromkeys(KINDS, 0)
+        counts.update(db.get(self._counts_key(id), {}))
+        changes = self._pending.get(db, ({},))[0].get(id, {})
+        for kind, change in changes.items():
+            counts[kind] = counts.get(kind, 0) + change
+        return counts
+
+    def counts_many(self, db, ids):
+        """
+        counts for each of ids, in the same order
+        """
+        return [self.counts(db, id) for id in ids]
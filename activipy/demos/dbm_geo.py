@@ -0,0 +1,269 @@
+## Activipy --- ActivityStreams 2.0 implementation and validator for Python
+## Copyright © 2015 Christopher Allan Webber <cwebber@dustycloud.org>
+##
+## This file is part of Activipy, which is GPLv3+ or Apache v2, your option
+## (see COPYING); since that means effectively Apache v2 here's those headers
+##
+## Apache v2 header:
+##   Licensed under the Apache License, Version 2.0 (the "License");
+##   you may not use this file except in compliance with the License.
+##   You may obtain a copy of the License at
+##
+##       http://www.apache.org/licenses/LICENSE-2.0
+##
+##   Unless required by applicable law or agreed to in writing, software
+##   distributed under the License is distributed on an "AS IS" BASIS,
+##   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##   See the License for the specific language governing permissions and
+##   limitations under the License.
+
+
+"""
+Finding things near places
+
+  places = GeoIndex(CheckUpEnv)
+  db = JsonDBM.open(filename, indexes=[places])
+  ...
+  places.nearby(db, 51.5007, -0.1246, 500, astype=CheckIn,
+                start="2015-10-01T00:00:00Z")
+  places.within(db, south, west, north, east, astype=vocab.Place)
+
+Objects with coordinates of their own (like Places) or with a
+location (like Arrive, and so checkup's CheckIn) are put in a grid of
+cell_size degree cells.  Each cell is a DbmSortedList of [timestamp,
+id, latitude, longitude, type ids] entries, sorted by published, so a
+query only reads the cells it overlaps and, within them, only its
+time window.  (A list of occupied cells keeps big boxes cheap too.)
+Locations referred to by id are looked up in the store when the
+object is saved (so later changes to the Place won't move it), and
+the entries each object was given are kept, so they're the ones
+removed when it's updated or deleted.
+"""
+
+import math
+
+from activipy.demos.dbm import (
+    DbmIndex, DbmSortedList, INDEX_PREFIX, timestamp, type_matcher)
+from activipy.demos.dbm_time import as_timestamp
+
+EARTH_RADIUS = 6371008.8  # meters
+METERS_PER_DEGREE = EARTH_RADIUS * math.pi / 180
+
+
+def distance(lat1, lon1, lat2, lon2):
+    """
+    Great circle distance in meters between two points
+    """
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2 +
+         math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _is_number(val):
+    return isinstance(val, (int, float)) and not isinstance(val, bool)
+
+
+def _coordinates(jsobj):
+    if not isinstance(jsobj, dict):
+        return None
+    lat, lon = jsobj.get("latitude"), jsobj.get("longitude")
+    if (_is_number(lat) and _is_number(lon) and
+            -90 <= lat <= 90 and -180 <= lon <= 180):
+        return (float(lat), float(lon))
+    return None
+
+
+class GeoIndex(DbmIndex):
+    """
+    Grid index of located objects; see the module docs
+    """
+    def __init__(self, env, cell_size=0.1, segment_size=256):
+        self.env = env
+        self.cell_size = cell_size
+        self.segment_size = segment_size
+        self.rows = int(math.ceil(180 / cell_size))
+        self.cols = int(math.ceil(360 / cell_size))
+
+    def points(self, db, jsobj):
+        """
+        The (latitude, longitude) points jsobj is at
+        """
+        if jsobj is None:
+            return []
+        points = []
+        own = _coordinates(jsobj)
+        if own is not None:
+            points.append(own)
+        locations = jsobj.get("location")
+        if not isinstance(locations, list):
+            locations = [locations]
+        for location in locations:
+            if isinstance(location, str):
+                location = db.get(location)
+            point = _coordinates(location)
+            if point is not None and point not in points:
+                points.append(point)
+        return points
+
+    def _cell(self, lat, lon):
+        row = min(self.rows - 1, int((lat + 90) // self.cell_size))
+        col = int((lon + 180) // self.cell_size) % self.cols
+        return row, col
+
+    def _list(self, db, cell):
+        return DbmSortedList(
+            db, "%sgeo/%s/%d/%d" % ((INDEX_PREFIX, self.cell_size) + cell),
+            self.segment_size)
+
+    def entries(self, db, id, jsobj):
+        """
+        The set of (cell, entry) pairs for jsobj
+        """
+        entries = set()
+        points = self.points(db, jsobj)
+        if not points:
+            return entries
+        ts = timestamp(jsobj.get("published")) or 0
+        type_val = jsobj.get("@type", jsobj.get("type"))
+        type_ids = tuple(
+            type_val if isinstance(type_val, list) else [type_val])
+        for lat, lon in points:
+            entries.add((self._cell(lat, lon), (ts, id, lat, lon, type_ids)))
+        return entries
+
+    def _occupied(self, db):
+        # [row, col] of every cell with something in it
+        return DbmSortedList(
+            db, "%sgeo/%s/cells" % (INDEX_PREFIX, self.cell_size),
+            self.segment_size)
+
+    def _entries_key(self, id):
+        return "%sgeo/%s/of/%s" % (INDEX_PREFIX, self.cell_size, id)
+
+    def _stored_entries(self, db, id):
+        # The entries id was last given, as sets of (cell, entry)
+        return set(
+            (tuple(cell), tuple(entry[:4]) + (tuple(entry[4]),))
+            for cell, entry in db.get(self._entries_key(id), []))
+
+    def _store(self, db, id, entries, add):
+        for cell, entry in entries:
+            entry = list(entry)
+            entry[4] = list(entry[4])
+            cell_list = self._list(db, cell)
+            if add:
+                cell_list.add(entry)
+                self._occupied(db).add(list(cell))
+            else:
+                cell_list.remove(entry)
+                if not len(cell_list):
+                    self._occupied(db).remove(list(cell))
+
+    def saved(self, db, id, new_json, old_json):
+        old = self._stored_entries(db, id)
+        new = self.entries(db, id, new_json)
+        self._store(db, id, old - new, False)
+        self._store(db, id, new - old, True)
+        if new:
+            db[self._entries_key(id)] = [
+                [list(cell), list(entry[:4]) + [list(entry[4])]]
+                for cell, entry in new]
+        elif old:
+            del db[self._entries_key(id)]
+
+    def deleted(self, db, id, old_json):
+        self._store(db, id, self._stored_entries(db, id), False)
+        if self._entries_key(id) in db:
+            del db[self._entries_key(id)]
+
+    # Querying
+    # --------
+
+    # Boxes covering more cells than this are looked up through the
+    # list of occupied cells, rather than cell by cell
+    MAX_DIRECT_CELLS = 64
+
+    def _cells(self, db, south, west, north, east):
+        first_row, first_col = self._cell(max(-90, south), west)
+        last_row, last_col = self._cell(min(90, north), east)
+        if west <= east and east - west >= 360:
+            cols = range(self.cols)
+        elif first_col <= last_col:
+            cols = range(first_col, last_col + 1)
+        else:
+            # Over the antimeridian
+            cols = list(range(first_col, self.cols)) + list(
+                range(0, last_col + 1))
+
+        if (last_row - first_row + 1) * len(cols) <= self.MAX_DIRECT_CELLS:
+            for row in range(first_row, last_row + 1):
+                for col in cols:
+                    yield row, col
+            return
+
+        cols = set(cols)
+        for row, col in self._occupied(db).iter_from(
+                [first_row], inclusive=True):
+            if row > last_row:
+                return
+            if col in cols:
+                yield row, col
+
+    def _scan(self, db, south, west, north, east, astype, start, end):
+        # Yield matching entries in the box's cells (which may be a
+        # bit bigger than the box itself)
+        start = as_timestamp(start)
+        end = as_timestamp(end)
+        matches = type_matcher(self.env, db, astype)
+        for cell in self._cells(db, south, west, north, east):
+            for entry in self._list(db, cell).iter_from(
+                    None if start is None else [start], inclusive=True):
+                if end is not None and entry[0] > end:
+                    break
+                if matches(entry[1], entry[4]):
+                    yield entry
+
+    def within(self, db, south, west, north, east, astype=None,
+               start=None, end=None, count=None):
+        """
+        Get the ids of objects in a bounding box (west may be greater
+        than east, for boxes over the antimeridian), newest first,
+        optionally only of astype and published between start and end
+        """
+        found = {}
+        for ts, id, lat, lon, type_ids in self._scan(
+                db, south, west, north, east, astype, start, end):
+            in_lon = (west <= lon <= east if west <= east
+                      else lon >= west or lon <= east)
+            if south <= lat <= north and in_lon:
+                found[id] = max(ts, found.get(id, ts))
+        ids = sorted(found, key=lambda id: (-found[id], id))
+        return ids if count is None else ids[:count]
+
+    def nearby(self, db, lat, lon, radius, astype=None,
+               start=None, end=None, count=20):
+        """
+        Get (id, distance in meters) for objects within radius meters
+        of a point, nearest first, optionally only of astype and
+        published between start and end
+        """
+        lat_span = radius / METERS_PER_DEGREE
+        cos_lat = math.cos(math.radians(min(89.9, abs(lat) + lat_span)))
+        lon_span = min(180, lat_span / max(cos_lat, 1e-6))
+        west, east = lon - lon_span, lon + lon_span
+        if lon_span >= 180:
+            west, east = -180, 180
+        else:
+            west = (west + 180) % 360 - 180
+            east = (east + 180) % 360 - 180
+
+        found = {}
+        for ts, id, entry_lat, entry_lon, type_ids in self._scan(
+                db, lat - lat_span, west, lat + lat_span, east,
+                astype, start, end):
+            meters = distance(lat, lon, entry_lat, entry_lon)
+            if meters <= radius and meters < found.get(id, radius + 1):
+                found[id] = meters
+        nearest = sorted(found.items(), key=lambda item: (item[1], item[0]))
+        return nearest if count is None else nearest[:count]
@@ -0,0 +1,301 @@
+## Activipy --- ActivityStreams 2.0 implementation and validator for Python
+## Copyright © 2015 Christopher Allan Webber <cwebber@dustycloud.org>
+##
+## This file is part of Activipy, which is GPLv3+ or Apache v2, your option
+## (see COPYING); since that means effectively Apache v2 here's those headers
+##
+## Apache v2 header:
+##   Licensed under the Apache License, Version 2.0 (the "License");
+##   you may not use this file except in compliance with the License.
+##   You may obtain a copy of the License at
+##
+##       http://www.apache.org/licenses/LICENSE-2.0
+##
+##   Unless required by applicable law or agreed to in writing, software
+##   distributed under the License is distributed on an "AS IS" BASIS,
+##   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##   See the License for the specific language governing permissions and
+##   limitations under the License.
+
+
+"""
+Collection membership, kept up to date by applying activities
+
+Add, Remove, Follow and Undo activities have apply methods which
+update membership sets in the store: Add and Remove change their
+target collection, and Follow adds its actor to the followed actor's
+followers (and the followed actor to the follower's following).
+Undo applies the opposite of what it undoes.
+
+  db = JsonDBM.open(filename, indexes=[MembershipIndex()])
+  DbmNormalizedEnv.m.save(follow, db)   # new activities get applied
+  MembershipSet(db, followers_id).contains(actor_id)
+
+If the membership state is lost or suspect, rebuild it from a log of
+activities (or from the activities in the store) with rebuild():
+
+  python -m activipy.demos.dbm_membership DBFILE [LOG.ndjson ...]
+"""
+
+import argparse
+import json
+import sys
+
+from activipy import core, vocab
+from activipy.demos.dbm import (
+    DbmIdTable, DbmIndex, DbmIntSet, DbmSortedList, INDEX_PREFIX, JsonDBM,
+    DbmNormalizedEnv, timestamp)
+from activipy.demos.dbm_refs import ref_ids
+
+
+def actor_collection_id(db, actor_id, prop):
+    """
+    The id of an actor's followers/following/etc collection: the one
+    on the stored actor if there is one, or else actor_id/prop
+    """
+    actor = db.get(actor_id)
+    if isinstance(actor, dict) and isinstance(actor.get(prop), str):
+        return actor[prop]
+    return "%s/%s" % (actor_id, prop)
+
+
+def _registry(db):
+    # Every collection which has had a MembershipSet
+    return DbmSortedList(db, INDEX_PREFIX + "membership-sets")
+
+
+class MembershipSet(object):
+    """
+    The members of a collection, as a DbmIntSet of DbmIdTable numbers
+
+    contains() is a metadata read plus one segment read however big
+    the collection is; members() reads a page at a time, in the order
+    members were first seen by the id table.
+    """
+    def __init__(self, db, collection_id, segment_size=512):
+        self.db = db
+        self.collection_id = collection_id
+        self.ids = DbmIdTable(db)
+        self.numbers = DbmIntSet(
+            db, "%smembers/%s" % (INDEX_PREFIX, collection_id),
+            segment_size)
+
+    def add(self, member_id):
+        if self.numbers.key not in self.db:
+            # Note the collection, so rebuild() can find it later
+            _registry(self.db).add(self.collection_id)
+        return self.numbers.add(self.ids.number(member_id))
+
+    def remove(self, member_id):
+        number = self.ids.number(member_id, create=False)
+        return number is not None and self.numbers.remove(number)
+
+    def contains(self, member_id):
+        number = self.ids.number(member_id, create=False)
+        return number is not None and number in self.numbers
+
+    __contains__ = contains
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def members(self, after=None, count=None):
+        """
+        Get member ids, count at a time (or all of them), starting
+        after the member id after
+        """
+        start = None
+        if after is not None:
+            start = self.ids.number(after, create=False)
+        if count is None:
+            return self.ids.ids(self.numbers.iter_from(start))
+        return self.ids.ids(self.numbers.page(start, count))
+
+    def clear(self):
+        self.numbers.clear()
+
+
+# Apply methods
+# =============
+
+apply_method = core.MethodId(
+    "apply", "Apply an activity's effects to collection membership.",
+    core.handle_one)
+unapply_method = core.MethodId(
+    "unapply", "Reverse an activity's effects on collection membership.",
+    core.handle_one)
+
+
+def _no_effect(asobj, db):
+    pass
+
+
+def _add(asobj, db, reverse=False):
+    as_json = asobj.json()
+    for collection_id in ref_ids(as_json.get("target")):
+        membership = MembershipSet(db, collection_id)
+        for member_id in ref_ids(as_json.get("object")):
+            if reverse:
+                membership.remove(member_id)
+            else:
+                membership.add(member_id)
+
+
+def _remove(asobj, db, reverse=False):
+    as_json = asobj.json()
+    for collection_id in ref_ids(
+            as_json.get("target", as_json.get("origin"))):
+        membership = MembershipSet(db, collection_id)
+        for member_id in ref_ids(as_json.get("object")):
+            if reverse:
+                membership.add(member_id)
+            else:
+                membership.remove(member_id)
+
+
+def _follow(asobj, db, reverse=False):
+    as_json = asobj.json()
+    for follower in ref_ids(as_json.get("actor")):
+        for followed in ref_ids(as_json.get("object")):
+            followers = MembershipSet(
+                db, actor_collection_id(db, followed, "followers"))
+            following = MembershipSet(
+                db, actor_collection_id(db, follower, "following"))
+            if reverse:
+                followers.remove(follower)
+                following.remove(followed)
+            else:
+                followers.add(follower)
+                following.add(followed)
+
+
+def _undo(asobj, db):
+    undone = asobj.json().get("object")
+    if not isinstance(undone, list):
+        undone = [undone]
+    for undone_json in undone:
+        # Prefer the stored version of whatever's being undone
+        if isinstance(undone_json, str):
+            undone_json = db.get(undone_json)
+        elif isinstance(undone_json, dict):
+            undone_id = undone_json.get("@id", undone_json.get("id"))
+            if isinstance(undone_id, str) and undone_id in db:
+                undone_json = db[undone_id]
+        if isinstance(undone_json, dict) and (
+                "@type" in undone_json or "type" in undone_json):
+            asobj.env.asobj_run_method(
+                core.ASObj(undone_json, asobj.env), unapply_method, db)
+
+
+def _reverse(apply_proc):
+    def unapply(asobj, db):
+        return apply_proc(asobj, db, reverse=True)
+    return unapply
+
+
+MEMBERSHIP_METHODS = {
+    (apply_method, vocab.Object): _no_effect,
+    (apply_method, vocab.Add): _add,
+    (apply_method, vocab.Remove): _remove,
+    (apply_method, vocab.Follow): _follow,
+    (apply_method, vocab.Undo): _undo,
+    (unapply_method, vocab.Object): _no_effect,
+    (unapply_method, vocab.Add): _reverse(_add),
+    (unapply_method, vocab.Remove): _reverse(_remove),
+    (unapply_method, vocab.Follow): _reverse(_follow)}
+
+MembershipEnv = core.Environment(
+    methods=core.chain_dicts(DbmNormalizedEnv.methods, MEMBERSHIP_METHODS),
+    snapshot=DbmNormalizedEnv.snapshot())
+
+
+class MembershipIndex(DbmIndex):
+    """
+    Applies each newly stored activity to membership state, through
+    env's apply methods (so it works alongside whatever save methods
+    and other indexes are in use)
+    """
+    def __init__(self, env=MembershipEnv):
+        self.env = env
+
+    def saved(self, db, id, new_json, old_json):
+        if old_json is not None:
+            return
+        try:
+            asobj = core.ASObj(new_json, self.env)
+        except (AssertionError, TypeError, ValueError):
+            return
+        self.env.asobj_run_method(asobj, apply_method, db)
+
+
+# Recovery
+# ========
+
+def stored_activities(db, env):
+    """
+    Every activity in the store (anything with an actor), oldest first
+    """
+    found = []
+    for key in db.db.keys():
+        key = key.decode("utf-8") if isinstance(key, bytes) else key
+        if key.startswith(INDEX_PREFIX):
+            continue
+        as_json = db[key]
+        if isinstance(as_json, dict) and "actor" in as_json:
+            found.append((timestamp(as_json.get("published")) or 0, key))
+    found.sort()
+    for published, key in found:
+        yield core.ASObj(db[key], env)
+
+
+def rebuild(db, env, activities):
+    """
+    Throw away all membership state and re-apply activities (ASObjs
+    or json, oldest first)
+    """
+    registry = _registry(db)
+    for collection_id in registry.iter_from():
+        MembershipSet(db, collection_id).clear()
+    registry.clear()
+
+    applied = 0
+    for activity in activities:
+        if not isinstance(activity, core.ASObj):
+            activity = core.ASObj(activity, env)
+        env.asobj_run_method(activity, apply_method, db)
+        applied += 1
+    return applied
+
+
+def _read_log(filenames, env):
+    for filename in filenames:
+        with open(filename) as log:
+            for line in log:
+                if line.strip():
+                    yield core.ASObj(json.loads(line), env)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Rebuild collection membership state")
+    parser.add_argument("db", help="database file")
+    parser.add_argument(
+        "logs", nargs="*",
+        help=("newline delimited json activity logs, oldest first "
+              "(default: the activities in the database)"))
+    args = parser.parse_args(argv)
+
+    db = JsonDBM.open(args.db)
+    try:
+        if args.logs:
+            activities = _read_log(args.logs, MembershipEnv)
+        else:
+            activities = list(stored_activities(db, MembershipEnv))
+        applied = rebuild(db, MembershipEnv, activities)
+    finally:
+        db.close()
+    sys.stdout.write("applied %d activities\n" % applied)
+
+
+if __name__ == "__main__":
+    main()
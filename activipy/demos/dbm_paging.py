@@ -0,0 +1,234 @@
+## Activipy --- ActivityStreams 2.0 implementation and validator for Python
+## Copyright © 2015 Christopher Allan Webber <cwebber@dustycloud.org>
+##
+## This file is part of Activipy, which is GPLv3+ or Apache v2, your option
+## (see COPYING); since that means effectively Apache v2 here's those headers
+##
+## Apache v2 header:
+##   Licensed under the Apache License, Version 2.0 (the "License");
+##   you may not use this file except in compliance with the License.
+##   You may obtain a copy of the License at
+##
+##       http://www.apache.org/licenses/LICENSE-2.0
+##
+##   Unless required by applicable law or agreed to in writing, software
+##   distributed under the License is distributed on an "AS IS" BASIS,
+##   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##   See the License for the specific language governing permissions and
+##   limitations under the License.
+
+
+"""
+Paging through big collections (outboxes, inboxes, followers...)
+
+Members of a collection are kept sorted on (published, id) in the
+store, so a page is found by seeking to the last item of the page
+before it (keyset pagination) rather than by counting from the
+start; deep pages cost the same as shallow ones.
+
+  pager = CollectionPager(env)
+  pager.collection(db, outbox_id)   # OrderedCollection
+  pager.page(db, outbox_id)   # first (newest) OrderedCollectionPage
+  pager.page(db, outbox_id, before=cursor)   # the one after that
+
+Pages link to each other with next/prev urls carrying cursors; use
+page_for_url to serve them.
+"""
+
+import base64
+import json
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qs
+
+from activipy import core
+from activipy.demos.dbm import (
+    DbmIndex, DbmSortedList, INDEX_PREFIX, timestamp)
+from activipy.demos.dbm_refs import ref_ids
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(
+        json.dumps(key, separators=(",", ":")).encode("utf-8")
+    ).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        key = json.loads(base64.urlsafe_b64decode(
+            cursor + "=" * (-len(cursor) % 4)).decode("utf-8"))
+    except (ValueError, TypeError):
+        raise ValueError("Bad cursor: %r" % cursor)
+    # Has to be a sort_key, [published, member_id], to compare with
+    # the stored ones
+    if not (isinstance(key, list) and len(key) == 2 and
+            type(key[0]) is int and isinstance(key[1], str)):
+        raise ValueError("Bad cursor: %r" % cursor)
+    return key
+
+
+class KeysetCollection(object):
+    """
+    The members of the collection collection_id, sorted on
+    (published, id)
+    """
+    def __init__(self, db, collection_id, segment_size=256):
+        self.collection_id = collection_id
+        self.keys = DbmSortedList(
+            db, "%scollection/%s" % (INDEX_PREFIX, collection_id),
+            segment_size)
+
+    @staticmethod
+    def sort_key(member_id, published):
+        # Things with no (or a junk) published date sort first
+        return [timestamp(published) or 0, member_id]
+
+    def add(self, member_id, published=None):
+        return self.keys.add(self.sort_key(member_id, published))
+
+    def remove(self, member_id, published=None):
+        return self.keys.remove(self.sort_key(member_id, published))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def members(self, newest_first=True):
+        """
+        Stream the ids of every member, a segment at a time
+        """
+        for published, member_id in self.keys.iter_from(
+                reverse=newest_first):
+            yield member_id
+
+
+class CollectionPager(object):
+    """
+    Build OrderedCollection and OrderedCollectionPage objects for
+    KeysetCollections, newest members first
+
+    The first pages of the cache_size most recently used collections
+    are cached, and reused until the collection changes.
+    """
+    def __init__(self, env, page_size=20, segment_size=256,
+                 cache_size=1000):
+        self.env = env
+        self.page_size = page_size
+        self.segment_size = segment_size
+        self.cache_size = cache_size
+        # collection id: (collection version, first page json)
+        self._first_pages = OrderedDict()
+
+    def _collection(self, db, collection_id):
+        return KeysetCollection(db, collection_id, self.segment_size)
+
+    def page_id(self, collection_id, before=None, after=None):
+        if before is not None:
+            return "%s?before=%s" % (collection_id, before)
+        elif after is not None:
+            return "%s?after=%s" % (collection_id, after)
+        return collection_id + "?page=true"
+
+    def collection(self, db, collection_id):
+        return core.ASObj({
+            "@type": "OrderedCollection",
+            "@id": collection_id,
+            "totalItems": len(self._collection(db, collection_id)),
+            "first": self.page_id(collection_id)}, self.env)
+
+    def page(self, db, collection_id, before=None, after=None):
+        """
+        Get the page of members older than cursor before, newer than
+        cursor after, or (with neither) the newest ones
+        """
+        keys = self._collection(db, collection_id).keys
+        first_page = before is None and after is None
+        if first_page:
+            version = keys.version()
+            cached = self._first_pages.get(collection_id)
+            if cached is not None and cached[0] == version:
+                self._first_pages.move_to_end(collection_id)
+                return core.ASObj(cached[1], self.env)
+
+        if after is not None:
+            page_keys = keys.page(decode_cursor(after), self.page_size)
+            page_keys.reverse()
+        else:
+            page_keys = keys.page(
+                None if before is None else decode_cursor(before),
+                self.page_size, reverse=True)
+
+        page = {
+            "@type": "OrderedCollectionPage",
+            "@id": self.page_id(collection_id, before, after),
+            "partOf": collection_id,
+            "orderedItems": [member_id for published, member_id
+                             in page_keys]}
+        if page_keys:
+            if keys.page(page_keys[-1], 1, reverse=True):
+                page["next"] = self.page_id(
+                    collection_id, before=encode_cursor(page_keys[-1]))
+            if keys.page(page_keys[0], 1):
+                page["prev"] = self.page_id(
+                    collection_id, after=encode_cursor(page_keys[0]))
+
+        if first_page:
+            self._first_pages[collection_id] = (version, page)
+            self._first_pages.move_to_end(collection_id)
+            while len(self._first_pages) > self.cache_size:
+                self._first_pages.popitem(last=False)
+        return core.ASObj(page, self.env)
+
+    def page_for_url(self, db, url):
+        """
+        Get the page for a page url, as produced by page_id
+        """
+        parts = urlsplit(url)
+        query = parse_qs(parts.query)
+        collection_id = url.split("?", 1)[0]
+        return self.page(
+            db, collection_id,
+            before=query.get("before", [None])[0],
+            after=query.get("after", [None])[0])
+
+
+class OutboxIndex(DbmIndex):
+    """
+    Keeps each actor's outbox (a KeysetCollection) up to date as
+    activities are saved and deleted
+
+    The outbox id is the one on the stored actor, if there is one,
+    or else the actor's id plus "/outbox".
+    """
+    def __init__(self, segment_size=256):
+        self.segment_size = segment_size
+
+    def outbox_id(self, db, actor_id):
+        actor = db.get(actor_id)
+        if isinstance(actor, dict) and isinstance(actor.get("outbox"), str):
+            return actor["outbox"]
+        return actor_id + "/outbox"
+
+    def _memberships(self, db, jsobj):
+        if jsobj is None:
+            return set()
+        published = jsobj.get("published")
+        if not isinstance(published, str):
+            published = None
+        return set(
+            (self.outbox_id(db, actor_id), published)
+            for actor_id in ref_ids(jsobj.get("actor")))
+
+    def _update(self, db, id, old_json, new_json):
+        old = self._memberships(db, old_json)
+        new = self._memberships(db, new_json)
+        for outbox_id, published in old - new:
+            KeysetCollection(db, outbox_id, self.segment_size).remove(
+                id, published)
+        for outbox_id, published in new - old:
+            KeysetCollection(db, outbox_id, self.segment_size).add(
+                id, published)
+
+    def saved(self, db, id, new_json, old_json):
+        self._update(db, id, old_json, new_json)
+
+    def deleted(self, db, id, old_json):
+        self._update(db, id, old_json, None)
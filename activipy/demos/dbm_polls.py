@@ -0,0 +1,280 @@
+## Activipy --- ActivityStreams 2.0 implementation and validator for Python
+## Copyright © 2015 Christopher Allan Webber <cwebber@dustycloud.org>
+##
+## This file is part of Activipy, which is GPLv3+ or Apache v2, your option
+## (see COPYING); since that means effectively Apache v2 here's those headers
+##
+## Apache v2 header:
+##   Licensed under the Apache License, Version 2.0 (the "License");
+##   you may not use this file except in compliance with the License.
+##   You may obtain a copy of the License at
+##
+##       http://www.apache.org/licenses/LICENSE-2.0
+##
+##   Unless required by applicable law or agreed to in writing, software
+##   distributed under the License is distributed on an "AS IS" BASIS,
+##   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##   See the License for the specific language governing permissions and
+##   limitations under the License.
+
+
+
+"""
+Poll results for Questions, kept up to date as votes come in
+
+  polls = PollTallies(env)
+  db = JsonDBM.open(filename, indexes=[polls])
+  ...
+  polls.tally(db, question_id)
+  # {"options": {"Yes": 1021, "No": 33}, "voters": 1054, "multiple": False}
+  polls.tallies(db, question_ids)   # for a whole page at once
+
+A vote is an object (usually a Note) inReplyTo a stored Question,
+attributedTo the voter and named after one of the Question's oneOf
+(or, for multiple choice, anyOf) options.  Each voter counts once per
+option, and for oneOf questions only their first vote counts; if a
+counted vote is deleted, the voter's next vote which can count takes
+its place.  Voters are kept as DbmIdTable numbers in a packed
+DbmIntSet per option, and the tally of each Question is one key,
+updated as votes are saved and deleted, so reading it never looks at
+the votes.  Deleting a Question deletes everything kept about it.
+
+Votes which arrive before their Question is stored aren't counted.
+"""
+
+from activipy import core, vocab
+from activipy.demos.dbm import (
+    DbmIdTable, DbmIndex, DbmIntSet, DbmSortedList, INDEX_PREFIX)
+from activipy.demos.dbm_refs import ref_ids
+
+
+def option_names(question):
+    """
+    (names of the options of question, whether it's multiple choice)
+    """
+    for prop, multiple in (("oneOf", False), ("anyOf", True)):
+        options = question.get(prop)
+        if options is None:
+            continue
+        names = []
+        for option in (options if isinstance(options, list) else [options]):
+            if isinstance(option, dict) and isinstance(
+                    option.get("name"), str) and (
+                        option["name"] not in names):
+                names.append(option["name"])
+        return names, multiple
+    return [], False
+
+
+class PollTallies(DbmIndex):
+    """
+    Per option vote counts for each Question; see the module docs
+    """
+    def __init__(self, env, segment_size=512):
+        self.env = env
+        self.segment_size = segment_size
+        self.prefix = INDEX_PREFIX + "polls/"
+
+    def _tally_key(self, question_id):
+        return self.prefix + "tally/" + question_id
+
+    def _vote_key(self, vote_id):
+        return self.prefix + "vote/" + vote_id
+
+    def _voters(self, db, question_id, option):
+        return DbmIntSet(
+            db, "%svoters/%s\x00%s" % (self.prefix, question_id, option),
+            self.segment_size)
+
+    def _votes(self, db, question_id):
+        # [voter number, sequence, vote id] for every vote, so each
+        # voter's votes are together, in the order they came
+        return DbmSortedList(
+            db, self.prefix + "votes/" + question_id, self.segment_size)
+
+    def _is_question(self, jsobj):
+        try:
+            return self.env.is_astype(
+                core.ASObj(jsobj, self.env), vocab.Question)
+        except (AssertionError, TypeError, ValueError):
+            return False
+
+    def vote(self, db, jsobj):
+        """
+        (question id, option, voter id) if jsobj is a vote in a stored
+        Question, otherwise None
+        """
+        if jsobj is None or not isinstance(jsobj.get("name"), str):
+            return None
+        voter = next(ref_ids(jsobj.get("attributedTo")), None)
+        if voter is None:
+            voter = next(ref_ids(jsobj.get("actor")), None)
+        if voter is None:
+            return None
+        for question_id in ref_ids(jsobj.get("inReplyTo")):
+            tally = db.get(self._tally_key(question_id))
+            if tally is not None and jsobj["name"] in tally["options"]:
+                return question_id, jsobj["name"], voter
+        return None
+
+    # Keeping count
+    # -------------
+
+    def _question_saved(self, db, question_id, question):
+        key = self._tally_key(question_id)
+        names, multiple = option_names(question)
+        old = db.get(key) or {"options": {}, "voters": 0}
+        tally = {
+            "options": {name: old["options"].get(name, 0) for name in names},
+            "voters": old["voters"],
+            "multiple": multiple}
+        dropped = [name for name in old["options"] if name not in names]
+        if dropped:
+            self._options_dropped(db, question_id, tally, dropped)
+        db[key] = tally
+
+    def _options_dropped(self, db, question_id, tally, dropped):
+        # Votes for dropped options stop counting, and their voters'
+        # other votes get a chance to count instead
+        affected = set()
+        for name in dropped:
+            voters = self._voters(db, question_id, name)
+            affected.update(voters.iter_from())
+            voters.clear()
+        votes = self._votes(db, question_id)
+        for number in sorted(affected):
+            for entry in votes.iter_from([number], inclusive=True):
+                if entry[0] != number:
+                    break
+                vote_key = self._vote_key(entry[2])
+                record = db.get(vote_key)
+                if record is not None and record[3] and (
+                        record[1] in dropped):
+                    record[3] = False
+                    db[vote_key] = record
+            if not self._options_voted(db, question_id, tally, number):
+                tally["voters"] -= 1
+            self._promote(db, question_id, tally, number)
+
+    def _question_deleted(self, db, question_id, tally):
+        votes = self._votes(db, question_id)
+        for number, seq, vote_id in votes.iter_from():
+            key = self._vote_key(vote_id)
+            if key in db:
+                del db[key]
+        votes.clear()
+        for name in tally["options"]:
+            self._voters(db, question_id, name).clear()
+        del db[self._tally_key(question_id)]
+
+    def _options_voted(self, db, question_id, tally, number):
+        return [name for name in tally["options"]
+                if number in self._voters(db, question_id, name)]
+
+    def _count(self, db, question_id, tally, option, number):
+        # Count a vote if the voter's other counted votes allow it
+        if option not in tally["options"]:
+            return False
+        already = self._options_voted(db, question_id, tally, number)
+        if option in already or not (tally["multiple"] or not already):
+            return False
+        self._voters(db, question_id, option).add(number)
+        tally["options"][option] += 1
+        if not already:
+            tally["voters"] += 1
+        return True
+
+    def _add_vote(self, db, vote_id, question_id, option, voter):
+        key = self._tally_key(question_id)
+        tally = db[key]
+        number = DbmIdTable(db).number(voter)
+        counted = self._count(db, question_id, tally, option, number)
+        if counted:
+            db[key] = tally
+        seq = db.get(self.prefix + "next", 0)
+        db[self.prefix + "next"] = seq + 1
+        self._votes(db, question_id).add([number, seq, vote_id])
+        db[self._vote_key(vote_id)] = [
+            question_id, option, number, counted, seq]
+
+    def _promote(self, db, question_id, tally, number):
+        # Count the first of the voter's uncounted votes that now can
+        for entry in self._votes(db, question_id).iter_from(
+                [number], inclusive=True):
+            if entry[0] != number:
+                return
+            key = self._vote_key(entry[2])
+            record = db.get(key)
+            if record is None or record[3]:
+                continue
+            if self._count(db, question_id, tally, record[1], number):
+                record[3] = True
+                db[key] = record
+                return
+
+    def _remove_vote(self, db, vote_id):
+        record = db.get(self._vote_key(vote_id))
+        if record is None:
+            return
+        del db[self._vote_key(vote_id)]
+        question_id, option, number, counted, seq = record
+        self._votes(db, question_id).remove([number, seq, vote_id])
+        key = self._tally_key(question_id)
+        tally = db.get(key)
+        if not counted or tally is None:
+            return
+        self._voters(db, question_id, option).remove(number)
+        if option in tally["options"]:
+            tally["options"][option] -= 1
+        if not self._options_voted(db, question_id, tally, number):
+            tally["voters"] -= 1
+        self._promote(db, question_id, tally, number)
+        db[key] = tally
+
+    def saved(self, db, id, new_json, old_json):
+        if self._is_question(new_json):
+            self._question_saved(db, id, new_json)
+            return
+        new_vote = self.vote(db, new_json)
+        record = db.get(self._vote_key(id))
+        if record is not None and new_vote is not None and (
+                record[:3] == [new_vote[0], new_vote[1],
+                               DbmIdTable(db).number(new_vote[2])]):
+            # Same vote again
+            return
+        self._remove_vote(db, id)
+        if new_vote is not None:
+            self._add_vote(db, id, *new_vote)
+
+    def deleted(self, db, id, old_json):
+        self._remove_vote(db, id)
+        tally = db.get(self._tally_key(id))
+        if tally is not None:
+            self._question_deleted(db, id, tally)
+
+    # Reading
+    # -------
+
+    def tally(self, db, question_id):
+        """
+        {"options": {option name: votes}, "voters": distinct voters,
+        "multiple": whether it's anyOf} for a Question, or None if it
+        isn't stored
+        """
+        return db.get(self._tally_key(question_id))
+
+    def tallies(self, db, question_ids):
+        """
+        tally for each of question_ids, in the same order
+        """
+        return [self.tally(db, question_id) for question_id in question_ids]
+
+    def voted(self, db, question_id, voter):
+        """
+        The options voter has (countably) voted for in a Question
+        """
+        number = DbmIdTable(db).number(voter, create=False)
+        tally = self.tally(db, question_id)
+        if number is None or tally is None:
+            return []
+        return self._options_voted(db, question_id, tally, number)
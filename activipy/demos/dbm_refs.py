@@ -0,0 +1,147 @@
+## Activipy --- ActivityStreams 2.0 implementation and validator for Python
+## Copyright © 2015 Christopher Allan Webber <cwebber@dustycloud.org>
+##
+## This file is part of Activipy, which is GPLv3+ or Apache v2, your option
+## (see COPYING); since that means effectively Apache v2 here's those headers
+##
+## Apache v2 header:
+##   Licensed under the Apache License, Version 2.0 (the "License");
+##   you may not use this file except in compliance with the License.
+##   You may obtain a copy of the License at
+##
+##       http://www.apache.org/licenses/LICENSE-2.0
+##
+##   Unless required by applicable law or agreed to in writing, software
+##   distributed under the License is distributed on an "AS IS" BASIS,
+##   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##   See the License for the specific language governing permissions and
+##   limitations under the License.
+
+
+"""
+Reverse references between stored objects
+
+  refs = RefIndex()
+  db = JsonDBM.open(filename, indexes=[refs])
+  ...
+  refs.referrers(db, note_id, "object")   # eg, who liked/shared it
+  refs.referrers(db, note_id, "inReplyTo")   # replies
+  refs.referrers(db, actor_id, "actor")   # everything they did
+"""
+
+from activipy.demos.dbm import DbmIndex, DbmSortedList, INDEX_PREFIX
+
+# Properties whose values are references to other objects
+REF_PROPERTIES = (
+    "actor", "object", "target", "origin", "result", "instrument",
+    "inReplyTo", "attributedTo", "tag")
+
+
+def ref_ids(val):
+    """
+    Yield the ids referred to by a property value
+    """
+    if isinstance(val, str):
+        yield val
+    elif isinstance(val, dict):
+        ref_id = val.get("@id", val.get("id"))
+        if isinstance(ref_id, str):
+            yield ref_id
+    elif isinstance(val, list):
+        for item in val:
+            for ref_id in ref_ids(item):
+                yield ref_id
+
+
+class RefIndex(DbmIndex):
+    """
+    Index of which stored objects refer to which ids, and through
+    which property
+
+    For every referenced id this keeps a sorted list of [sequence,
+    referrer id, property] entries (sequence numbers counting up as
+    references are saved), both over all properties and per property,
+    so reads are a page at a time.  Each referrer also records the
+    sequence numbers of its references, so dropping one only touches
+    the segment it's in.
+    """
+    def __init__(self, properties=REF_PROPERTIES, segment_size=256):
+        self.properties = properties
+        self.segment_size = segment_size
+
+    def refs(self, jsobj):
+        """
+        The set of (property, referenced id) pairs in a json object
+        """
+        if jsobj is None:
+            return set()
+        return set(
+            (prop, ref_id)
+            for prop in self.properties
+            for ref_id in ref_ids(jsobj.get(prop)))
+
+    def _list(self, db, ref_id, prop=None):
+        if prop is None:
+            key = "%srefs/%s" % (INDEX_PREFIX, ref_id)
+        else:
+            key = "%srefs-by/%s/%s" % (INDEX_PREFIX, prop, ref_id)
+        return DbmSortedList(db, key, self.segment_size)
+
+    def _record_key(self, id):
+        # [[property, referenced id, sequence], ...] for referrer id
+        return "%srefs-of/%s" % (INDEX_PREFIX, id)
+
+    def _update(self, db, id, new_refs):
+        key = self._record_key(id)
+        record = db.get(key, [])
+        kept = []
+        for prop, ref_id, seq in record:
+            if (prop, ref_id) in new_refs:
+                kept.append([prop, ref_id, seq])
+            else:
+                self._list(db, ref_id).remove([seq, id, prop])
+                self._list(db, ref_id, prop).remove([seq, id])
+
+        added = sorted(
+            new_refs - set((prop, ref_id) for prop, ref_id, seq in kept))
+        if added:
+            seq = db.get(INDEX_PREFIX + "refs-next", 0)
+            db[INDEX_PREFIX + "refs-next"] = seq + len(added)
+            for prop, ref_id in added:
+                self._list(db, ref_id).add([seq, id, prop])
+                self._list(db, ref_id, prop).add([seq, id])
+                kept.append([prop, ref_id, seq])
+                seq += 1
+
+        if kept:
+            if kept != record:
+                db[key] = kept
+        elif record:
+            del db[key]
+
+    def saved(self, db, id, new_json, old_json):
+        self._update(db, id, self.refs(new_json))
+
+    def deleted(self, db, id, old_json):
+        self._update(db, id, set())
+
+    def referrers(self, db, ref_id, prop=None, start=0, count=20,
+                  newest_first=True):
+        """
+        Get a page of the objects referring to ref_id
+
+        With a prop, that's a list of the ids referring to ref_id
+        through that property; without one, a list of [id, property]
+        pairs across all properties.
+        """
+        entries = self._list(db, ref_id, prop).page_at(
+            start, count, reverse=newest_first)
+        if prop is None:
+            return [[id, prop] for seq, id, prop in entries]
+        return [id for seq, id in entries]
+
+    def count(self, db, ref_id, prop=None):
+        """
+        How many references there are to ref_id (through prop)
+        """
+        return len(self._list(db, ref_id, prop))
@@ -0,0 +1,241 @@
+## Activipy --- ActivityStreams 2.0 implementation and validator for Python
+## Copyright © 2015 Christopher Allan Webber <cwebber@dustycloud.org>
+##
+## This file is part of Activipy, which is GPLv3+ or Apache v2, your option
+## (see COPYING); since that means effectively Apache v2 here's those headers
+##
+## Apache v2 header:
+##   Licensed under the Apache License, Version 2.0 (the "License");
+##   you may not use this file except in compliance with the License.
+##   You may obtain a copy of the License at
+##
+##       http://www.apache.org/licenses/LICENSE-2.0
+##
+##   Unless required by applicable law or agreed to in writing, software
+##   distributed under the License is distributed on an "AS IS" BASIS,
+##   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##   See the License for the specific language governing permissions and
+##   limitations under the License.
+
+
+
+"""
+Finding posts by hashtag, mention or other tag
+
+  tags = TagIndex(env)
+  db = JsonDBM.open(filename, indexes=[tags])
+  ...
+  ids, cursor = tags.page(db, HASHTAG, "rootbeer")   # newest first
+  ids, cursor = tags.page(db, HASHTAG, "rootbeer", before=cursor)
+  tags.page(db, MENTION, "http://example.org/bob")
+  tags.trending(db, start="2015-10-01T00:00:00Z")
+
+Each item of an object's tag is indexed as one of:
+ - a hashtag, by name: anything named "#something", so Mastodon
+   style Hashtag objects; "#RootBeer" and "#rootbeer" are the same
+ - a mention, by href: Mentions (and subtypes)
+ - an object, by id (or href): anything else with one
+
+Each tag keeps a DbmSortedList of [published, id], so pages are read
+by seeking (like dbm_paging's collections) and the count is always to
+hand.  Hourly (or every bucket_size seconds) counts of each tag's use
+are kept up to date on save and delete as well, for trending.
+"""
+
+import datetime
+import unicodedata
+from urllib.parse import urlsplit, urlunsplit
+
+from activipy import core, vocab
+from activipy.demos.dbm import (
+    DbmIndex, DbmSortedList, INDEX_PREFIX, timestamp)
+from activipy.demos.dbm_paging import encode_cursor, decode_cursor
+from activipy.demos.dbm_time import as_timestamp
+
+HASHTAG = "hashtag"
+MENTION = "mention"
+OBJECT = "object"
+
+
+def hashtag_name(name):
+    """
+    The normalized form of a hashtag, without its "#"
+    """
+    return unicodedata.normalize("NFKC", name).lstrip("#").casefold()
+
+
+def normalize_href(href):
+    """
+    href with its scheme and host lower cased and without a fragment
+    """
+    parts = urlsplit(href)
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(),
+                       parts.path, parts.query, ""))
+
+
+class TagIndex(DbmIndex):
+    """
+    Sorted [published, id] entries for each tag, and counts of tag
+    use over time; see the module docs
+    """
+    def __init__(self, env, segment_size=256, bucket_size=3600):
+        self.env = env
+        self.segment_size = segment_size
+        self.bucket_size = bucket_size
+
+    def _tag(self, item):
+        # (kind, value) for one item of tag, or None
+        if isinstance(item, str):
+            return OBJECT, item
+        if not isinstance(item, dict):
+            return None
+        name = item.get("name")
+        if isinstance(name, str) and name.startswith("#"):
+            name = hashtag_name(name)
+            return (HASHTAG, name) if name else None
+        href = item.get("href")
+        ref = href if isinstance(href, str) else item.get(
+            "@id", item.get("id"))
+        if not isinstance(ref, str):
+            return None
+        try:
+            is_mention = self.env.is_astype(
+                core.ASObj(item, self.env), vocab.Mention)
+        except (AssertionError, TypeError, ValueError):
+            is_mention = False
+        if is_mention:
+            return MENTION, normalize_href(ref)
+        return OBJECT, ref
+
+    def tags(self, jsobj):
+        """
+        The set of (kind, value) tags of jsobj
+        """
+        if jsobj is None:
+            return set()
+        items = jsobj.get("tag")
+        if not isinstance(items, list):
+            items = [items]
+        return {tag for tag in map(self._tag, items) if tag is not None}
+
+    def entries(self, id, jsobj):
+        """
+        The set of (kind, value, published) entries for jsobj;
+        published is None if it has no (sensible) published date
+        """
+        if jsobj is None:
+            return set()
+        ts = timestamp(jsobj.get("published"))
+        return {(kind, value, ts) for kind, value in self.tags(jsobj)}
+
+    def _list(self, db, kind, value):
+        return DbmSortedList(
+            db, "%stags/%s/%s" % (INDEX_PREFIX, kind, value),
+            self.segment_size)
+
+    def _bucket(self, ts):
+        return ts // (self.bucket_size * 1000000)
+
+    def _bucket_key(self, bucket):
+        return "%stags/buckets/%d/%d" % (
+            INDEX_PREFIX, self.bucket_size, bucket)
+
+    def _store(self, db, id, entries, add):
+        buckets = {}
+        for kind, value, ts in entries:
+            entry = [ts or 0, id]
+            if add:
+                self._list(db, kind, value).add(entry)
+            else:
+                self._list(db, kind, value).remove(entry)
+            if ts is not None:
+                counts = buckets.setdefault(self._bucket(ts), {})
+                tag = "%s/%s" % (kind, value)
+                counts[tag] = counts.get(tag, 0) + (1 if add else -1)
+
+        for bucket, changes in buckets.items():
+            key = self._bucket_key(bucket)
+            counts = db.get(key, {})
+            for tag, change in changes.items():
+                counts[tag] = counts.get(tag, 0) + change
+                if counts[tag] <= 0:
+                    del counts[tag]
+            if counts:
+                db[key] = counts
+            elif key in db:
+                del db[key]
+
+    def saved(self, db, id, new_json, old_json):
+        old = self.entries(id, old_json)
+        new = self.entries(id, new_json)
+        self._store(db, id, old - new, False)
+        self._store(db, id, new - old, True)
+
+    def deleted(self, db, id, old_json):
+        self._store(db, id, self.entries(id, old_json), False)
+
+    # Querying
+    # --------
+
+    def _normalized(self, kind, value):
+        if kind == HASHTAG:
+            return hashtag_name(value)
+        if kind == MENTION:
+            return normalize_href(value)
+        return value
+
+    def page(self, db, kind, value, before=None, count=20):
+        """
+        Get (ids, cursor): the ids of up to count objects with a tag,
+        newest first, and a cursor to pass as before for the next
+        page (or None, if that's all of them)
+
+        value is normalized like the tags are, so "#RootBeer" finds
+        the posts tagged "#rootbeer".
+        """
+        start = None if before is None else decode_cursor(before)
+        entries = self._list(
+            db, kind, self._normalized(kind, value)).page(
+                start, count + 1, reverse=True)
+        ids = [id for ts, id in entries[:count]]
+        cursor = None
+        if len(entries) > count:
+            cursor = encode_cursor(entries[count - 1])
+        return ids, cursor
+
+    def count(self, db, kind, value):
+        """
+        How many objects have a tag
+        """
+        return len(self._list(db, kind, self._normalized(kind, value)))
+
+    def counts(self, db, start, end=None, kind=None):
+        """
+        {(kind, value): uses} of tags on objects published between
+        start and end (or now; to the bucket, see bucket_size),
+        optionally only for one kind of tag
+        """
+        start = as_timestamp(start)
+        end = as_timestamp(end)
+        if end is None:
+            end = as_timestamp(
+                datetime.datetime.now(datetime.timezone.utc))
+        totals = {}
+        for bucket in range(self._bucket(start), self._bucket(end) + 1):
+            for tag, uses in db.get(self._bucket_key(bucket), {}).items():
+                tag_kind, value = tag.split("/", 1)
+                if kind is None or tag_kind == kind:
+                    totals[(tag_kind, value)] = (
+                        totals.get((tag_kind, value), 0) + uses)
+        return totals
+
+    def trending(self, db, start, end=None, kind=HASHTAG, count=10):
+        """
+        The count most used tags of kind between start and end, as
+        [(value, uses)], most used first
+        """
+        totals = self.counts(db, start, end, kind)
+        ranked = sorted(((value, uses) for (tag_kind, value), uses
+                         in totals.items()),
+                        key=lambda item: (-item[1], item[0]))
+        return ranked[:count]
@@ -0,0 +1,545 @@
+## Activipy --- ActivityStreams 2.0 implementation and validator for Python
+## Copyright © 2015 Christopher Allan Webber <cwebber@dustycloud.org>
+##
+## This file is part of Activipy, which is GPLv3+ or Apache v2, your option
+## (see COPYING); since that means effectively Apache v2 here's those headers
+##
+## Apache v2 header:
+##   Licensed under the Apache License, Version 2.0 (the "License");
+##   you may not use this file except in compliance with the License.
+##   You may obtain a copy of the License at
+##
+##       http://www.apache.org/licenses/LICENSE-2.0
+##
+##   Unless required by applicable law or agreed to in writing, software
+##   distributed under the License is distributed on an "AS IS" BASIS,
+##   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##   See the License for the specific language governing permissions and
+##   limitations under the License.
+
+
+
+"""
+Full text search over stored objects
+
+  text = TextIndex(env)
+  db = JsonDBM.open(filename, indexes=[text])
+  ...
+  text.search(db, "root beer")                # [(id, score), ...]
+  text.search(db, "root be", prefix=True)     # as you type
+  text.search(db, "floats", astype=vocab.Note,
+              actor="http://example.org/alice",
+              start="2015-10-01T00:00:00Z")
+
+name, summary and content (and nameMap, summaryMap and contentMap,
+in every language) are split into terms: markup is dropped, case
+folded and accents stripped.  Each term has a posting list of
+(document number, weight) values, sorted by document and stored
+delta and varint encoded; weights favour name over summary over
+content, with repeats counting for less and less.  Queries find the
+count best documents having every term (with prefix, the last one
+may be the start of a term), ranked by weight and how rare each term
+is.  They walk the shortest posting list newest first, seeking
+through the others, and skip whole segments (and documents) which,
+going by the highest weight recorded for each segment, can't beat
+what's been found already; a common term or short prefix costs about
+as much as a rare one.
+
+Each document also has a record of its terms, so saving only touches
+the posting lists of terms which changed, and of what the type,
+actor and time filters need, which is only loaded for documents that
+could make it into the results.
+"""
+
+import base64
+import bisect
+import heapq
+import html
+import math
+import re
+import unicodedata
+
+from activipy.demos.dbm import (
+    DbmIdTable, DbmIntSet, DbmSortedList, INDEX_PREFIX, DbmIndex,
+    timestamp, type_matcher)
+from activipy.demos.dbm_refs import ref_ids
+from activipy.demos.dbm_time import as_timestamp
+
+# Property: weight of a term appearing in it once
+TEXT_PROPERTIES = {"name": 3.0, "summary": 2.0, "content": 1.0}
+
+# Properties whose ids count as the actor, for the actor filter
+ACTOR_PROPERTIES = ("actor", "attributedTo")
+
+# Longer "words" than this are not worth indexing
+MAX_TERM_LENGTH = 40
+
+_MARKUP_RE = re.compile(r"<[^>]*>")
+_TERM_RE = re.compile(r"\w+")
+
+
+def tokens(text):
+    """
+    The terms in text, in order
+    """
+    text = html.unescape(_MARKUP_RE.sub(" ", text))
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(char for char in text
+                   if not unicodedata.combining(char))
+    return [term for term in _TERM_RE.findall(text)
+            if len(term) <= MAX_TERM_LENGTH]
+
+
+def property_texts(jsobj, prop):
+    """
+    Yield the strings in prop and in its language map, propMap
+    """
+    val = jsobj.get(prop)
+    for item in (val if isinstance(val, list) else [val]):
+        if isinstance(item, str):
+            yield item
+    lang_map = jsobj.get(prop + "Map")
+    if isinstance(lang_map, dict):
+        for item in lang_map.values():
+            if isinstance(item, str):
+                yield item
+
+
+# Posting lists
+# =============
+
+# Like BM25's k1: how quickly repeats of a term stop counting for more
+SATURATION = 1.2
+
+# Weights are stored in a byte, in tenths
+WEIGHT_BITS = 8
+WEIGHT_SCALE = 10.0
+MAX_WEIGHT = (1 << WEIGHT_BITS) - 1
+
+
+def _encode_varints(values):
+    # Deltas between (sorted) values, seven bits a byte
+    out = bytearray()
+    previous = 0
+    for value in values:
+        delta = value - previous
+        previous = value
+        while delta >= 0x80:
+            out.append(delta & 0x7f | 0x80)
+            delta >>= 7
+        out.append(delta)
+    return bytes(out)
+
+
+def _decode_varints(data):
+    values = []
+    value = shift = delta = 0
+    for byte in data:
+        delta |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            value += delta
+            values.append(value)
+            delta = shift = 0
+    return values
+
+
+class PostingList(DbmIntSet):
+    """
+    A DbmIntSet of (document number << WEIGHT_BITS | weight) values,
+    with segments delta and varint encoded; most entries take two or
+    three bytes
+
+    The metadata also keeps the highest weight in each segment, so
+    queries can tell a segment can't hold a good enough match without
+    loading it.
+    """
+    def __init__(self, db, key, segment_size=256):
+        DbmIntSet.__init__(self, db, key, segment_size)
+        # segment key: highest weight, for segments stored since the
+        # metadata was last saved
+        self._new_maxes = {}
+
+    def _load_segment(self, segment_key):
+        return _decode_varints(base64.b64decode(self.db[segment_key]))
+
+    def _store_segment(self, segment_key, values):
+        self._new_maxes[segment_key] = max(
+            value & MAX_WEIGHT for value in values)
+        self.db[segment_key] = base64.b64encode(
+            _encode_varints(values)).decode("ascii")
+
+    def _save_meta(self, meta):
+        old_maxes = meta.get("maxes", {})
+        meta["maxes"] = {}
+        for segment in meta["segments"]:
+            segment_max = self._new_maxes.pop(
+                self._segment_key(segment), None)
+            if segment_max is None:
+                segment_max = old_maxes.get(str(segment), MAX_WEIGHT)
+            meta["maxes"][str(segment)] = segment_max
+        self._new_maxes.clear()
+        DbmIntSet._save_meta(self, meta)
+
+
+def idf(docs, term_docs):
+    """
+    How much a term found in term_docs of docs documents counts for
+    (as in BM25)
+    """
+    return math.log(1 + (docs - term_docs + 0.5) / (term_docs + 0.5))
+
+
+class _Cursor(object):
+    # Reads a term's PostingList newest (highest numbered) document
+    # first, in scores (weight times idf, out of docs documents);
+    # loads each segment only when it's needed, and reads at most
+    # limit postings by iterating
+    def __init__(self, postings, docs, limit=None):
+        self.postings = postings
+        self.limit = limit
+        meta = postings._meta()
+        self.meta = meta
+        self.size = sum(meta["sizes"])
+        self.idf = idf(docs, self.size) / WEIGHT_SCALE
+        maxes = meta.get("maxes", {})
+        self.maxes = [maxes.get(str(segment), MAX_WEIGHT)
+                      for segment in meta["segments"]]
+        self.top = max(self.maxes or [0]) * self.idf
+        self.segment = -1
+        self.values = []
+
+    def _values(self, segment):
+        if segment != self.segment:
+            self.segment = segment
+            self.values = self.postings._load_segment(
+                self.postings._segment_key(self.meta["segments"][segment]))
+        return self.values
+
+    def _segment_for(self, doc):
+        # The only segment doc's value could be in, or -1
+        return bisect.bisect_right(
+            self.meta["firsts"], doc << WEIGHT_BITS | MAX_WEIGHT) - 1
+
+    def bound(self, doc):
+        """
+        The best score doc could have here, without loading anything
+        """
+        segment = self._segment_for(doc)
+        return 0.0 if segment < 0 else self.maxes[segment] * self.idf
+
+    def score(self, doc):
+        """
+        doc's score, or None if it isn't here
+        """
+        segment = self._segment_for(doc)
+        if segment < 0:
+            return None
+        values = self._values(segment)
+        low = doc << WEIGHT_BITS
+        pos = bisect.bisect_left(values, low)
+        if pos < len(values) and values[pos] <= low | MAX_WEIGHT:
+            return (values[pos] & MAX_WEIGHT) * self.idf
+        return None
+
+    def _block(self, segment, left):
+        for value in reversed(self._values(segment)):
+            if left[0] == 0:
+                return
+            left[0] -= 1
+            yield value >> WEIGHT_BITS, (value & MAX_WEIGHT) * self.idf
+
+    def blocks(self):
+        """
+        Yield (best score in the block, iterator of (doc, score)) for
+        each segment, newest first
+        """
+        left = [-1 if self.limit is None else self.limit]
+        for segment in range(len(self.maxes) - 1, -1, -1):
+            if left[0] == 0:
+                return
+            yield self.maxes[segment] * self.idf, self._block(segment, left)
+
+    def docs(self):
+        for block_top, block in self.blocks():
+            for doc, score in block:
+                yield doc, score
+
+
+class _Union(object):
+    # The terms starting with a prefix, as one cursor; a document
+    # scores its best over them
+    def __init__(self, cursors):
+        # Best first, so scoring can stop early
+        self.cursors = sorted(cursors, key=lambda cursor: -cursor.top)
+        self.size = sum(cursor.size if cursor.limit is None
+                        else min(cursor.size, cursor.limit)
+                        for cursor in cursors)
+        self.top = self.cursors[0].top if cursors else 0.0
+
+    def bound(self, doc):
+        # (Working it out per cursor costs about as much as scoring)
+        return self.top
+
+    def score(self, doc):
+        best = None
+        for cursor in self.cursors:
+            if best is not None and cursor.top <= best:
+                break
+            score = cursor.score(doc)
+            if score is not None and (best is None or score > best):
+                best = score
+        return best
+
+    def _merged(self):
+        last_doc = best = None
+        for doc, score in heapq.merge(
+                *[cursor.docs() for cursor in self.cursors],
+                key=lambda item: item[0], reverse=True):
+            if doc != last_doc:
+                if last_doc is not None:
+                    yield last_doc, best
+                last_doc, best = doc, score
+            else:
+                best = max(best, score)
+        if last_doc is not None:
+            yield last_doc, best
+
+    def blocks(self):
+        yield self.top, self._merged()
+
+
+# Index
+# =====
+
+class TextIndex(DbmIndex):
+    """
+    Inverted index of the text of stored objects; see the module docs
+    """
+    def __init__(self, env, properties=TEXT_PROPERTIES,
+                 segment_size=512):
+        self.env = env
+        self.properties = properties
+        self.segment_size = segment_size
+        self.prefix = INDEX_PREFIX + "text/"
+
+    def term_weights(self, jsobj):
+        """
+        {term: weight} for jsobj's text, weights being integers from
+        1 to MAX_WEIGHT
+        """
+        weights = {}
+        for prop, prop_weight in self.properties.items():
+            counts = {}
+            for text in property_texts(jsobj, prop):
+                for term in tokens(text):
+                    counts[term] = counts.get(term, 0) + 1
+            for term, count in counts.items():
+                weights[term] = weights.get(term, 0.0) + prop_weight * (
+                    count * (SATURATION + 1) / (count + SATURATION))
+        return {
+            term: max(1, min(MAX_WEIGHT, int(round(weight * WEIGHT_SCALE))))
+            for term, weight in weights.items()}
+
+    def record(self, jsobj):
+        """
+        What's kept about a document: its term weights and what the
+        filters look at.  None if there's nothing to search for.
+        """
+        if jsobj is None:
+            return None
+        terms = self.term_weights(jsobj)
+        if not terms:
+            return None
+        type_val = jsobj.get("@type", jsobj.get("type"))
+        actors = []
+        for prop in ACTOR_PROPERTIES:
+            actors.extend(ref_ids(jsobj.get(prop)))
+        return {
+            "terms": terms,
+            "types": type_val if isinstance(type_val, list) else [type_val],
+            "actors": actors,
+            "published": timestamp(jsobj.get("published"))}
+
+    def _postings(self, db, term):
+        return PostingList(
+            db, self.prefix + "postings/" + term, self.segment_size)
+
+    def _terms(self, db):
+        # Every term with postings, sorted, for prefix lookups
+        return DbmSortedList(db, self.prefix + "terms", self.segment_size)
+
+    def _record_key(self, doc):
+        return "%sdoc/%d" % (self.prefix, doc)
+
+    def _update(self, db, id, record):
+        ids = DbmIdTable(db)
+        doc = ids.number(id, create=record is not None)
+        if doc is None:
+            return
+        key = self._record_key(doc)
+        old = db.get(key)
+        if old == record:
+            return
+
+        old_terms = old["terms"] if old else {}
+        new_terms = record["terms"] if record else {}
+        for term, weight in old_terms.items():
+            if new_terms.get(term) != weight:
+                postings = self._postings(db, term)
+                postings.remove(doc << WEIGHT_BITS | weight)
+                if term not in new_terms and not len(postings):
+                    self._terms(db).remove(term)
+        for term, weight in new_terms.items():
+            if old_terms.get(term) != weight:
+                if term not in old_terms:
+                    self._terms(db).add(term)
+                self._postings(db, term).add(doc << WEIGHT_BITS | weight)
+
+        count = db.get(self.prefix + "count", 0)
+        if record is None:
+            del db[key]
+            db[self.prefix + "count"] = count - 1
+        else:
+            db[key] = record
+            if old is None:
+                db[self.prefix + "count"] = count + 1
+
+    def saved(self, db, id, new_json, old_json):
+        self._update(db, id, self.record(new_json))
+
+    def deleted(self, db, id, old_json):
+        self._update(db, id, None)
+
+    # Querying
+    # --------
+
+    # A prefix matching more terms than this only matches the first
+    # this many (alphabetically)
+    MAX_EXPANSIONS = 50
+
+    # When walking the terms a prefix matches, read at most this many
+    # (of the newest) postings of each
+    MAX_PREFIX_POSTINGS = 10000
+
+    def count(self, db):
+        """
+        How many documents are indexed
+        """
+        return db.get(self.prefix + "count", 0)
+
+    def _expand(self, db, prefix):
+        terms = []
+        for term in self._terms(db).iter_from(prefix, inclusive=True):
+            if not term.startswith(prefix) or (
+                    len(terms) >= self.MAX_EXPANSIONS):
+                break
+            terms.append(term)
+        return terms
+
+    def ranked(self, db, query, prefix=False, count=20, accept=None):
+        """
+        Get up to count (document number, score) pairs for the
+        documents having all the terms in query (and passing accept,
+        if given), best (then newest) first
+
+        Documents are walked newest first along the rarest term,
+        skipping any segment, and any document, which can't beat the
+        count best found so far on the highest weights the posting
+        lists' metadata allows; accept is only asked about documents
+        which would make the cut.
+        """
+        terms = list(dict.fromkeys(tokens(query)))
+        if not terms:
+            return []
+        docs = self.count(db)
+        partial = terms.pop() if prefix else None
+
+        sources = []
+        for term in terms:
+            cursor = _Cursor(self._postings(db, term), docs)
+            if not cursor.size:
+                return []
+            sources.append(cursor)
+        if partial is not None:
+            union = _Union([
+                _Cursor(self._postings(db, term), docs,
+                        self.MAX_PREFIX_POSTINGS)
+                for term in self._expand(db, partial)])
+            if not union.size:
+                return []
+            sources.append(union)
+        sources.sort(key=lambda source: source.size)
+        driver, others = sources[0], sources[1:]
+
+        # The count best (score, doc)s so far; a newer doc beats an
+        # older one with the same score.  (Bounds are summed in the
+        # same order as scores, so rounding can't put them below.)
+        best = []
+        def beaten(score, bounds=()):
+            if count is None or len(best) < count:
+                return False
+            for bound in bounds:
+                score += bound
+            return score <= best[0][0]
+
+        for block_top, block in driver.blocks():
+            if beaten(block_top, [other.top for other in others]):
+                continue
+            for doc, score in block:
+                if beaten(score, [other.bound(doc) for other in others]):
+                    continue
+                for other in others:
+                    other_score = other.score(doc)
+                    if other_score is None:
+                        break
+                    score += other_score
+                else:
+                    if beaten(score) or (
+                            accept is not None and not accept(doc)):
+                        continue
+                    if count is not None and len(best) >= count:
+                        heapq.heapreplace(best, (score, doc))
+                    else:
+                        heapq.heappush(best, (score, doc))
+
+        best.sort(reverse=True)
+        return [(doc, score) for score, doc in best]
+
+    def search(self, db, query, astype=None, actor=None, start=None,
+               end=None, count=20, prefix=False):
+        """
+        Get up to count (id, score) pairs for the documents having all
+        the terms in query, best first (and, for equal scores, newest
+        first)
+
+        With prefix, the query's last term also matches longer terms
+        starting with it, for searching as the user types.  Results
+        can be limited to objects of astype (or its subtypes), by
+        actor (or attributedTo) id and published between start and
+        end.
+        """
+        start = as_timestamp(start)
+        end = as_timestamp(end)
+        ids = DbmIdTable(db)
+        matches = type_matcher(self.env, db, astype)
+
+        def accept(doc):
+            record = db.get(self._record_key(doc))
+            published = record["published"]
+            if actor is not None and actor not in record["actors"]:
+                return False
+            if (start is not None or end is not None) and (
+                    published is None):
+                return False
+            if start is not None and published < start:
+                return False
+            if end is not None and published > end:
+                return False
+            return matches(ids.id(doc), record["types"])
+
+        filtered = astype is not None or actor is not None or (
+            start is not None or end is not None)
+        return [(ids.id(doc), score) for doc, score in self.ranked(
+            db, query, prefix, count, accept if filtered else None)]
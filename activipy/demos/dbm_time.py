@@ -0,0 +1,160 @@
+## Activipy --- ActivityStreams 2.0 implementation and validator for Python
+## Copyright © 2015 Christopher Allan Webber <cwebber@dustycloud.org>
+##
+## This file is part of Activipy, which is GPLv3+ or Apache v2, your option
+## (see COPYING); since that means effectively Apache v2 here's those headers
+##
+## Apache v2 header:
+##   Licensed under the Apache License, Version 2.0 (the "License");
+##   you may not use this file except in compliance with the License.
+##   You may obtain a copy of the License at
+##
+##       http://www.apache.org/licenses/LICENSE-2.0
+##
+##   Unless required by applicable law or agreed to in writing, software
+##   distributed under the License is distributed on an "AS IS" BASIS,
+##   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##   See the License for the specific language governing permissions and
+##   limitations under the License.
+
+
+"""
+Time range queries over stored objects
+
+  times = TimeIndex(env)
+  db = JsonDBM.open(filename, indexes=[times])
+  ...
+  times.query(db, "2015-10-01T00:00:00Z", "2015-10-02T00:00:00Z")
+  times.query(db, astype=vocab.Note, count=20)   # newest 20 Notes
+
+published and updated are parsed once, on save, into integer
+timestamps.  Entries are kept in one DbmSortedList per property, and
+one more per property and type in each object's inheritance chain,
+so filtering by vocab.Activity finds Likes without looking at
+anything that isn't an Activity.
+"""
+
+import datetime
+
+from activipy import core
+from activipy.demos.dbm import (
+    DbmIndex, DbmSortedList, INDEX_PREFIX, timestamp)
+
+TIME_PROPERTIES = ("published", "updated")
+
+
+def as_timestamp(when):
+    """
+    A query bound (None, an integer timestamp, a datetime or an ISO
+    8601 string) as an integer timestamp, or None
+    """
+    if when is None or isinstance(when, int):
+        return when
+    if isinstance(when, datetime.datetime):
+        when = when.isoformat()
+    ts = timestamp(when)
+    if ts is None:
+        raise ValueError("Not a date/time: %r" % (when,))
+    return ts
+
+
+class TimeIndex(DbmIndex):
+    """
+    Sorted [timestamp, id] entries for each of properties, overall and
+    per type
+    """
+    def __init__(self, env, properties=TIME_PROPERTIES, segment_size=256):
+        self.env = env
+        self.properties = properties
+        self.segment_size = segment_size
+
+    def _list(self, db, prop, type_uri=None):
+        key = "%stime/%s" % (INDEX_PREFIX, prop)
+        if type_uri is not None:
+            key += "/" + type_uri
+        return DbmSortedList(db, key, self.segment_size)
+
+    def _type_uris(self, jsobj):
+        try:
+            asobj = core.ASObj(jsobj, self.env)
+        except (AssertionError, TypeError, ValueError):
+            return []
+        return [astype.id_uri for astype in asobj.types_inheritance]
+
+    def entries(self, id, jsobj):
+        """
+        The set of (property, type uri or None, [timestamp, id])
+        entries for jsobj
+        """
+        if jsobj is None:
+            return set()
+        entries = set()
+        type_uris = None
+        for prop in self.properties:
+            ts = timestamp(jsobj.get(prop))
+            if ts is None:
+                continue
+            if type_uris is None:
+                type_uris = self._type_uris(jsobj)
+            for type_uri in [None] + type_uris:
+                entries.add((prop, type_uri, (ts, id)))
+        return entries
+
+    def saved(self, db, id, new_json, old_json):
+        old = self.entries(id, old_json)
+        new = self.entries(id, new_json)
+        for prop, type_uri, entry in old - new:
+            self._list(db, prop, type_uri).remove(list(entry))
+        for prop, type_uri, entry in new - old:
+            self._list(db, prop, type_uri).add(list(entry))
+
+    def deleted(self, db, id, old_json):
+        for prop, type_uri, entry in self.entries(id, old_json):
+            self._list(db, prop, type_uri).remove(list(entry))
+
+    def iter_range(self, db, start=None, end=None, astype=None,
+                   prop="published", newest_first=True):
+        """
+        Iterate over [timestamp, id] entries between start and end
+        (inclusive; timestamps, datetimes or ISO 8601 strings, either
+        of which may be None for no limit), optionally only for
+        objects of astype (or its subtypes)
+        """
+        start = as_timestamp(start)
+        end = as_timestamp(end)
+        entries = self._list(
+            db, prop, None if astype is None else astype.id_uri)
+
+        if newest_first:
+            # (everything before [end + 1, ""] is at or before end)
+            iterator = entries.iter_from(
+                None if end is None else [end + 1, ""], reverse=True)
+            for entry in iterator:
+                if start is not None and entry[0] < start:
+                    return
+                yield entry
+        else:
+            iterator = entries.iter_from(
+                None if start is None else [start, ""], inclusive=True)
+            for entry in iterator:
+                if end is not None and entry[0] > end:
+                    return
+                yield entry
+
+    def query(self, db, start=None, end=None, astype=None,
+              prop="published", newest_first=True, count=20):
+        """
+        Get the ids of up to count objects in a time range; see
+        iter_range
+        """
+        ids = []
+        for ts, id in self.iter_range(db, start, end, astype, prop,
+                                      newest_first):
+            if count is not None and len(ids) >= count:
+                break
+            ids.append(id)
+        return ids
+
+    def count(self, db, astype=None, prop="published"):
+        return len(self._list(
+            db, prop, None if astype is None else astype.id_uri))
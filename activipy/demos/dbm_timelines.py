@@ -0,0 +1,154 @@
+## Activipy --- ActivityStreams 2.0 implementation and validator for Python
+## Copyright © 2015 Christopher Allan Webber <cwebber@dustycloud.org>
+##
+## This file is part of Activipy, which is GPLv3+ or Apache v2, your option
+## (see COPYING); since that means effectively Apache v2 here's those headers
+##
+## Apache v2 header:
+##   Licensed under the Apache License, Version 2.0 (the "License");
+##   you may not use this file except in compliance with the License.
+##   You may obtain a copy of the License at
+##
+##       http://www.apache.org/licenses/LICENSE-2.0
+##
+##   Unless required by applicable law or agreed to in writing, software
+##   distributed under the License is distributed on an "AS IS" BASIS,
+##   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##   See the License for the specific language governing permissions and
+##   limitations under the License.
+
+
+"""
+Materialized (fan-out-on-write) timelines
+
+When an activity is first stored, its id is appended to the
+timeline of everyone it's addressed to, so reading a timeline is a
+read of the newest page of a list, not a scan of everything.
+Collections it's addressed to (like the actor's followers) are
+expanded through the store's MembershipSet and KeysetCollection
+members when it's stored, so it goes on each member's timeline.
+
+  timelines = TimelineStore()
+  db = JsonDBM.open(filename, indexes=[timelines])
+  DbmNormalizedEnv.m.save(activity, db)
+  timelines.page(db, DbmNormalizedEnv, "http://example.org/bob")
+
+Timelines hold numbers from a DbmIdTable in packed DbmIntLists, and
+are trimmed to max_len entries.  The recipients each activity went
+to are kept too, so deleting it takes it off those timelines again.
+"""
+
+from activipy import core, vocab
+from activipy.demos.dbm import (
+    DbmIdTable, DbmIndex, DbmIntList, INDEX_PREFIX, DbmNormalizedEnv,
+    dbm_fetch_denormalized_many)
+from activipy.demos.dbm_membership import MembershipSet
+from activipy.demos.dbm_paging import KeysetCollection
+from activipy.demos.dbm_refs import ref_ids
+
+AUDIENCE_PROPERTIES = ("to", "cc", "bto", "bcc", "audience")
+
+
+class TimelineStore(DbmIndex):
+    """
+    Per recipient timelines of activity ids, newest last
+
+    include_actor puts activities on their actor's own timeline too.
+    env is used to tell activities from other objects.
+    """
+    def __init__(self, max_len=800, segment_size=256, include_actor=True,
+                 env=DbmNormalizedEnv):
+        self.env = env
+        self.max_len = max_len
+        self.segment_size = segment_size
+        self.include_actor = include_actor
+
+    def recipients(self, db, as_json):
+        """
+        The ids whose timelines as_json should go on, with addressed
+        collections expanded to their members
+        """
+        properties = AUDIENCE_PROPERTIES
+        if self.include_actor:
+            properties = ("actor",) + properties
+        recipients = []
+        seen = set()
+        to_visit = []
+        for prop in reversed(properties):
+            to_visit.extend(reversed(list(ref_ids(as_json.get(prop)))))
+        while to_visit:
+            id = to_visit.pop()
+            if id in seen:
+                continue
+            seen.add(id)
+            members = []
+            for collection in (KeysetCollection(db, id),
+                               MembershipSet(db, id)):
+                if len(collection):
+                    members.extend(collection.members())
+            if members:
+                # (Nested collections get expanded too)
+                to_visit.extend(reversed(members))
+            else:
+                recipients.append(id)
+        return recipients
+
+    def _timeline(self, db, recipient):
+        return DbmIntList(
+            db, "%stimeline/%s" % (INDEX_PREFIX, recipient),
+            self.segment_size)
+
+    def _sent_key(self, activity_id):
+        return "%stimeline-sent/%s" % (INDEX_PREFIX, activity_id)
+
+    def add(self, db, activity_id, recipients):
+        ids = DbmIdTable(db)
+        number = ids.number(activity_id)
+        for recipient in recipients:
+            timeline = self._timeline(db, recipient)
+            timeline.append(number)
+            timeline.trim(self.max_len)
+        # Who it went to, for taking it off their timelines later
+        db[self._sent_key(activity_id)] = [
+            ids.number(recipient) for recipient in recipients]
+
+    def _is_activity(self, as_json):
+        try:
+            return self.env.is_astype(
+                core.ASObj(as_json, self.env), vocab.Activity)
+        except (AssertionError, TypeError, ValueError):
+            return False
+
+    def saved(self, db, id, new_json, old_json):
+        # Only new activities fan out
+        if old_json is None and self._is_activity(new_json):
+            self.add(db, id, self.recipients(db, new_json))
+
+    def deleted(self, db, id, old_json):
+        ids = DbmIdTable(db)
+        number = ids.number(id, create=False)
+        sent = db.get(self._sent_key(id))
+        if number is None or sent is None:
+            return
+        for recipient in ids.ids(sent):
+            self._timeline(db, recipient).remove(number)
+        del db[self._sent_key(id)]
+
+    def ids(self, db, recipient, start=0, count=20):
+        """
+        Get a page of recipient's timeline as activity ids, newest first
+        """
+        return DbmIdTable(db).ids(
+            self._timeline(db, recipient).page(start, count, reverse=True))
+
+    def page(self, db, env, recipient, start=0, count=20):
+        """
+        Get a page of recipient's timeline as denormalized ASObjs,
+        newest first
+        """
+        return dbm_fetch_denormalized_many(
+            self.ids(db, recipient, start, count), db, env)
+
+    def count(self, db, recipient):
+        return len(self._timeline(db, recipient))
+
@@ -0,0 +1,252 @@
+## Activipy --- ActivityStreams 2.0 implementation and validator for Python
+## Copyright © 2015 Christopher Allan Webber <cwebber@dustycloud.org>
+##
+## This file is part of Activipy, which is GPLv3+ or Apache v2, your option
+## (see COPYING); since that means effectively Apache v2 here's those headers
+##
+## Apache v2 header:
+##   Licensed under the Apache License, Version 2.0 (the "License");
+##   you may not use this file except in compliance with the License.
+##   You may obtain a copy of the License at
+##
+##       http://www.apache.org/licenses/LICENSE-2.0
+##
+##   Unless required by applicable law or agreed to in writing, software
+##   distributed under the License is distributed on an "AS IS" BASIS,
+##   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##   See the License for the specific language governing permissions and
+##   limitations under the License.
+
+"""
+Fan an activity out to lots of inboxes at once
+
+  results = deliver(activity, followers)
+
+The activity is serialized once, recipients sharing an inbox are only
+delivered to once, and deliveries run concurrently (up to a limit) on
+asyncio, retrying transient failures with exponential backoff.  Each
+delivery goes through the deliver method of the activity's
+Environment, so environments can swap in their own transport (say,
+one which signs requests); http_deliver is a plain HTTP POST.
+"""
+
+import asyncio
+import json
+import time
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+from activipy import core, vocab
+
+
+class DeliveryError(Exception):
+    """
+    Raised by deliver methods for failures worth retrying
+    """
+    pass
+
+
+# The outcome of delivering to one inbox:
+#  - inbox: where it went
+#  - ok: whether it was accepted
+#  - status: last HTTP status, or None if we never got one
+#  - error: description of the last failure, or None
+#  - attempts: how many tries it took
+#  - latency: seconds from the first attempt to the final result
+DeliveryResult = namedtuple(
+    "DeliveryResult",
+    ["inbox", "ok", "status", "error", "attempts", "latency"])
+
+ACTIVITY_CONTENT_TYPE = "application/activity+json"
+
+
+def recipient_inbox(recipient, use_shared_inbox=True):
+    """
+    Work out where to deliver for a recipient: an inbox url, or an
+    actor (ASObj or json) with an inbox and maybe a sharedInbox
+    endpoint.  Returns None if there's nowhere to deliver to.
+    """
+    if isinstance(recipient, str):
+        return recipient
+    if isinstance(recipient, core.ASObj):
+        recipient = recipient.json()
+    if not isinstance(recipient, dict):
+        return None
+
+    if use_shared_inbox:
+        endpoints = recipient.get("endpoints")
+        if isinstance(endpoints, dict) and isinstance(
+                endpoints.get("sharedInbox"), str):
+            return endpoints["sharedInbox"]
+    inbox = recipient.get("inbox")
+    return inbox if isinstance(inbox, str) else None
+
+
+def unique_inboxes(recipients, use_shared_inbox=True):
+    """
+    The distinct inboxes for recipients, in the order first seen
+    """
+    seen = set()
+    inboxes = []
+    for recipient in recipients:
+        inbox = recipient_inbox(recipient, use_shared_inbox)
+        if inbox is not None and inbox not in seen:
+            seen.add(inbox)
+            inboxes.append(inbox)
+    return inboxes
+
+
+def delivery_json(asobj):
+    """
+    asobj's json as sent to inboxes: with an @context (the
+    Environment's implied one) if it doesn't have its own, since
+    receivers can't know what context we meant
+    """
+    jsobj = asobj.json()
+    if "@context" not in jsobj:
+        jsobj = {"@context": asobj.env.implied_context, **jsobj}
+    return jsobj
+
+
+# Transport
+# =========
+
+async def http_post(url, body, content_type=ACTIVITY_CONTENT_TYPE):
+    """
+    POST body to url, returning the response's status code
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https"):
+        raise ValueError("Can't deliver to non-http(s) url: %s" % url)
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+
+    reader, writer = await asyncio.open_connection(
+        parts.hostname, port, ssl=(parts.scheme == "https") or None)
+    try:
+        writer.write((
+            "POST %s HTTP/1.1\r\n"
+            "Host: %s\r\n"
+            "Content-Type: %s\r\n"
+            "Content-Length: %d\r\n"
+            "Connection: close\r\n\r\n" % (
+                path, parts.netloc, content_type, len(body))
+        ).encode("latin-1") + body)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        try:
+            return int(status_line.split()[1])
+        except (IndexError, ValueError):
+            raise DeliveryError(
+                "Bad response from %s: %r" % (url, status_line))
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+
+
+async def http_deliver(asobj, inbox, body):
+    """
+    deliver method: POST the (already serialized) body to inbox
+    """
+    try:
+        return await http_post(inbox, body)
+    except OSError as error:
+        raise DeliveryError(str(error))
+
+
+deliver_method = core.MethodId(
+    "deliver", "Deliver a serialized activity to an inbox.",
+    core.handle_one_async)
+
+DeliveryEnv = core.Environment(
+    methods={(deliver_method, vocab.Object): http_deliver},
+    snapshot=vocab.BasicEnv.snapshot())
+
+
+# Fan out
+# =======
+
+def _should_retry(status):
+    return status == 429 or status >= 500
+
+
+async def _deliver_one(asobj, inbox, body, semaphore,
+                       retries, backoff, timeout):
+    env = asobj.env
+    start = time.perf_counter()
+    status = error = None
+    attempt = 0
+    while True:
+        attempt += 1
+        async with semaphore:
+            try:
+                status = await asyncio.wait_for(
+                    env.asobj_run_method(asobj, deliver_method, inbox, body),
+                    timeout)
+                error = None
+            except (DeliveryError, asyncio.TimeoutError) as exc:
+                status, error = None, str(exc) or type(exc).__name__
+            except ValueError as exc:
+                # Not something trying again will fix (bad url, etc)
+                status, error = None, str(exc)
+                break
+            except Exception as exc:
+                # A broken deliver method; report it, without taking
+                # everyone else's results down with it
+                status, error = None, "%s: %s" % (type(exc).__name__, exc)
+                break
+            if error is None and not isinstance(status, int):
+                # Likewise a deliver method which forgot to return one
+                status, error = None, (
+                    "deliver method returned %r, not a status" % (status,))
+                break
+
+        if status is not None and 200 <= status < 300:
+            return DeliveryResult(
+                inbox, True, status, None, attempt,
+                time.perf_counter() - start)
+        if status is not None and not _should_retry(status):
+            error = "rejected with status %d" % status
+            break
+        if attempt > retries:
+            if error is None:
+                error = "failed with status %d" % status
+            break
+        # Back off outside of the semaphore, so others can go
+        await asyncio.sleep(backoff * 2 ** (attempt - 1))
+
+    return DeliveryResult(
+        inbox, False, status, error, attempt, time.perf_counter() - start)
+
+
+async def deliver_async(asobj, recipients, concurrency=20, retries=3,
+                        backoff=0.5, timeout=30, use_shared_inbox=True):
+    """
+    Deliver asobj to recipients (inbox urls and/or actors), running at
+    most concurrency deliveries at once
+
+    Failed deliveries are retried up to retries times (on connection
+    trouble, timeouts, 429s and 5xx statuses), waiting backoff
+    seconds, then twice that, and so on.  Returns a list of
+    DeliveryResults, one per distinct inbox.
+    """
+    body = json.dumps(delivery_json(asobj)).encode("utf-8")
+    semaphore = asyncio.Semaphore(concurrency)
+    return await asyncio.gather(*[
+        _deliver_one(asobj, inbox, body, semaphore,
+                     retries, backoff, timeout)
+        for inbox in unique_inboxes(recipients, use_shared_inbox)])
+
+
+def deliver(asobj, recipients, **kwargs):
+    """
+    Synchronous version of deliver_async, for code not already
+    running an event loop
+    """
+    return asyncio.run(deliver_async(asobj, recipients, **kwargs))
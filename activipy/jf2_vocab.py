@@ -23,12 +23,10 @@
 ## It seems to be under CC0 but it's hard to find the legal info on that page...
 
 
-import json
-
 from .core import (
     ASType, ASVocab, Environment, shortids_from_vocab,
-    resource_filename, chain_dicts,
-    AS2_CONTEXT, AS2_CONTEXT_URI, make_simple_loader)
+    resource_filename, load_package_json, chain_dicts,
+    AS2_CONTEXT_URI, make_simple_loader)
 from .vocab import CoreVocab, Object
 
 
@@ -122,16 +120,31 @@ JF2Vocab = ASVocab(
      Review, ReviewAggregate, Cite])
 
 
-JF2_CONTEXT_FILE = resource_filename(
-    'activipy', 'jf2-context.jsonld')
-JF2_CONTEXT = json.loads(open(JF2_CONTEXT_FILE, 'r').read())
 JF2_CONTEXT_URI = (
     "http://stream.thatmustbe.us/jf2.php")
-JF2_DEFAULT_URL_MAP = {
-    JF2_CONTEXT_URI: JF2_CONTEXT,
-    AS2_CONTEXT_URI: AS2_CONTEXT}
 
-jf2_loader = make_simple_loader(JF2_DEFAULT_URL_MAP)
+def _jf2_default_url_map():
+    return {
+        JF2_CONTEXT_URI: load_package_json('activipy', 'jf2-context.jsonld'),
+        AS2_CONTEXT_URI: load_package_json(
+            'activipy', 'activitystreams2-context.jsonld')}
+
+# Like in core, the context files are only read on first access
+_LAZY_ATTRIBUTES = {
+    "JF2_CONTEXT_FILE": lambda: resource_filename(
+        'activipy', 'jf2-context.jsonld'),
+    "JF2_CONTEXT": lambda: load_package_json(
+        'activipy', 'jf2-context.jsonld'),
+    "JF2_DEFAULT_URL_MAP": _jf2_default_url_map}
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        globals()[name] = _LAZY_ATTRIBUTES[name]()
+        return globals()[name]
+    raise AttributeError(
+        "module %r has no attribute %r" % (__name__, name))
+
+jf2_loader = make_simple_loader(_jf2_default_url_map)
 
 
 BasicJf2Env = Environment(
@@ -18,18 +18,27 @@
 ##   limitations under the License.
 
 
+
 import json
 import sys
+import time
 import argparse
-from collections import namedtuple, OrderedDict
+from array import array
+from collections import namedtuple, OrderedDict, Counter
+from importlib import import_module
 
-from .core import Activity, InvalidActivity
+from .core import ASObj, InvalidASObj, get_jsonld, default_loader
+from . import vocab
 
 class UserError(Exception): pass
 class InvalidInput(UserError): pass
 
 
-
+# Exit status when some documents failed to process
+EXIT_FAILURES = 1
+
+
+
 
 # Dump command
 # ============
@@ -41,10 +50,15 @@ def dump_cli(args):
         raise InvalidInput(
             "Not valid json: %s" % args.asobj)
 
-    activity = Activity.from_json(asobj)
+    if not isinstance(asobj, dict) or not (
+            "@type" in asobj or "type" in asobj):
+        raise InvalidInput(
+            "Not an ActivityStreams object (no @type): %s" % args.asobj)
+
+    activity = ASObj(asobj, vocab.BasicEnv)
     try:
         activity.validate()
-    except InvalidActivity as error:
+    except InvalidASObj as error:
         raise InvalidInput(str(error))
 
 
@@ -54,49 +68,287 @@ def dump_setup_subparser(subparser):
         help="ActivityStreams object, as json")
 
 
-
 
-# Build command
-# ==============
 
-def build_cli():
-    pass
+# Streaming document processing
+# =============================
+#
+# The validate, expand, compact and types commands all read
+# newline-delimited json (one document per line) from files or stdin,
+# process each document independently (possibly over several worker
+# processes) and stream out the results in input order.
+
+# Result of processing one document:
+#  - ok: whether it processed without problems
+#  - output: a line to print to stdout, or None
+#  - problems: list of strings describing what went wrong
+#  - types: list of type names, for the types command
+#  - elapsed: seconds spent on this document
+#  - cache_stats: {cache name: (hits, misses)} incurred by this document
+DocResult = namedtuple(
+    "DocResult",
+    ["ok", "output", "problems", "types", "elapsed", "cache_stats"])
 
+# Set up per process by _init_worker
+_worker_env = None
+_worker_command = None
 
-def build_setup_subparser(subparser):
-    pass
 
+def load_env(env_spec):
+    """
+    Load an Environment from a "some.module:attribute" string
+    """
+    try:
+        module_name, attr = env_spec.split(":", 1)
+        return getattr(import_module(module_name), attr)
+    except (ValueError, ImportError, AttributeError):
+        raise InvalidInput(
+            "Can't load environment (expected module:attribute): %s"
+            % env_spec)
+
+
+def _init_worker(command, env_spec):
+    global _worker_env, _worker_command
+    _worker_command = command
+    _worker_env = load_env(env_spec)
 
-
 
-# Testdriver command
-# ==================
+def _cache_stats_delta(before, after):
+    return {
+        name: (after[name][0] - before[name][0],
+               after[name][1] - before[name][1])
+        for name in after}
 
-def testdriver_cli():
-    pass
 
+def _type_names(asobj):
+    astypes = asobj.types_astype
+    if astypes:
+        return [asobj.env.shortids_reversemap.get(astype, astype.id_uri)
+                for astype in astypes]
+    # Nothing we know about, so just report what it says
+    return asobj.types
+
+
+def _compacted(asobj):
+    env = asobj.env
+    options = {"documentLoader": env.document_loader or default_loader}
+    return get_jsonld().compact(
+        asobj.expanded(), env.implied_context, options)
+
+
+def _process_doc(line):
+    env = _worker_env
+    stats_before = env.cache_stats()
+    start = time.perf_counter()
+
+    output = None
+    problems = []
+    types = []
+    try:
+        jsobj = json.loads(line)
+    except ValueError as error:
+        jsobj = None
+        problems.append("invalid json: %s" % error)
+
+    try:
+        if jsobj is None:
+            pass
+        elif not isinstance(jsobj, dict) or not (
+                "@type" in jsobj or "type" in jsobj):
+            problems.append("not an ActivityStreams object (no @type)")
+        elif _worker_command == "validate":
+            problems.extend(
+                "%s: %s" % (error.key, error.message)
+                for error in env.validate_many([jsobj])[0])
+        else:
+            asobj = ASObj(jsobj, env)
+            if _worker_command == "expand":
+                output = json.dumps(asobj.expanded())
+            elif _worker_command == "compact":
+                output = json.dumps(_compacted(asobj))
+            elif _worker_command == "types":
+                types = _type_names(asobj)
+    except Exception as error:
+        # json-ld processing errors and the like; report and carry on
+        problems.append("%s: %s" % (type(error).__name__, error))
+
+    elapsed = time.perf_counter() - start
+    return DocResult(
+        not problems, output, problems, types, elapsed,
+        _cache_stats_delta(stats_before, env.cache_stats()))
+
+
+def read_lines(filenames):
+    """
+    Yield (source, line number, line) for every non-blank line of the
+    given files ("-" meaning stdin), without reading them all in
+    """
+    for filename in filenames or ["-"]:
+        if filename == "-":
+            source, lines = "<stdin>", sys.stdin
+            close = False
+        else:
+            try:
+                lines = open(filename, 'r')
+            except IOError as error:
+                raise InvalidInput("Can't open %s: %s" % (filename, error))
+            source = filename
+            close = True
+
+        try:
+            for lineno, line in enumerate(lines, 1):
+                if line.strip():
+                    yield source, lineno, line
+        finally:
+            if close:
+                lines.close()
+
+
+def process_stream(command, env_spec, filenames, jobs=1, chunksize=64):
+    """
+    Yield (source, line number, DocResult) for every document, in order
+    """
+    _init_worker(command, env_spec)
+    lines = read_lines(filenames)
+
+    if jobs <= 1:
+        for source, lineno, line in lines:
+            yield source, lineno, _process_doc(line)
+        return
+
+    # Positions stay here in the parent; only lines go to workers
+    import multiprocessing
+    positions = []
+    def just_lines():
+        for source, lineno, line in lines:
+            positions.append((source, lineno))
+            yield line
+
+    pool = multiprocessing.Pool(
+        jobs, initializer=_init_worker, initargs=(command, env_spec))
+    try:
+        for i, result in enumerate(
+                pool.imap(_process_doc, just_lines(), chunksize)):
+            source, lineno = positions[i]
+            positions[i] = None
+            yield source, lineno, result
+    finally:
+        pool.terminate()
+
+
+class StreamStats(object):
+    """
+    Throughput, per document latency and cache statistics for a run
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.docs = 0
+        self.failures = 0
+        self.latencies = array('d')
+        self.cache_stats = {}
+
+    def add(self, result):
+        self.docs += 1
+        if not result.ok:
+            self.failures += 1
+        self.latencies.append(result.elapsed)
+        for name, (hits, misses) in result.cache_stats.items():
+            total_hits, total_misses = self.cache_stats.get(name, (0, 0))
+            self.cache_stats[name] = (total_hits + hits, total_misses + misses)
+
+    def percentile(self, percent):
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1,
+                    int(round(percent / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def report(self):
+        elapsed = time.perf_counter() - self.start
+        lines = [
+            "docs: %d (%d failed)" % (self.docs, self.failures),
+            "throughput: %.1f docs/s" % (
+                self.docs / elapsed if elapsed else 0.0),
+            "latency: p50 %.3fms, p99 %.3fms" % (
+                self.percentile(50) * 1000, self.percentile(99) * 1000)]
+        for name, (hits, misses) in sorted(self.cache_stats.items()):
+            lookups = hits + misses
+            lines.append("%s cache: %d/%d hits (%.1f%%)" % (
+                name, hits, lookups,
+                100.0 * hits / lookups if lookups else 0.0))
+        return "\n".join(lines)
+
+
+def stream_cli(args):
+    if args.jobs < 1:
+        raise InvalidInput("--jobs must be at least 1")
+
+    stats = StreamStats()
+    type_counts = Counter()
+    for source, lineno, result in process_stream(
+            args.subparser_name, args.env, args.files, args.jobs):
+        stats.add(result)
+        for problem in result.problems:
+            sys.stderr.write("%s:%d: %s\n" % (source, lineno, problem))
+        if result.output is not None:
+            sys.stdout.write(result.output + "\n")
+        type_counts.update(result.types)
+
+    if args.subparser_name == "types":
+        for type_name, count in sorted(
+                type_counts.items(), key=lambda item: (-item[1], item[0])):
+            sys.stdout.write("%d\t%s\n" % (count, type_name))
+
+    if args.stats:
+        sys.stderr.write(stats.report() + "\n")
+
+    if stats.failures:
+        sys.exit(EXIT_FAILURES)
+
+
+def stream_setup_subparser(subparser):
+    subparser.add_argument(
+        "files", nargs="*",
+        help="newline delimited json files to read (default or -: stdin)")
+    subparser.add_argument(
+        "--jobs", "-j", type=int, default=1,
+        help="number of worker processes")
+    subparser.add_argument(
+        "--stats", action="store_true",
+        help="print throughput, latency and cache statistics to stderr")
+    subparser.add_argument(
+        "--env", default="activipy.vocab:BasicEnv",
+        help="environment to use, as module:attribute")
 
-def testdriver_setup_subparser(subparser):
-    pass
 
 
-
 
 # Build CLI
 # =========
 
-Command = namedtuple("command", ["cli_proc", "setup_subparser"])
+Command = namedtuple("command", ["cli_proc", "setup_subparser", "help"])
 
 SUBCOMMANDS_MAP = OrderedDict([
     ("dump", Command(
-        dump_cli, dump_setup_subparser)),
-    ("build", Command(
-        build_cli, build_setup_subparser)),
-    ("testdriver", Command(
-        testdriver_cli, testdriver_setup_subparser))])
-
-
-def main():
+        dump_cli, dump_setup_subparser,
+        "validate a single object given on the command line")),
+    ("validate", Command(
+        stream_cli, stream_setup_subparser,
+        "validate newline delimited json documents")),
+    ("expand", Command(
+        stream_cli, stream_setup_subparser,
+        "json-ld expand newline delimited json documents")),
+    ("compact", Command(
+        stream_cli, stream_setup_subparser,
+        "json-ld compact newline delimited json documents "
+        "against the environment's context")),
+    ("types", Command(
+        stream_cli, stream_setup_subparser,
+        "summarize the types of newline delimited json documents"))])
+
+
+def main(argv=None):
     parser = argparse.ArgumentParser(
         # @@: this sucks as a description
         description="Test for activitystreams correctness")
@@ -104,10 +356,11 @@ def main():
     subparsers = parser.add_subparsers(dest="subparser_name")
 
     for subcommand_key, subcommand_cmd in SUBCOMMANDS_MAP.items():
-        subcmd_parser = subparsers.add_parser(subcommand_key)
+        subcmd_parser = subparsers.add_parser(
+            subcommand_key, help=subcommand_cmd.help)
         subcommand_cmd.setup_subparser(subcmd_parser)
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     if not args.subparser_name:
         parser.print_help()
         sys.exit(1)
@@ -124,4 +377,3 @@ def main():
 
 if __name__ == "__main__":
     main()
-
@@ -478,4 +478,898 @@ def test_environment_m_access_handle_fold():
     result = MethodEnv.m.combine(MethodEnv.c.Widget("fooid:12345"), "",
                                  "Huzzah")
     assert result == ""
+
+
+def test_compiled_method_chains():
+    calls = []
+
+    @core.pure_method
+    def _object_render(asobj, depth):
+        calls.append(("object", asobj.id))
+        return ("object", depth)
+
+    @core.pure_method
+    def _activity_render(asobj, depth):
+        calls.append(("activity", asobj.id))
+        return ("activity", depth)
+
+    def _activity_halting(asobj, val):
+        return core.HaltIteration(val + ["activity"])
+
+    def _object_halting(asobj, val):
+        return val + ["object"]
+
+    def handle_last(astype_methods, asobj):
+        # A handler with no .compile; gets the slow treatment
+        def func(*args, **kwargs):
+            method, astype = astype_methods[-1]
+            return (astype, method(asobj, *args, **kwargs))
+        return func
+
+    render = core.MethodId("render", "Render things", core.handle_map)
+    halting = core.MethodId("halting", "Stop early", core.handle_fold)
+    last = core.MethodId("last", "Least specific", handle_last)
+    env = core.Environment(
+        methods={
+            (render, ASObject): _object_render,
+            (render, ASActivity): _activity_render,
+            (halting, ASObject): _object_halting,
+            (halting, ASActivity): _activity_halting,
+            (last, ASObject): _object_halting},
+        snapshot=MethodEnv.snapshot())
+
+    activity = env.c.Activity("fooid:1")
+    assert env.m.render(activity, 1) == [("activity", 1), ("object", 1)]
+    assert env.m.render(activity, 1) == [("activity", 1), ("object", 1)]
+    assert activity.m.render(depth=1) == [("activity", 1), ("object", 1)]
+    # Memoized per object and arguments
+    assert calls == [("activity", "fooid:1"), ("object", "fooid:1"),
+                     ("activity", "fooid:1"), ("object", "fooid:1")]
+    env.m.render(activity, 2)
+    env.m.render(env.c.Activity("fooid:2"), 1)
+    assert len(calls) == 8
+    # Unhashable arguments just don't get memoized
+    assert env.m.render(activity, [1]) == [
+        ("activity", [1]), ("object", [1])]
+    assert env.m.render(activity, depth={"max": 1}) == [
+        ("activity", {"max": 1}), ("object", {"max": 1})]
+
+    assert env.m.halting(activity, []) == ["activity"]
+    assert env.m.halting(env.c.Object("fooid:3"), []) == ["object"]
+    assert env.m.last(activity, []) == (ASObject, ["object"])
+    with pytest.raises(core.NoMethodFound):
+        env.asobj_run_method(activity, save, {})
+
+    # One chain per method and type signature
+    hits, misses = env.cache_stats()["method_chains"]
+    assert misses == 5
     
+
+def test_async_methods():
+    import asyncio
+
+    log = []
+
+    async def _object_fetch(asobj, db):
+        log.append(("object start", asobj.id))
+        await asyncio.sleep(0)
+        log.append(("object end", asobj.id))
+        return "object"
+
+    async def _activity_fetch(asobj, db):
+        log.append(("activity start", asobj.id))
+        await asyncio.sleep(0)
+        log.append(("activity end", asobj.id))
+        return "activity"
+
+    def _post_fetch(asobj, db):
+        # plain functions are fine too
+        return "post"
+
+    async def _object_save(asobj, db):
+        await asyncio.sleep(0)
+        db[asobj.id] = "saved"
+        return asobj.id
+
+    async def _activity_stack(asobj, val):
+        return val + ["activity"]
+
+    def _post_stack(asobj, val):
+        return val + ["post"]
+
+    async def _object_stack(asobj, val):
+        return core.HaltIteration(val + ["object"])
+
+    fetch = core.MethodId("fetch", "Fetch things", core.handle_map_async)
+    save = core.MethodId("save", "Save things", core.handle_one_async)
+    stack = core.MethodId("stack", "Stack things", core.handle_fold_async)
+    env = core.Environment(
+        methods={
+            (fetch, ASObject): _object_fetch,
+            (fetch, ASActivity): _activity_fetch,
+            (fetch, ASPost): _post_fetch,
+            (save, ASObject): _object_save,
+            (stack, ASPost): _post_stack,
+            (stack, ASActivity): _activity_stack,
+            (stack, ASObject): _object_stack},
+        snapshot=MethodEnv.snapshot())
+
+    async def go():
+        db = {}
+        post = env.c.Post("fooid:post")
+        assert await post.m.fetch(db) == ["post", "activity", "object"]
+        assert await env.m.save(post, db) == "fooid:post"
+        assert db == {"fooid:post": "saved"}
+        assert await post.m.stack([]) == ["post", "activity", "object"]
+        assert await env.m.stack(env.c.Collection("fooid:c"), []) == [
+            "object"]
+        # The slow path works too
+        get_stack = env.asobj_get_method(post, stack)
+        assert await get_stack([]) == ["post", "activity", "object"]
+
+        # Lots at once, from one task
+        db = {}
+        activities = [env.c.Activity("fooid:%d" % i) for i in range(50)]
+        await asyncio.gather(
+            *[activity.m.save(db) for activity in activities])
+        assert len(db) == 50
+
+    asyncio.run(go())
+
+    # Both fetches started before either finished
+    assert log[:4] == [
+        ("activity start", "fooid:post"), ("object start", "fooid:post"),
+        ("activity end", "fooid:post"), ("object end", "fooid:post")]
+
+    with pytest.raises(core.NoMethodFound):
+        env.asobj_get_method(env.c.Link("fooid:link"), save)
+
+
+
+
+# Thread safety
+# =============
+
+def test_single_flight_cache():
+    import threading
+    import time
+
+    calls = []
+    def slow_fill(key):
+        calls.append(key)
+        time.sleep(0.01)
+        return key * 2
+
+    cache = core.SingleFlightCache()
+    results = []
+    def worker():
+        results.append(cache.get(21, slow_fill))
+
+    threads = [threading.Thread(target=worker) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [42] * 20
+    # Only one thread did the work
+    assert calls == [21]
+    assert 21 in cache
+
+    # Failed fills aren't cached
+    def broken_fill(key):
+        raise ValueError("nope")
+    with pytest.raises(ValueError):
+        cache.get("broken", broken_fill)
+    assert "broken" not in cache
+    assert cache.get("broken", lambda key: "fixed") == "fixed"
+
+
+def test_simple_loader_fetches_once():
+    import threading
+    import time
+
+    fetched = []
+    def fake_load_document(url):
+        fetched.append(url)
+        time.sleep(0.01)
+        return {"contextUrl": None,
+                "documentUrl": url,
+                "document": '{"@context": {"foo": "http://example.org/foo"}}'}
+
+    loader = core.make_simple_loader(
+        {}, load_document=fake_load_document)
+    results = []
+    def worker():
+        results.append(loader("http://example.org/context.jsonld"))
+
+    threads = [threading.Thread(target=worker) for i in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert fetched == ["http://example.org/context.jsonld"]
+    assert len(results) == 16
+    for result in results:
+        assert result["document"] == {
+            "@context": {"foo": "http://example.org/foo"}}
+
+
+def test_environment_thread_stress():
+    import threading
+
+    errors = []
+    def worker(worker_num):
+        try:
+            for i in range(25):
+                db = {}
+                widget = MethodEnv.c.Widget("fooid:%s-%s" % (worker_num, i))
+                MethodEnv.m.save(widget, db)
+                assert db[widget.id] == ("saved as widget", widget)
+
+                post = MethodEnv.c.Post("fooid:post-%s" % i)
+                assert MethodEnv.m.get_things(post) == [
+                    "posts are cool", "activities are neat",
+                    "objects are fun"]
+                assert MethodEnv.is_astype(post, ASObject)
+
+                page = MethodEnv.c.OrderedCollectionPage("fooid:page")
+                assert page.types_inheritance == [
+                    ASOrderedCollectionPage, ASOrderedCollection,
+                    ASCollectionPage, ASCollection, ASObject]
+
+                note = vocab.Note("http://example.org/note/%s" % i,
+                                  content="hi")
+                expanded = note.expanded()
+                assert expanded[0]["@type"] == [
+                    "http://www.w3.org/ns/activitystreams#Note"]
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=worker, args=(n,))
+               for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+
+
+
+# Lazy loading
+# ============
+
+def test_import_is_lazy():
+    import subprocess
+    import sys
+
+    output = subprocess.check_output(
+        [sys.executable, "-c",
+         "import sys; import activipy.vocab, activipy.jf2_vocab; "
+         "print('pyld' in sys.modules, 'pkg_resources' in sys.modules)"],
+        universal_newlines=True)
+    assert output.split() == ["False", "False"]
+
+
+def test_lazy_context_attributes():
+    from activipy import jf2_vocab
+    assert "@context" in core.AS2_CONTEXT
+    assert core.AS2_DEFAULT_URL_MAP == {
+        core.AS2_CONTEXT_URI: core.AS2_CONTEXT}
+    assert "@context" in jf2_vocab.JF2_CONTEXT
+    with pytest.raises(AttributeError):
+        core.NOT_A_REAL_THING
+
+    # Once loaded, they're plain module globals
+    assert core.AS2_DEFAULT_URL_MAP is core.AS2_DEFAULT_URL_MAP
+    assert "AS2_DEFAULT_URL_MAP" in vars(core)
+    assert jf2_vocab.JF2_CONTEXT is jf2_vocab.JF2_CONTEXT
+
+    # The loader pulls in the context on first use
+    loader = core.make_simple_loader({})
+    assert loader(core.AS2_CONTEXT_URI)["document"] is core.AS2_CONTEXT
+
+
+def test_default_url_map_changes_seen(monkeypatch):
+    extra_url = "http://example.org/extra-context.jsonld"
+    extra = {"@context": {"extra": "http://example.org/extra#"}}
+    monkeypatch.setitem(core.AS2_DEFAULT_URL_MAP, extra_url, extra)
+    assert core.AS2_DEFAULT_URL_MAP[extra_url] is extra
+
+    loader = core.make_simple_loader({}, load_unknown_urls=False)
+    assert loader(extra_url)["document"] is extra
+
+
+
+# Environment snapshots
+# =====================
+
+def test_environment_snapshot(tmpdir):
+    snapshot = MethodEnv.snapshot()
+    env = core.Environment(
+        methods={(save, ASObject): _object_save},
+        snapshot=snapshot)
+    assert env.uri_map is MethodEnv.uri_map
+    assert env.shortids_reversemap[ASWidget] == "Widget"
+
+    widget = env.c.Widget("fooid:snap")
+    assert widget.env is env
+    assert widget.types_astype == [ASWidget]
+    db = {}
+    env.m.save(widget, db)
+    assert db["fooid:snap"] == ("saved as object", widget)
+
+    # Round trip through the disk
+    filename = str(tmpdir.join("snapshot.json"))
+    snapshot.save(filename)
+    loaded = core.EnvironmentSnapshot.load(filename, [ExampleVocab])
+    assert loaded.shortids == MethodEnv.shortids
+    assert loaded.c_accessors == snapshot.c_accessors
+    loaded_env = core.Environment(snapshot=loaded)
+    assert loaded_env.c.OrderedCollectionPage().types_inheritance == [
+        ASOrderedCollectionPage, ASOrderedCollection,
+        ASCollectionPage, ASCollection, ASObject]
+
+    # Types have to be resolvable though
+    with pytest.raises(ValueError):
+        core.EnvironmentSnapshot.load(filename, [])
+
+    # and it's one or the other
+    with pytest.raises(ValueError):
+        core.Environment(vocabs=[ExampleVocab], snapshot=snapshot)
+
+
+def test_shortids_from_vocab_copies():
+    shortids = core.shortids_from_vocab(ExampleVocab)
+    shortids["Bogus"] = ASObject
+    assert "Bogus" not in core.shortids_from_vocab(ExampleVocab)
+    assert core.shortids_from_vocab(ExampleVocab, "ex")["ex:Widget"] is \
+        ASWidget
+
+
+
+# Validation
+# ==========
+
+ASMeasured = core.ASType(
+    fake_type_uri("measured"), [ASObject], "Measured",
+    props=[
+        core.ASProp("size", ["nonNegativeInteger"], functional=True,
+                    required=True),
+        core.ASProp("when", ["dateTime"], functional=True)])
+
+ASBigMeasured = core.ASType(
+    fake_type_uri("bigmeasured"), [ASMeasured], "BigMeasured",
+    props=[
+        # Override the parent's version of this prop
+        core.ASProp("when", ["dateTime", "duration"]),
+        core.ASProp("label", ["string"], required=True)])
+
+ValidationVocab = core.ASVocab([ASObject, ASMeasured, ASBigMeasured])
+ValidationEnv = core.Environment(
+    vocabs=[ValidationVocab],
+    shortids=core.shortids_from_vocab(ValidationVocab),
+    c_accessors=core.shortids_from_vocab(ValidationVocab))
+
+
+def test_asprop_unknown_value_type():
+    with pytest.raises(ValueError):
+        core.ASProp("foo", ["not-a-real-type"])
+
+
+def test_validation():
+    good = ValidationEnv.c.Measured(size=10, when="2015-10-01T12:00:00Z")
+    assert good.validation_errors() == []
+    good.validate()
+
+    bad = ValidationEnv.c.Measured(size=[-1, 2], when="last tuesday")
+    errors = bad.validation_errors()
+    assert core.ValidationError(
+        "size", "functional property has 2 values") in errors
+    assert core.ValidationError(
+        "size", "expected nonNegativeInteger, got -1") in errors
+    assert core.ValidationError(
+        "when", "expected dateTime, got 'last tuesday'") in errors
+    assert len(errors) == 3
+    with pytest.raises(core.InvalidASObj) as excinfo:
+        bad.validate()
+    assert excinfo.value.errors == errors
+
+    # The child type's constraints are fused with its parents'
+    big = ValidationEnv.c.BigMeasured(size=3, when=["P1D", "P2D"])
+    assert big.validation_errors() == [
+        core.ValidationError("label", "required property is missing")]
+
+    # ASType.validate checks against that type in particular; here
+    # the parent's stricter version of "when" applies
+    ASObject.validate(big)
+    with pytest.raises(core.InvalidASObj):
+        ASMeasured.validate(big)
+
+
+def test_validate_many():
+    results = ValidationEnv.validate_many([
+        {"@type": "Measured", "size": 1},
+        {"type": "Measured", "size": "big"},
+        ValidationEnv.c.Measured(),
+        {"size": 1},
+        "not even an object"])
+    assert results[0] == []
+    assert results[1] == [core.ValidationError(
+        "size", "expected nonNegativeInteger, got 'big'")]
+    assert results[2] == [core.ValidationError(
+        "size", "required property is missing")]
+    assert results[3] == [core.ValidationError(
+        "@type", "missing or invalid @type")]
+    assert len(results[4]) == 1
+
+
+def test_vocab_validation():
+    assert vocab.Place(latitude=41.9, longitude=-87.6).validation_errors() \
+        == []
+    assert vocab.Place(latitude="north").validation_errors() == [
+        core.ValidationError("latitude", "expected number, got 'north'")]
+    assert ROOT_BEER_NOTE_VOCAB.validation_errors() == []
+    # Unknown types don't have any constraints to fail
+    assert vocab.BasicEnv.validate_many([
+        {"@type": "http://example.org/ns#Whatever", "published": "bleh"},
+        {"@type": "Note", "published": "bleh"}]) == [
+            [], [core.ValidationError(
+                "published", "expected dateTime, got 'bleh'")]]
+    # Object valued properties can be plain IRIs too
+    assert vocab.Profile(
+        describes="http://example.org/alice").validation_errors() == []
+    assert vocab.Profile(describes={"@type": "Person"}).validation_errors() \
+        == []
+    vocab.Place.validate(vocab.Place(latitude=41.9))
+    with pytest.raises(core.InvalidASObj):
+        vocab.Place.validate(vocab.Place(latitude="north"))
+
+
+
+# Instrumentation
+# ===============
+
+def test_instrumentation_memory_sink():
+    sink = core.MemorySink()
+    previous = core.set_instrumentation(sink)
+    try:
+        assert core.get_instrumentation() is sink
+        db = {}
+        widget = MethodEnv.c.Widget("fooid:instrumented")
+        MethodEnv.m.save(widget, db)
+        MethodEnv.asobj_run_method(widget, save, db)
+        widget["@type"]
+
+        note = vocab.Note("http://example.org/note", content="hi")
+        note.expanded()
+        # This one can only be resolved by expanding
+        vocab.BasicEnv.asobj_astypes(core.ASObj({
+            "@context": {"ex": "http://www.w3.org/ns/activitystreams#"},
+            "@type": "ex:Note"}))
+    finally:
+        core.set_instrumentation(previous)
+
+    report = sink.report()
+    assert report["method.save"]["count"] == 2
+    assert report["method.save"]["min"] <= report["method.save"]["max"]
+    assert report["deepcopy_jsobj.in"]["count"] >= 2
+    assert report["deepcopy_jsobj.out"]["count"] >= 1
+    assert report["jsonld.expand"]["count"] == 2
+    assert report["loader.hit"]["count"] >= 1
+    assert report["astypes.fast_path"]["count"] >= 2
+    assert report["astypes.expansion_fallback"]["count"] == 1
+
+    # Nothing recorded once it's uninstalled
+    MethodEnv.m.save(widget, db)
+    assert sink.report()["method.save"]["count"] == 2
+    sink.reset()
+    assert sink.report() == {}
+
+
+def test_instrumentation_statsd_sink():
+    received = []
+    sink = core.StatsdSink(
+        lambda *args: received.append(args), prefix="activipy.")
+    previous = core.set_instrumentation(sink)
+    try:
+        MethodEnv.m.get_things(MethodEnv.c.Post("fooid:statsd"))
+    finally:
+        core.set_instrumentation(previous)
+
+    assert ("activipy.astypes.fast_path", 1, "c") in received
+    timings = [(name, metric_type) for name, value, metric_type in received
+               if metric_type == "ms"]
+    assert ("activipy.method.get_things", "ms") in timings
+
+
+
+# Ingest index
+# ============
+
+def test_ingest_index():
+    jsobj = {
+        "type": "Announce",
+        "id": "http://example.org/announce/1",
+        "actor": {"type": "Person", "id": "http://example.org/bob"},
+        "object": ROOT_BEER_NOTE_ASOBJ,
+        "tag": [
+            "not an object",
+            {"@type": ["Mention", "Link"], "href": "http://example.org/x"},
+            {"no": "type here"}]}
+    copied, index = core.ingest_jsobj(jsobj, vocab.BasicEnv)
+    assert copied["@type"] == "Announce"
+    assert "type" not in copied
+    assert index.type_ids == ("Announce",)
+    assert index.id == "http://example.org/announce/1"
+    assert index.embedded == (
+        core.EmbeddedRef(("actor",), ("Person",), "http://example.org/bob"),
+        core.EmbeddedRef(("object",), ("Create",),
+                         "http://tsyesika.co.uk/act/foo-id-here/"),
+        core.EmbeddedRef(("object", "actor"), ("Person",),
+                         "http://tsyesika.co.uk/"),
+        core.EmbeddedRef(("object", "object"), ("Note",),
+                         "http://tsyesika.co.uk/chat/sup-yo/"),
+        core.EmbeddedRef(("tag", 1), ("Mention", "Link"), None))
+
+    # Paths lead to what they say they do
+    for ref in index.embedded:
+        val = copied
+        for step in ref.path:
+            val = val[step]
+        assert _type_ids_of(val) == ref.type_ids
+
+    asobj = core.ASObj(jsobj)
+    assert asobj.types == ["Announce"]
+    assert asobj.id == "http://example.org/announce/1"
+    assert asobj.embedded == list(index.embedded)
+    # Doesn't change what you get out
+    assert asobj.json() == copied
+
+    # Copying still copies
+    jsobj["tag"][2]["no"] = "changed"
+    assert copied["tag"][2] == {"no": "type here"}
+    assert asobj["tag"][2] == {"no": "type here"}
+
+
+def _type_ids_of(jsobj):
+    type_val = jsobj["@type"]
+    return tuple(type_val) if isinstance(type_val, list) else (type_val,)
+
+
+
+# Structural sharing
+# ==================
+
+def test_embedding_shares_structure():
+    note = vocab.Note("http://example.org/note",
+                      content="hi", tag=[{"@type": "Mention"}])
+    create = vocab.Create("http://example.org/create", object=note)
+    announce = vocab.Announce("http://example.org/announce", object=create)
+
+    note_json = note._ASObj__jsobj
+    create_json = create._ASObj__jsobj
+    announce_json = announce._ASObj__jsobj
+    # Same subtree all the way down
+    assert create_json["object"]["tag"] is note_json["tag"]
+    assert announce_json["object"]["object"]["tag"] is note_json["tag"]
+
+    # But what users get out is still theirs to mess with
+    out = announce.json()
+    out["object"]["object"]["tag"].append("mutation!")
+    assert note.json()["tag"] == [{"@type": "Mention"}]
+    assert announce.json()["object"]["object"]["tag"] == [
+        {"@type": "Mention"}]
+
+    assert [ref.path for ref in announce.embedded] == [
+        ("object",), ("object", "object"), ("object", "object", "tag", 0)]
+
+
+def test_embedding_drops_context():
+    from activipy.demos import checkup
+    checkin = checkup.CheckUpEnv.c.CheckIn("http://example.org/checkin")
+    assert checkin.json()["@context"] == checkup.CHECKUP_EXTRA_CONTEXT_URI
+    wrapper = core.ASObj({"@type": "Create", "object": checkin},
+                         checkup.CheckUpEnv)
+    assert "@context" not in wrapper.json()["object"]
+    assert "@context" in checkin.json()
+
+
+def test_evolve():
+    create = vocab.Create(
+        "http://example.org/create",
+        actor=vocab.Person("http://example.org/alice"),
+        object=vocab.Note("http://example.org/note", content="hi"))
+
+    updated = create.evolve(
+        summary="Alice said hi",
+        id="http://example.org/create2",
+        target={"@type": "Collection", "@id": "http://example.org/c"})
+    assert updated.id == "http://example.org/create2"
+    assert updated["summary"] == "Alice said hi"
+    assert updated["object"]["content"] == "hi"
+    # untouched subtrees are shared
+    assert updated._ASObj__jsobj["object"] is create._ASObj__jsobj["object"]
+    assert [(ref.path, ref.id) for ref in updated.embedded] == [
+        (("actor",), "http://example.org/alice"),
+        (("object",), "http://example.org/note"),
+        (("target",), "http://example.org/c")]
+    # and the original is unchanged
+    assert create.id == "http://example.org/create"
+    assert "summary" not in create.json()
+
+    # Changing something deeper only copies what's along the path
+    deeper = create.evolve_in(["object", "content"], "bye")
+    assert deeper["object"]["content"] == "bye"
+    assert create["object"]["content"] == "hi"
+    assert deeper._ASObj__jsobj["actor"] is create._ASObj__jsobj["actor"]
+    assert deeper.embedded == create.embedded
+
+    # Swapping out a typed object updates the index
+    swapped = create.evolve_in(
+        ["object"], vocab.Article("http://example.org/article"))
+    assert swapped["object"].types == ["Article"]
+    assert swapped.embedded[1] == core.EmbeddedRef(
+        ("object",), ("Article",), "http://example.org/article")
+
+    with pytest.raises(ValueError):
+        create.evolve_in([], "nope")
+    with pytest.raises(ValueError):
+        create.evolve_in(["object", "content", "deeper"], "nope")
+
+
+def test_evolve_embedded_type_and_id():
+    create = vocab.Create(
+        "http://example.org/create",
+        actor=vocab.Person("http://example.org/alice"),
+        object=vocab.Note("http://example.org/note", content="hi",
+                          tag=[vocab.Mention("http://example.org/m")]),
+        target={"name": "untyped"})
+
+    def assert_fresh(evolved):
+        # The index matches what ingesting the same json gives
+        fresh = core.ASObj(evolved.json())
+        assert evolved.embedded == fresh.embedded
+        assert evolved.json() == fresh.json()
+
+    retyped = create.evolve_in(["object", "@type"], "Article")
+    assert retyped["object"].types == ["Article"]
+    assert_fresh(retyped)
+
+    # Aliases are canonicalized at every step of the path
+    renamed = create.evolve_in(["object", "id"], "http://example.org/n2")
+    assert "id" not in renamed.json()["object"]
+    assert renamed["object"].id == "http://example.org/n2"
+    assert_fresh(renamed)
+    assert_fresh(create.evolve_in(["object", "tag", 0, "type"], "Hashtag"))
+    assert_fresh(create.evolve_in(["actor", "type"], ["Person", "Actor"]))
+
+    # Typing an untyped object makes it an embedded one
+    typed = create.evolve_in(["target", "type"], "Collection")
+    assert typed.embedded[-1] == core.EmbeddedRef(
+        ("target",), ("Collection",), None)
+    assert_fresh(typed)
+
+
+
+# Interning
+# =========
+
+def _intern_env(max_size=100):
+    return core.Environment(
+        snapshot=vocab.BasicEnv.snapshot(),
+        intern_table=core.InternTable(max_size=max_size))
+
+
+def test_intern_table():
+    env = _intern_env()
+    actor = {"@type": "Person", "@id": "http://example.org/alice",
+             "name": "Alice"}
+    like1 = core.ASObj({"@type": "Like", "actor": actor,
+                        "object": "http://example.org/note/1"}, env)
+    like2 = core.ASObj({"@type": "Like", "actor": dict(actor),
+                        "object": "http://example.org/note/2"}, env)
+
+    # One shared instance, and its json is shared too
+    assert like1["actor"] is like2["actor"]
+    assert like1._ASObj__jsobj["actor"] == like2._ASObj__jsobj["actor"]
+    assert like1["actor"]["name"] == "Alice"
+    assert like1.embedded == [core.EmbeddedRef(
+        ("actor",), ("Person",), "http://example.org/alice")]
+
+    # Different content means a different object, even with the same id
+    renamed = core.ASObj({"@type": "Like", "actor": dict(
+        actor, name="Alice B.")}, env)
+    assert renamed["actor"] is not like1["actor"]
+    assert renamed["actor"]["name"] == "Alice B."
+
+    # Things nested in lists get interned on the way out too
+    note1 = core.ASObj({"@type": "Note", "tag": [actor]}, env)
+    assert note1["tag"][0] is like1["actor"]
+
+    stats = env.intern_table.stats()
+    assert stats["misses"] == 2
+    assert stats["hits"] >= 4
+    assert env.cache_stats()["intern"] == (stats["hits"], stats["misses"])
+
+    # Without a table, nothing is shared
+    plain1 = core.ASObj({"@type": "Like", "actor": actor})
+    plain2 = core.ASObj({"@type": "Like", "actor": actor})
+    assert plain1["actor"] is not plain2["actor"]
+
+
+def test_intern_table_bounded_and_weak():
+    import gc
+
+    env = _intern_env(max_size=2)
+    kept = []
+    for i in range(10):
+        asobj = core.ASObj(
+            {"@type": "Like",
+             "actor": {"@type": "Person",
+                       "@id": "http://example.org/user/%d" % i}}, env)
+        if i == 0:
+            kept.append(asobj["actor"])
+    gc.collect()
+    # the two most recent, plus the one we're holding onto
+    assert len(env.intern_table) == 3
+    assert len(env.intern_table._recent) == 2
+
+    env.intern_table.clear()
+    assert len(env.intern_table) == 0
+
+
+def test_intern_table_aliases():
+    env = _intern_env()
+    aliased = {"type": "Person", "id": "http://example.org/alice",
+               "icon": {"type": "Image", "url": "http://example.org/a.png"}}
+    canonical = {"@type": "Person", "@id": "http://example.org/alice",
+                 "icon": {"@type": "Image",
+                          "url": "http://example.org/a.png"}}
+    assert (core.InternTable.content_key(aliased) ==
+            core.InternTable.content_key(canonical))
+
+    like1 = core.ASObj({"@type": "Like", "actor": aliased}, env)
+    like2 = core.ASObj({"@type": "Like", "actor": canonical}, env)
+    assert like1["actor"] is like2["actor"]
+    assert env.intern_table.stats()["misses"] == 1
+
+
+def test_intern_table_untyped():
+    # Objects with an id but no type are fine, they just aren't interned
+    env = _intern_env()
+    note = core.ASObj({"@type": "Note", "attributedTo": {
+        "id": "http://example.org/alice", "name": "Alice"}}, env)
+    assert note["attributedTo"] == {
+        "@id": "http://example.org/alice", "name": "Alice"}
+    assert note.embedded == []
+    assert len(env.intern_table) == 0
+
+
+
+# Expansion caching
+# =================
+
+def _expand_counting(monkeypatch):
+    calls = []
+    jsonld = core.get_jsonld()
+    real_expand = jsonld.expand
+    def counting_expand(*args, **kwargs):
+        calls.append(args[0])
+        return real_expand(*args, **kwargs)
+    monkeypatch.setattr(jsonld, "expand", counting_expand)
+    return calls
+
+
+def test_expansion_cache(monkeypatch):
+    calls = _expand_counting(monkeypatch)
+    env = core.Environment(
+        snapshot=vocab.BasicEnv.snapshot(),
+        expansion_cache=core.MemoryExpansionCache(max_size=2))
+    note = {"@type": "Note", "content": "Hello"}
+
+    first = core.ASObj(note, env).expanded()
+    # A separately constructed, equal document hits the cache
+    second = core.ASObj(dict(note), env).expanded()
+    assert first == second
+    assert len(calls) == 1
+    assert env.cache_stats()["expansion"] == (1, 1)
+
+    # We get copies, so mutating them doesn't poison the cache
+    second[0]["@type"].append("http://example.org/Junk")
+    assert core.ASObj(note, env).expanded() == first
+    assert len(calls) == 1
+
+    # Different implied context, different key
+    other_env = core.Environment(
+        snapshot=vocab.BasicEnv.snapshot(),
+        implied_context={"@vocab": "http://example.org/"},
+        expansion_cache=env.expansion_cache)
+    core.ASObj(note, other_env).expanded()
+    assert len(calls) == 2
+
+    # LRU eviction
+    core.ASObj({"@type": "Note", "content": "Bye"}, env).expanded()
+    assert len(env.expansion_cache) == 2
+    core.ASObj(note, env).expanded()
+    assert len(calls) == 4
+
+
+def test_expansion_cache_type_fallback(monkeypatch):
+    calls = _expand_counting(monkeypatch)
+    env = core.Environment(
+        snapshot=vocab.BasicEnv.snapshot(),
+        expansion_cache=core.MemoryExpansionCache())
+    jsobj = {"@context": {"ex": "http://example.org/"},
+             "@type": ["ex:Thing", "Note"]}
+    for _ in range(3):
+        assert core.ASObj(jsobj, env).types_astype == [vocab.Note]
+    assert len(calls) == 1
+
+
+def test_sqlite_expansion_cache(tmpdir, monkeypatch):
+    calls = _expand_counting(monkeypatch)
+    filename = str(tmpdir.join("expansions.db"))
+    snapshot = vocab.BasicEnv.snapshot()
+    docs = [{"@type": "Note", "content": "note %d" % i} for i in range(4)]
+
+    sqlite_cache = core.SqliteExpansionCache(filename, max_size=3)
+    env = core.Environment(snapshot=snapshot, expansion_cache=sqlite_cache)
+    expanded = [core.ASObj(doc, env).expanded() for doc in docs]
+    assert len(calls) == 4
+    assert len(sqlite_cache) == 3
+    sqlite_cache.close()
+
+    # A fresh process (well, cache) picks up where we left off, with
+    # the memory tier in front filled from disk
+    memory_cache = core.MemoryExpansionCache()
+    tiered = core.TieredExpansionCache(
+        memory_cache, core.SqliteExpansionCache(filename, max_size=3))
+    env = core.Environment(snapshot=snapshot, expansion_cache=tiered)
+    assert core.ASObj(docs[3], env).expanded() == expanded[3]
+    assert len(calls) == 4
+    assert len(memory_cache) == 1
+    assert core.ASObj(docs[3], env).expanded() == expanded[3]
+    assert memory_cache.hits == 1
+    # The first one was evicted
+    assert core.ASObj(docs[0], env).expanded() == expanded[0]
+    assert len(calls) == 5
+    assert env.cache_stats()["expansion"] == (2, 1)
+
+
+
+# Batch type filtering
+# ====================
+
+def test_classify():
+    env = vocab.BasicEnv
+    objs = [
+        core.ASObj({"@type": "Note"}),
+        core.ASObj({"@type": "Like"}),
+        "not an asobj",
+        core.ASObj({"@type": "Note", "content": "another"}),
+        core.ASObj({"@context": {"ex": "http://example.org/"},
+                    "@type": ["ex:Thing", "Create"]}),
+        core.ASObj({"@type": "Person"})]
+    filter_types = [vocab.Note, vocab.Activity, vocab.Object, vocab.Create]
+
+    classified = env.classify(objs, filter_types)
+    assert classified == {
+        vocab.Note: [0, 3],
+        vocab.Activity: [1, 4],
+        vocab.Object: [0, 1, 3, 4, 5],
+        vocab.Create: [4]}
+    # Same answers as is_astype, with and without inheritance
+    for inherit in (True, False):
+        masks = env.classify(objs, filter_types, inherit=inherit, masks=True)
+        for astype in filter_types:
+            assert masks[astype] == [
+                env.is_astype(obj, astype, inherit=inherit) for obj in objs]
+
+    assert env.filter_by_type(objs, vocab.Activity) == [1, 4]
+    assert env.filter_by_type(objs, vocab.Activity, inherit=False) == []
+    assert env.filter_by_type(objs, vocab.Note, masks=True) == [
+        True, False, False, True, False, False]
+    assert env.filter_by_type([], vocab.Note) == []
@@ -0,0 +1,187 @@
+## Activipy --- ActivityStreams 2.0 implementation and validator for Python
+## Copyright © 2015 Christopher Allan Webber <cwebber@dustycloud.org>
+##
+## This file is part of Activipy, which is GPLv3+ or Apache v2, your option
+## (see COPYING); since that means effectively Apache v2 here's those headers
+##
+## Apache v2 header:
+##   Licensed under the Apache License, Version 2.0 (the "License");
+##   you may not use this file except in compliance with the License.
+##   You may obtain a copy of the License at
+##
+##       http://www.apache.org/licenses/LICENSE-2.0
+##
+##   Unless required by applicable law or agreed to in writing, software
+##   distributed under the License is distributed on an "AS IS" BASIS,
+##   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##   See the License for the specific language governing permissions and
+##   limitations under the License.
+
+
+import pytest
+
+from activipy.demos import dbm
+
+
+@pytest.fixture
+def db(tmpdir):
+    db = dbm.JsonDBM.open(str(tmpdir.join("test.db")))
+    yield db
+    db.close()
+
+
+def test_dbm_list(db):
+    things = dbm.DbmList(db, "@index/things", segment_size=4)
+    assert len(things) == 0
+    assert things.page() == []
+
+    things.extend(range(10))
+    things.append(10)
+    assert len(things) == 11
+    assert list(things) == list(range(11))
+    assert things._meta()["sizes"] == [4, 4, 3]
+    assert things.page(3, 4) == [3, 4, 5, 6]
+    assert things.page(0, 3, reverse=True) == [10, 9, 8]
+    assert things.page(9, 5, reverse=True) == [1, 0]
+    assert things.page(20, 5) == []
+
+    assert things.remove(5) == 1
+    assert things.remove(42) == 0
+    assert things.remove(4) == 1
+    assert things.remove(6) == 1
+    assert things.remove(7) == 1
+    # the emptied segment goes away
+    assert things._meta()["sizes"] == [4, 3]
+    assert list(things) == [0, 1, 2, 3, 8, 9, 10]
+
+    things.trim(5)
+    assert list(things) == [2, 3, 8, 9, 10]
+    things.trim(2)
+    assert list(things) == [9, 10]
+
+    things.clear()
+    assert len(things) == 0
+    assert "@index/things" not in db
+
+
+class RecordingIndex(dbm.DbmIndex):
+    def __init__(self):
+        self.events = []
+
+    def saved(self, db, id, new_json, old_json):
+        self.events.append(("saved", id, new_json, old_json))
+
+    def deleted(self, db, id, old_json):
+        self.events.append(("deleted", id, old_json))
+
+
+def test_dbm_index_hooks(db):
+    index = RecordingIndex()
+    db.indexes.append(index)
+    env = dbm.DbmNormalizedEnv
+
+    note = env.c.Note("http://example.org/note/1", content="hi")
+    create = env.c.Create(
+        "http://example.org/create/1",
+        actor="http://example.org/alice", object=note)
+    env.m.save(create, db)
+    assert index.events == [
+        ("saved", "http://example.org/note/1", note.json(), None),
+        ("saved", "http://example.org/create/1",
+         dict(create.json(), object="http://example.org/note/1"), None)]
+
+    del index.events[:]
+    edited = note.evolve(content="bye")
+    env.m.save(edited, db)
+    env.m.delete(edited, db)
+    assert index.events == [
+        ("saved", "http://example.org/note/1", edited.json(), note.json()),
+        ("deleted", "http://example.org/note/1", edited.json())]
+
+
+def test_dbm_sorted_list(db):
+    import random
+
+    values = [[i // 3, "id-%03d" % i] for i in range(100)]
+    shuffled = list(values)
+    random.Random(4).shuffle(shuffled)
+
+    sorted_list = dbm.DbmSortedList(db, "@index/sorted", segment_size=8)
+    for value in shuffled:
+        assert sorted_list.add(value)
+    assert not sorted_list.add(values[10])
+    assert len(sorted_list) == 100
+    assert list(sorted_list.iter_from()) == values
+    assert max(sorted_list._meta()["sizes"]) <= 8
+
+    assert values[50] in sorted_list
+    assert [5, "nope"] not in sorted_list
+    assert sorted_list.page(values[49], 3) == values[50:53]
+    assert sorted_list.page(values[49], 3, inclusive=True) == values[49:52]
+    assert sorted_list.page(values[49], 3, reverse=True) == [
+        values[48], values[47], values[46]]
+    assert sorted_list.page([10, ""], 2) == values[30:32]
+    assert sorted_list.page(None, 2, reverse=True) == [values[99], values[98]]
+    assert sorted_list.page(values[0], 2, reverse=True) == []
+
+    version = sorted_list.version()
+    for value in shuffled[:90]:
+        assert sorted_list.remove(value)
+    assert not sorted_list.remove(shuffled[0])
+    assert sorted_list.version() > version
+    assert list(sorted_list.iter_from()) == sorted(shuffled[90:])
+    for value in shuffled[90:]:
+        sorted_list.remove(value)
+    assert "@index/sorted" not in db
+
+
+def test_timestamp():
+    assert dbm.timestamp("1970-01-01T00:00:01.5Z") == 1500000
+    assert dbm.timestamp("2015-10-01T14:00:00+02:00") == dbm.timestamp(
+        "2015-10-01T12:00:00")
+    assert dbm.timestamp("yesterday-ish") is None
+    assert dbm.timestamp(None) is None
+
+
+def test_dbm_int_list_and_id_table(db):
+    ids = dbm.DbmIdTable(db)
+    numbers = [ids.number("http://example.org/%d" % i) for i in range(5)]
+    assert numbers == [0, 1, 2, 3, 4]
+    assert ids.number("http://example.org/3") == 3
+    assert ids.number("http://example.org/new", create=False) is None
+    assert ids.ids([4, 0]) == ["http://example.org/4", "http://example.org/0"]
+
+    ints = dbm.DbmIntList(db, "@index/ints", segment_size=3)
+    ints.extend([2 ** 40, -1, 7, 8])
+    assert list(ints) == [2 ** 40, -1, 7, 8]
+    assert ints.page(0, 2, reverse=True) == [8, 7]
+    # Stored packed, not as json lists
+    assert isinstance(db["@index/ints\x000"], str)
+
+
+def test_dbm_fetch_denormalized_many(db):
+    env = dbm.DbmNormalizedEnv
+    note = env.c.Note("http://example.org/note/1", content="hi")
+    alice = env.c.Person("http://example.org/alice", name="Alice")
+    for i in range(2):
+        env.m.save(env.c.Like("http://example.org/like/%d" % i,
+                              actor=alice, object=note), db)
+
+    likes = dbm.dbm_fetch_denormalized_many(
+        ["http://example.org/like/1", "http://example.org/nope",
+         "http://example.org/like/0"], db, env)
+    assert [like.id for like in likes] == [
+        "http://example.org/like/1", "http://example.org/like/0"]
+    for like in likes:
+        assert like["actor"]["name"] == "Alice"
+        assert like["object"]["content"] == "hi"
+    assert likes[0].json() == dbm.dbm_fetch_denormalized(
+        "http://example.org/like/1", db, env).json()
+
+    # It goes through the env's denormalize method, so only
+    # activities get their actor/object/target filled in
+    env.m.save(env.c.Object("http://example.org/thing",
+                            target="http://example.org/note/1"), db)
+    [thing] = dbm.dbm_fetch_denormalized_many(
+        ["http://example.org/thing"], db, env)
+    assert thing["target"] == "http://example.org/note/1"
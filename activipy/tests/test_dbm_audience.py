@@ -0,0 +1,130 @@
+## Activipy --- ActivityStreams 2.0 implementation and validator for Python
+## Copyright © 2015 Christopher Allan Webber <cwebber@dustycloud.org>
+##
+## This file is part of Activipy, which is GPLv3+ or Apache v2, your option
+## (see COPYING); since that means effectively Apache v2 here's those headers
+##
+## Apache v2 header:
+##   Licensed under the Apache License, Version 2.0 (the "License");
+##   you may not use this file except in compliance with the License.
+##   You may obtain a copy of the License at
+##
+##       http://www.apache.org/licenses/LICENSE-2.0
+##
+##   Unless required by applicable law or agreed to in writing, software
+##   distributed under the License is distributed on an "AS IS" BASIS,
+##   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##   See the License for the specific language governing permissions and
+##   limitations under the License.
+
+
+import pytest
+
+from activipy.demos import dbm
+from activipy.demos.dbm_audience import AudienceResolver
+from activipy.demos.dbm_paging import KeysetCollection
+
+ENV = dbm.DbmEnv
+EX = "http://example.org/"
+
+
+@pytest.fixture
+def db(tmpdir):
+    db = dbm.JsonDBM.open(str(tmpdir.join("test.db")))
+    yield db
+    db.close()
+
+
+def _person(db, name, shared=True):
+    person = {"@type": "Person", "@id": EX + name,
+              "inbox": EX + name + "/inbox",
+              "followers": EX + name + "/followers"}
+    if shared:
+        person["endpoints"] = {"sharedInbox": EX + "shared"}
+    ENV.m.save(ENV.c.Person(**person), db)
+
+
+def test_audience_resolver(db):
+    resolver = AudienceResolver(ENV)
+    db.indexes.append(resolver)
+    for name in ("alice", "bob", "carol"):
+        _person(db, name)
+    _person(db, "dave", shared=False)
+    _person(db, "erin", shared=False)
+
+    # alice's followers, paged
+    ENV.m.save(ENV.c.OrderedCollection(
+        EX + "alice/followers", first=EX + "alice/followers/1"), db)
+    ENV.m.save(ENV.c.OrderedCollectionPage(
+        EX + "alice/followers/1", partOf=EX + "alice/followers",
+        orderedItems=[EX + "bob", EX + "dave"],
+        next=EX + "alice/followers/2"), db)
+    ENV.m.save(ENV.c.OrderedCollectionPage(
+        EX + "alice/followers/2", partOf=EX + "alice/followers",
+        orderedItems=[EX + "carol", EX + "alice", EX + "remote"]), db)
+    # A collection with a collection in it
+    ENV.m.save(ENV.c.Collection(
+        EX + "friends", items=[{"@type": "Person", "@id": EX + "erin"},
+                               EX + "alice/followers"]), db)
+
+    note = ENV.c.Create(
+        EX + "create/1", actor=EX + "alice",
+        to=["https://www.w3.org/ns/activitystreams#Public"],
+        cc=[EX + "alice/followers", EX + "bob"], bcc=EX + "erin")
+    recipients = resolver.resolve(db, note)
+    assert recipients.actors == frozenset(
+        [EX + "bob", EX + "carol", EX + "dave", EX + "erin", EX + "remote"])
+    assert recipients.inboxes == frozenset(
+        [EX + "shared", EX + "dave/inbox", EX + "erin/inbox"])
+
+    # Cached, including as part of the other collection
+    recipients = resolver.resolve(db, {"to": EX + "friends"},
+                                  exclude_actor=False)
+    assert recipients.actors == frozenset(
+        [EX + "alice", EX + "bob", EX + "carol", EX + "dave", EX + "erin",
+         EX + "remote"])
+    assert (resolver.hits, resolver.misses) == (1, 2)
+    resolver.resolve(db, note)
+    assert (resolver.hits, resolver.misses) == (2, 2)
+
+    # Changing a page invalidates everything built from it
+    ENV.m.save(ENV.c.OrderedCollectionPage(
+        EX + "alice/followers/2", partOf=EX + "alice/followers",
+        orderedItems=[EX + "carol"]), db)
+    assert EX + "remote" not in resolver.resolve(db, note).actors
+    assert EX + "remote" not in resolver.resolve(
+        db, {"to": EX + "friends"}).actors
+
+
+def test_audience_invalidation(db):
+    resolver = AudienceResolver(ENV)
+    db.indexes.append(resolver)
+    _person(db, "alice", shared=False)
+    _person(db, "bob", shared=False)
+    followers = KeysetCollection(db, EX + "alice/followers")
+    followers.add(EX + "bob")
+
+    activity = {"actor": EX + "alice", "to": EX + "alice/followers"}
+    assert resolver.resolve(db, activity).inboxes == frozenset(
+        [EX + "bob/inbox"])
+
+    # Somebody (say, an apply method) updates the membership, then
+    # the Follow gets saved
+    followers.add(EX + "carol")
+    follow = ENV.c.Follow(EX + "follow/1", actor=EX + "carol",
+                          object=EX + "alice")
+    ENV.m.save(follow, db)
+    assert resolver.resolve(db, activity).actors == frozenset(
+        [EX + "bob", EX + "carol"])
+
+    followers.remove(EX + "carol")
+    ENV.m.save(ENV.c.Undo(EX + "undo/1", actor=EX + "carol",
+                          object=EX + "follow/1"), db)
+    assert resolver.resolve(db, activity).actors == frozenset([EX + "bob"])
+
+    for activity_type in ("Add", "Remove"):
+        followers.add(EX + activity_type)
+        ENV.m.save(getattr(ENV.c, activity_type)(
+            EX + activity_type.lower(), object=EX + activity_type,
+            target=EX + "alice/followers"), db)
+        assert EX + activity_type in resolver.resolve(db, activity).actors
@@ -0,0 +1,90 @@
+## Activipy --- ActivityStreams 2.0 implementation and validator for Python
+## Copyright © 2015 Christopher Allan Webber <cwebber@dustycloud.org>
+##
+## This file is part of Activipy, which is GPLv3+ or Apache v2, your option
+## (see COPYING); since that means effectively Apache v2 here's those headers
+##
+## Apache v2 header:
+##   Licensed under the Apache License, Version 2.0 (the "License");
+##   you may not use this file except in compliance with the License.
+##   You may obtain a copy of the License at
+##
+##       http://www.apache.org/licenses/LICENSE-2.0
+##
+##   Unless required by applicable law or agreed to in writing, software
+##   distributed under the License is distributed on an "AS IS" BASIS,
+##   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##   See the License for the specific language governing permissions and
+##   limitations under the License.
+
+
+
+from activipy.demos import dbm
+from activipy.demos.dbm_counters import EngagementCounters
+
+ENV = dbm.DbmNormalizedEnv
+EX = "http://example.org/"
+NOTE = EX + "note/1"
+
+
+def open_db(tmpdir, counters):
+    return dbm.JsonDBM.open(str(tmpdir.join("test.db")), indexes=[counters])
+
+
+def counts(likes=0, shares=0, replies=0):
+    return {"likes": likes, "shares": shares, "replies": replies}
+
+
+def test_counters(tmpdir):
+    counters = EngagementCounters(ENV)
+    db = open_db(tmpdir, counters)
+    ENV.m.save(ENV.c.Note(NOTE, content="Root beer floats?"), db)
+    for i in range(3):
+        ENV.m.save(ENV.c.Like(EX + "like/%d" % i, object=NOTE), db)
+    # Saving the same activity again doesn't count it twice
+    ENV.m.save(ENV.c.Like(EX + "like/0", object=NOTE), db)
+    ENV.m.save(ENV.c.Announce(EX + "announce/1", object=NOTE), db)
+    ENV.m.save(ENV.c.Create(EX + "create/1", object=ENV.c.Note(
+        EX + "reply/1", inReplyTo=NOTE, content="Yes!")), db)
+    ENV.m.save(ENV.c.Create(EX + "create/2", object=ENV.c.Note(
+        EX + "reply/2", inReplyTo=EX + "reply/1")), db)
+    assert counters.counts(db, NOTE) == counts(3, 1, 1)
+    assert counters.counts_many(db, [NOTE, EX + "reply/1", EX + "nope"]) == [
+        counts(3, 1, 1), counts(replies=1), counts()]
+
+    # Undo takes it off, and undoing the Undo puts it back
+    ENV.m.save(ENV.c.Undo(EX + "undo/1", object=EX + "like/1"), db)
+    ENV.m.save(ENV.c.Undo(EX + "undo/2",
+                          object=ENV.c.Like(EX + "like/2", object=NOTE)), db)
+    assert counters.counts(db, NOTE) == counts(1, 1, 1)
+    ENV.m.delete(ENV.c.Undo(EX + "undo/1"), db)
+    assert counters.counts(db, NOTE) == counts(2, 1, 1)
+    # Deleting an undone Like doesn't take it off twice
+    ENV.m.delete(ENV.c.Like(EX + "like/2"), db)
+    assert counters.counts(db, NOTE) == counts(2, 1, 1)
+
+    # So do Deletes, of the activity or of the reply, and deleting
+    # from the store
+    ENV.m.save(ENV.c.Delete(EX + "delete/1", object=EX + "reply/1"), db)
+    ENV.m.save(ENV.c.Delete(EX + "delete/2", object=EX + "announce/1"), db)
+    ENV.m.delete(ENV.c.Like(EX + "like/0"), db)
+    assert counters.counts(db, NOTE) == counts(likes=1)
+    ENV.m.delete(ENV.c.Note(EX + "reply/2"), db)
+    assert counters.counts(db, EX + "reply/1") == counts()
+    db.close()
+
+
+def test_counters_batched(tmpdir):
+    counters = EngagementCounters(ENV, batch_size=10, max_delay=60)
+    db = open_db(tmpdir, counters)
+    for i in range(15):
+        ENV.m.save(ENV.c.Like(EX + "like/%d" % i, object=NOTE), db)
+    # Ten have been written out, and reads see all fifteen
+    assert db[counters._counts_key(NOTE)] == {"likes": 10}
+    assert counters.counts(db, NOTE) == counts(likes=15)
+    db.close()
+
+    counters = EngagementCounters(ENV)
+    db = open_db(tmpdir, counters)
+    assert counters.counts(db, NOTE) == counts(likes=15)
+    db.close()
@@ -0,0 +1,140 @@
+## Activipy --- ActivityStreams 2.0 implementation and validator for Python
+## Copyright © 2015 Christopher Allan Webber <cwebber@dustycloud.org>
+##
+## This file is part of Activipy, which is GPLv3+ or Apache v2, your option
+## (see COPYING); since that means effectively Apache v2 here's those headers
+##
+## Apache v2 header:
+##   Licensed under the Apache License, Version 2.0 (the "License");
+##   you may not use this file except in compliance with the License.
+##   You may obtain a copy of the License at
+##
+##       http://www.apache.org/licenses/LICENSE-2.0
+##
+##   Unless required by applicable law or agreed to in writing, software
+##   distributed under the License is distributed on an "AS IS" BASIS,
+##   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##   See the License for the specific language governing permissions and
+##   limitations under the License.
+
+
+import pytest
+
+from activipy import vocab
+from activipy.demos import dbm
+from activipy.demos.checkup import CheckIn, CheckUpNSEnv
+from activipy.demos.dbm_geo import GeoIndex, distance
+
+ENV = CheckUpNSEnv
+EX = "http://example.org/"
+
+# Some places, with their latitude and longitude
+PLACES = {
+    "big-ben": (51.5007, -0.1246),
+    "london-eye": (51.5033, -0.1196),
+    "tower-bridge": (51.5055, -0.0754),
+    "eiffel-tower": (48.8584, 2.2945),
+    "suva": (-18.1416, 178.4419),
+    "apia": (-13.8333, -171.7667)}
+
+
+@pytest.fixture
+def db_places(tmpdir):
+    places = GeoIndex(ENV, cell_size=0.05)
+    db = dbm.JsonDBM.open(str(tmpdir.join("test.db")), indexes=[places])
+    for name, (lat, lon) in PLACES.items():
+        dbm.dbm_save(ENV.c.Place(EX + name, latitude=lat, longitude=lon,
+                                 name=name), db)
+    yield db, places
+    db.close()
+
+
+def _check_in(db, num, place, day):
+    location = EX + place if num % 2 else {
+        "@type": "Place", "latitude": PLACES[place][0],
+        "longitude": PLACES[place][1]}
+    dbm.dbm_save(ENV.c.CheckIn(
+        EX + "checkin/%d" % num, actor=EX + "alice", location=location,
+        published="2015-10-%02dT12:00:00Z" % day), db)
+
+
+def test_distance():
+    assert distance(0, 0, 0, 0) == 0
+    assert 340000 < distance(*(PLACES["big-ben"] +
+                               PLACES["eiffel-tower"])) < 345000
+
+
+def test_geo_index(db_places):
+    db, places = db_places
+    for num, (place, day) in enumerate([
+            ("big-ben", 1), ("london-eye", 2), ("tower-bridge", 3),
+            ("eiffel-tower", 4), ("big-ben", 5)]):
+        _check_in(db, num, place, day)
+
+    # Things near Big Ben
+    nearby = places.nearby(db, 51.5007, -0.1246, 500)
+    # (ties go by id)
+    assert [id for id, meters in nearby] == [
+        EX + "big-ben", EX + "checkin/0", EX + "checkin/4",
+        EX + "checkin/1", EX + "london-eye"]
+    assert nearby[0][1] == 0
+    assert 400 < nearby[-1][1] < 500
+
+    # ... of a given type, in a time window
+    assert [id for id, meters in places.nearby(
+        db, 51.5007, -0.1246, 500, astype=CheckIn,
+        start="2015-10-02T00:00:00Z")] == [EX + "checkin/4", EX + "checkin/1"]
+    # (CheckIn is an Arrive, which is an Activity)
+    assert [id for id, meters in places.nearby(
+        db, 51.5007, -0.1246, 5000, astype=vocab.Activity,
+        end="2015-10-02T12:00:00Z")] == [EX + "checkin/0", EX + "checkin/1"]
+    assert [id for id, meters in places.nearby(
+        db, 51.5007, -0.1246, 5000, astype=vocab.Place)] == [
+            EX + "big-ben", EX + "london-eye", EX + "tower-bridge"]
+    assert places.nearby(db, 0, 0, 100000) == []
+
+    # Bounding boxes, newest first
+    assert places.within(db, 51.4, -0.2, 51.6, 0, astype=CheckIn) == [
+        EX + "checkin/4", EX + "checkin/2", EX + "checkin/1",
+        EX + "checkin/0"]
+    assert places.within(db, 48, 2, 49, 3) == [
+        EX + "checkin/3", EX + "eiffel-tower"]
+
+    # Moves and deletes
+    _check_in(db, 4, "eiffel-tower", 5)
+    assert EX + "checkin/4" in places.within(db, 48, 2, 49, 3)
+    assert EX + "checkin/4" not in places.within(db, 51.4, -0.2, 51.6, 0)
+    dbm.dbm_delete(ENV.c.CheckIn(EX + "checkin/4"), db)
+    assert places.within(db, 48, 2, 49, 3) == [
+        EX + "checkin/3", EX + "eiffel-tower"]
+
+
+def test_geo_place_moved(db_places):
+    # Entries come out where they went in, even if the Place moved
+    db, places = db_places
+    _check_in(db, 1, "big-ben", 1)
+    dbm.dbm_save(ENV.c.Place(EX + "big-ben", latitude=48.8584,
+                             longitude=2.2945, name="big-ben"), db)
+    assert places.within(db, 51.4, -0.2, 51.6, 0, astype=CheckIn) == [
+        EX + "checkin/1"]
+    _check_in(db, 1, "london-eye", 2)
+    _check_in(db, 3, "big-ben", 3)
+    dbm.dbm_delete(ENV.c.CheckIn(EX + "checkin/3"), db)
+    assert places.within(db, 51.4, -0.2, 51.6, 0, astype=CheckIn) == [
+        EX + "checkin/1"]
+    assert set(places.within(db, 48, 2, 49, 3)) == {
+        EX + "eiffel-tower", EX + "big-ben"}
+    dbm.dbm_delete(ENV.c.CheckIn(EX + "checkin/1"), db)
+    assert places.within(db, -90, -180, 90, 180, astype=CheckIn) == []
+
+
+def test_geo_antimeridian(db_places):
+    db, places = db_places
+    assert places.within(db, -20, 178, -10, -171) == [
+        EX + "apia", EX + "suva"]
+    assert places.within(db, -20, 170, -10, 179) == [EX + "suva"]
+    # Suva to Apia is about 1150km, the short way
+    assert [id for id, meters in places.nearby(
+        db, -18.1416, 178.4419, 1200000)] == [EX + "suva", EX + "apia"]
+    assert places.nearby(db, -18.1416, 178.4419, 1000000) == [
+        (EX + "suva", 0)]
@@ -0,0 +1,139 @@
+## Activipy --- ActivityStreams 2.0 implementation and validator for Python
+## Copyright © 2015 Christopher Allan Webber <cwebber@dustycloud.org>
+##
+## This file is part of Activipy, which is GPLv3+ or Apache v2, your option
+## (see COPYING); since that means effectively Apache v2 here's those headers
+##
+## Apache v2 header:
+##   Licensed under the Apache License, Version 2.0 (the "License");
+##   you may not use this file except in compliance with the License.
+##   You may obtain a copy of the License at
+##
+##       http://www.apache.org/licenses/LICENSE-2.0
+##
+##   Unless required by applicable law or agreed to in writing, software
+##   distributed under the License is distributed on an "AS IS" BASIS,
+##   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##   See the License for the specific language governing permissions and
+##   limitations under the License.
+
+
+import json
+
+import pytest
+
+from activipy.demos import dbm, dbm_membership
+from activipy.demos.dbm_audience import AudienceResolver
+from activipy.demos.dbm_membership import (
+    MembershipEnv, MembershipIndex, MembershipSet)
+
+ENV = MembershipEnv
+EX = "http://example.org/"
+
+
+@pytest.fixture
+def db(tmpdir):
+    db = dbm.JsonDBM.open(str(tmpdir.join("test.db")),
+                          indexes=[MembershipIndex()])
+    yield db
+    db.close()
+
+
+def _activities():
+    return [
+        ENV.c.Person(EX + "alice", followers=EX + "alice/followers"),
+        ENV.c.Follow(EX + "follow/1", actor=EX + "bob",
+                     object=EX + "alice", published="2015-01-01T00:00:00Z"),
+        ENV.c.Follow(EX + "follow/2", actor=EX + "carol",
+                     object=EX + "alice", published="2015-01-02T00:00:00Z"),
+        ENV.c.Follow(EX + "follow/3", actor=EX + "dave",
+                     object=EX + "alice", published="2015-01-03T00:00:00Z"),
+        ENV.c.Undo(EX + "undo/1", actor=EX + "carol",
+                   object=EX + "follow/2", published="2015-01-04T00:00:00Z"),
+        ENV.c.Add(EX + "add/1", actor=EX + "alice",
+                  object=[EX + "note/1", EX + "note/2"],
+                  target=EX + "alice/featured",
+                  published="2015-01-05T00:00:00Z"),
+        ENV.c.Remove(EX + "remove/1", actor=EX + "alice",
+                     object=EX + "note/1", target=EX + "alice/featured",
+                     published="2015-01-06T00:00:00Z"),
+        ENV.c.Undo(EX + "undo/2", actor=EX + "alice",
+                   object={"@type": "Remove", "object": EX + "note/1",
+                           "target": EX + "alice/featured"},
+                   published="2015-01-07T00:00:00Z")]
+
+
+def test_membership(db):
+    resolver = AudienceResolver(ENV)
+    db.indexes.append(resolver)
+    for activity in _activities()[:4]:
+        ENV.m.save(activity, db)
+
+    followers = MembershipSet(db, EX + "alice/followers")
+    assert len(followers) == 3
+    assert followers.contains(EX + "carol")
+    assert EX + "erin" not in followers
+    assert followers.members() == [EX + "bob", EX + "carol", EX + "dave"]
+    assert followers.members(count=2) == [EX + "bob", EX + "carol"]
+    assert followers.members(after=EX + "carol", count=2) == [EX + "dave"]
+    assert MembershipSet(db, EX + "bob/following").members() == [
+        EX + "alice"]
+    assert resolver.resolve(
+        db, {"to": EX + "alice/followers"}).actors == frozenset(
+            [EX + "bob", EX + "carol", EX + "dave"])
+
+    for activity in _activities()[4:]:
+        ENV.m.save(activity, db)
+    # Saving something again doesn't apply it again
+    ENV.m.save(_activities()[5], db)
+
+    assert followers.members() == [EX + "bob", EX + "dave"]
+    assert MembershipSet(db, EX + "carol/following").members() == []
+    assert MembershipSet(db, EX + "alice/featured").members() == [
+        EX + "note/1", EX + "note/2"]
+    # The cached expansion was invalidated by the Undo
+    assert resolver.resolve(
+        db, {"to": EX + "alice/followers"}).actors == frozenset(
+            [EX + "bob", EX + "dave"])
+
+
+def test_rebuild(db, tmpdir):
+    for activity in _activities():
+        ENV.m.save(activity, db)
+    expected = {
+        collection: MembershipSet(db, EX + collection).members()
+        for collection in ("alice/followers", "alice/featured",
+                           "bob/following", "carol/following")}
+
+    # Mess things up, then rebuild from what's in the store
+    MembershipSet(db, EX + "alice/followers").add(EX + "mallory")
+    MembershipSet(db, EX + "bogus").add(EX + "mallory")
+    assert dbm_membership.rebuild(
+        db, ENV, dbm_membership.stored_activities(db, ENV)) == 7
+    for collection, members in expected.items():
+        assert MembershipSet(db, EX + collection).members() == members
+    assert len(MembershipSet(db, EX + "bogus")) == 0
+
+    # Or from a log file, via the command line
+    log = tmpdir.join("log.ndjson")
+    log.write("\n".join(json.dumps(activity.json())
+                        for activity in _activities()[1:4]))
+    db.close()
+    dbm_membership.main([str(tmpdir.join("test.db")), str(log)])
+    db = dbm.JsonDBM.open(str(tmpdir.join("test.db")))
+    try:
+        assert MembershipSet(db, EX + "alice/followers").members() == [
+            EX + "bob", EX + "carol", EX + "dave"]
+        assert MembershipSet(db, EX + "alice/featured").members() == []
+    finally:
+        db.close()
+
+
+def test_membership_registry(db):
+    # Emptying and refilling a set doesn't grow the registry
+    followers = MembershipSet(db, EX + "alice/followers")
+    for i in range(5):
+        followers.add(EX + "bob")
+        followers.remove(EX + "bob")
+    assert list(dbm_membership._registry(db).iter_from()) == [
+        EX + "alice/followers"]
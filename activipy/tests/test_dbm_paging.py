@@ -0,0 +1,125 @@
+## Activipy --- ActivityStreams 2.0 implementation and validator for Python
+## Copyright © 2015 Christopher Allan Webber <cwebber@dustycloud.org>
+##
+## This file is part of Activipy, which is GPLv3+ or Apache v2, your option
+## (see COPYING); since that means effectively Apache v2 here's those headers
+##
+## Apache v2 header:
+##   Licensed under the Apache License, Version 2.0 (the "License");
+##   you may not use this file except in compliance with the License.
+##   You may obtain a copy of the License at
+##
+##       http://www.apache.org/licenses/LICENSE-2.0
+##
+##   Unless required by applicable law or agreed to in writing, software
+##   distributed under the License is distributed on an "AS IS" BASIS,
+##   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##   See the License for the specific language governing permissions and
+##   limitations under the License.
+
+
+import pytest
+
+from activipy.demos import dbm
+from activipy.demos.dbm_paging import (
+    CollectionPager, KeysetCollection, OutboxIndex, decode_cursor,
+    encode_cursor)
+
+ENV = dbm.DbmNormalizedEnv
+ALICE = "http://example.org/alice"
+
+
+@pytest.fixture
+def db(tmpdir):
+    db = dbm.JsonDBM.open(str(tmpdir.join("test.db")),
+                          indexes=[OutboxIndex(segment_size=4)])
+    yield db
+    db.close()
+
+
+def _save_notes(db, count):
+    ENV.m.save(ENV.c.Person(ALICE, outbox=ALICE + "/out"), db)
+    for i in range(count):
+        ENV.m.save(ENV.c.Create(
+            "http://example.org/create/%02d" % i, actor=ALICE,
+            published="2015-10-%02dT12:00:00Z" % (i + 1),
+            object=ENV.c.Note("http://example.org/note/%02d" % i)), db)
+
+
+def test_collection_pages(db):
+    _save_notes(db, 11)
+    pager = CollectionPager(ENV, page_size=4, segment_size=4)
+    outbox = ALICE + "/out"
+
+    collection = pager.collection(db, outbox)
+    assert collection["totalItems"] == 11
+    assert collection["first"] == outbox + "?page=true"
+
+    # Walk all the way back...
+    seen = []
+    page = pager.page_for_url(db, collection["first"])
+    assert "prev" not in page.json()
+    while True:
+        assert page["partOf"] == outbox
+        seen.extend(page["orderedItems"])
+        if "next" not in page.json():
+            break
+        page = pager.page_for_url(db, page["next"])
+    assert seen == ["http://example.org/create/%02d" % i
+                    for i in reversed(range(11))]
+    assert len(page["orderedItems"]) == 3
+
+    # ... and forward again
+    page = pager.page_for_url(db, page["prev"])
+    assert page["orderedItems"] == seen[4:8]
+    page = pager.page_for_url(db, page["prev"])
+    assert page["orderedItems"] == seen[:4]
+    assert "prev" not in page.json()
+
+    assert list(KeysetCollection(db, outbox).members()) == seen
+    assert decode_cursor(page["next"].split("before=")[1])[1] == seen[3]
+    with pytest.raises(ValueError):
+        pager.page(db, outbox, before="junk")
+    # Well formed json, but not a sort key
+    for key in (["x", "y"], [1, 2], [True, "x"], [1.5, "x"]):
+        with pytest.raises(ValueError):
+            pager.page_for_url(
+                db, outbox + "?before=" + encode_cursor(key))
+
+
+def test_first_page_cache(db):
+    _save_notes(db, 3)
+    pager = CollectionPager(ENV, page_size=2)
+    outbox = ALICE + "/out"
+    first = pager.page(db, outbox)
+    assert first["orderedItems"] == [
+        "http://example.org/create/02", "http://example.org/create/01"]
+    assert pager.page(db, outbox).json() == first.json()
+    assert list(pager._first_pages) == [outbox]
+
+    # New activity, new first page
+    ENV.m.save(ENV.c.Like(
+        "http://example.org/like/1", actor=ALICE,
+        published="2015-11-01T00:00:00Z",
+        object="http://example.org/note/00"), db)
+    assert pager.page(db, outbox)["orderedItems"] == [
+        "http://example.org/like/1", "http://example.org/create/02"]
+
+    ENV.m.delete(ENV.c.Like("http://example.org/like/1"), db)
+    ENV.m.delete(ENV.c.Create("http://example.org/create/02"), db)
+    assert pager.page(db, outbox)["orderedItems"] == [
+        "http://example.org/create/01", "http://example.org/create/00"]
+
+
+def test_first_page_cache_emptied(db):
+    # An emptied and refilled collection doesn't reuse old versions
+    pager = CollectionPager(ENV)
+    outbox = "http://example.org/x/outbox"
+    collection = KeysetCollection(db, outbox)
+    collection.add("http://example.org/x/a")
+    assert pager.page(db, outbox)["orderedItems"] == [
+        "http://example.org/x/a"]
+    collection.remove("http://example.org/x/a")
+    collection.add("http://example.org/x/b")
+    assert pager.page(db, outbox)["orderedItems"] == [
+        "http://example.org/x/b"]
@@ -0,0 +1,130 @@
+## Activipy --- ActivityStreams 2.0 implementation and validator for Python
+## Copyright © 2015 Christopher Allan Webber <cwebber@dustycloud.org>
+##
+## This file is part of Activipy, which is GPLv3+ or Apache v2, your option
+## (see COPYING); since that means effectively Apache v2 here's those headers
+##
+## Apache v2 header:
+##   Licensed under the Apache License, Version 2.0 (the "License");
+##   you may not use this file except in compliance with the License.
+##   You may obtain a copy of the License at
+##
+##       http://www.apache.org/licenses/LICENSE-2.0
+##
+##   Unless required by applicable law or agreed to in writing, software
+##   distributed under the License is distributed on an "AS IS" BASIS,
+##   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##   See the License for the specific language governing permissions and
+##   limitations under the License.
+
+
+
+import pytest
+
+from activipy.demos import dbm
+from activipy.demos.dbm_polls import PollTallies
+
+ENV = dbm.DbmEnv
+EX = "http://example.org/"
+POLL = EX + "question/1"
+SURVEY = EX + "question/2"
+
+
+@pytest.fixture
+def db_polls(tmpdir):
+    polls = PollTallies(ENV, segment_size=4)
+    db = dbm.JsonDBM.open(str(tmpdir.join("test.db")), indexes=[polls])
+    yield db, polls
+    db.close()
+
+
+def vote(db, n, question, option, voter):
+    ENV.m.save(ENV.c.Note(EX + "vote/%d" % n, inReplyTo=question,
+                          name=option, attributedTo=EX + voter), db)
+
+
+def test_one_of(db_polls):
+    db, polls = db_polls
+    # Too early to count
+    vote(db, 0, POLL, "Yes", "early")
+    ENV.m.save(ENV.c.Question(
+        POLL, name="Root beer floats?",
+        oneOf=[{"@type": "Note", "name": "Yes"},
+               {"@type": "Note", "name": "No"}]), db)
+    for i in range(10):
+        vote(db, i + 1, POLL, "Yes" if i < 7 else "No", "voter/%d" % i)
+    # Only first votes count, and saving a vote twice is harmless
+    vote(db, 20, POLL, "No", "voter/0")
+    vote(db, 1, POLL, "Yes", "voter/0")
+    vote(db, 21, POLL, "Maybe", "voter/20")
+    ENV.m.save(ENV.c.Note(EX + "chat", inReplyTo=POLL, content="Hmm"), db)
+
+    assert polls.tally(db, POLL) == {
+        "options": {"Yes": 7, "No": 3}, "voters": 10, "multiple": False}
+    assert polls.voted(db, POLL, EX + "voter/0") == ["Yes"]
+
+    # Deleting or changing a vote updates the tally
+    ENV.m.delete(ENV.c.Note(EX + "vote/2"), db)
+    vote(db, 3, POLL, "No", "voter/2")
+    assert polls.tally(db, POLL)["options"] == {"Yes": 5, "No": 4}
+    assert polls.tally(db, POLL)["voters"] == 9
+
+    # A deleted vote's place goes to the voter's next one
+    ENV.m.delete(ENV.c.Note(EX + "vote/1"), db)
+    assert polls.voted(db, POLL, EX + "voter/0") == ["No"]
+    assert polls.tally(db, POLL) == {
+        "options": {"Yes": 4, "No": 5}, "voters": 9, "multiple": False}
+
+    # Deleting the Question deletes everything about it
+    ENV.m.delete(ENV.c.Question(POLL), db)
+    assert polls.tally(db, POLL) is None
+    assert [key for key in db.db.keys()
+            if b"polls/" in key and b"/next" not in key] == []
+
+
+def test_option_dropped(db_polls):
+    db, polls = db_polls
+    question = ENV.c.Question(
+        POLL, oneOf=[{"@type": "Note", "name": name}
+                     for name in ("Yes", "No")])
+    ENV.m.save(question, db)
+    vote(db, 1, POLL, "No", "voter/0")
+    vote(db, 2, POLL, "Yes", "voter/0")
+    vote(db, 3, POLL, "No", "voter/1")
+    assert polls.voted(db, POLL, EX + "voter/0") == ["No"]
+
+    # Dropping No lets voter/0's Yes count instead
+    ENV.m.save(question.evolve(oneOf=[{"@type": "Note", "name": "Yes"}]),
+               db)
+    assert polls.tally(db, POLL) == {
+        "options": {"Yes": 1}, "voters": 1, "multiple": False}
+    assert polls.voted(db, POLL, EX + "voter/0") == ["Yes"]
+    assert polls.voted(db, POLL, EX + "voter/1") == []
+
+    # Dropped votes don't count against anyone when deleted
+    ENV.m.delete(ENV.c.Note(EX + "vote/1"), db)
+    ENV.m.delete(ENV.c.Note(EX + "vote/3"), db)
+    assert polls.tally(db, POLL) == {
+        "options": {"Yes": 1}, "voters": 1, "multiple": False}
+
+
+def test_any_of(db_polls):
+    db, polls = db_polls
+    ENV.m.save(ENV.c.Question(
+        SURVEY, anyOf=[{"@type": "Note", "name": name}
+                       for name in ("Vanilla", "Chocolate", "Mint")]), db)
+    vote(db, 1, SURVEY, "Vanilla", "alice")
+    vote(db, 2, SURVEY, "Mint", "alice")
+    vote(db, 3, SURVEY, "Mint", "alice")
+    vote(db, 4, SURVEY, "Mint", "bob")
+    assert polls.tallies(db, [SURVEY, POLL]) == [
+        {"options": {"Vanilla": 1, "Chocolate": 0, "Mint": 2},
+         "voters": 2, "multiple": True},
+        None]
+    assert polls.voted(db, SURVEY, EX + "alice") == ["Vanilla", "Mint"]
+
+    ENV.m.delete(ENV.c.Note(EX + "vote/1"), db)
+    ENV.m.delete(ENV.c.Note(EX + "vote/4"), db)
+    assert polls.tally(db, SURVEY) == {
+        "options": {"Vanilla": 0, "Chocolate": 0, "Mint": 1},
+        "voters": 1, "multiple": True}
@@ -0,0 +1,112 @@
+## Activipy --- ActivityStreams 2.0 implementation and validator for Python
+## Copyright © 2015 Christopher Allan Webber <cwebber@dustycloud.org>
+##
+## This file is part of Activipy, which is GPLv3+ or Apache v2, your option
+## (see COPYING); since that means effectively Apache v2 here's those headers
+##
+## Apache v2 header:
+##   Licensed under the Apache License, Version 2.0 (the "License");
+##   you may not use this file except in compliance with the License.
+##   You may obtain a copy of the License at
+##
+##       http://www.apache.org/licenses/LICENSE-2.0
+##
+##   Unless required by applicable law or agreed to in writing, software
+##   distributed under the License is distributed on an "AS IS" BASIS,
+##   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##   See the License for the specific language governing permissions and
+##   limitations under the License.
+
+
+import pytest
+
+from activipy.demos import dbm
+from activipy.demos.dbm_refs import RefIndex
+
+ENV = dbm.DbmNormalizedEnv
+
+
+@pytest.fixture
+def refs_db(tmpdir):
+    refs = RefIndex(segment_size=2)
+    db = dbm.JsonDBM.open(str(tmpdir.join("test.db")), indexes=[refs])
+    yield refs, db
+    db.close()
+
+
+def test_ref_index(refs_db):
+    refs, db = refs_db
+    note_id = "http://example.org/note/1"
+    alice = "http://example.org/alice"
+    bob = "http://example.org/bob"
+
+    ENV.m.save(ENV.c.Create(
+        "http://example.org/create/1", actor=alice,
+        object=ENV.c.Note(note_id, attributedTo=alice, content="hi")), db)
+    for i, actor in enumerate([bob, alice, bob]):
+        ENV.m.save(ENV.c.Like(
+            "http://example.org/like/%d" % i,
+            actor={"@type": "Person", "@id": actor},
+            object=note_id), db)
+    ENV.m.save(ENV.c.Note(
+        "http://example.org/reply/1", attributedTo=bob, inReplyTo=note_id,
+        tag=[{"@type": "Mention", "href": alice},
+             "http://example.org/tag/hi"]), db)
+
+    # Who did what with the note
+    assert refs.referrers(db, note_id, "object") == [
+        "http://example.org/like/2", "http://example.org/like/1",
+        "http://example.org/like/0", "http://example.org/create/1"]
+    assert refs.referrers(db, note_id, "object", start=1, count=2) == [
+        "http://example.org/like/1", "http://example.org/like/0"]
+    assert refs.referrers(db, note_id, "object", count=2,
+                          newest_first=False) == [
+        "http://example.org/create/1", "http://example.org/like/0"]
+    assert refs.referrers(db, note_id, "inReplyTo") == [
+        "http://example.org/reply/1"]
+    assert refs.referrers(db, note_id) == [
+        ["http://example.org/reply/1", "inReplyTo"],
+        ["http://example.org/like/2", "object"],
+        ["http://example.org/like/1", "object"],
+        ["http://example.org/like/0", "object"],
+        ["http://example.org/create/1", "object"]]
+    assert refs.count(db, note_id) == 5
+    assert refs.referrers(db, alice, "actor") == [
+        "http://example.org/like/1", "http://example.org/create/1"]
+    assert refs.referrers(db, "http://example.org/tag/hi") == [
+        ["http://example.org/reply/1", "tag"]]
+
+    # Updates only change what changed, deletes clean up
+    ENV.m.save(ENV.c.Like(
+        "http://example.org/like/1", actor=alice,
+        object="http://example.org/note/2"), db)
+    assert refs.referrers(db, note_id, "object", count=2) == [
+        "http://example.org/like/2", "http://example.org/like/0"]
+    assert refs.referrers(db, alice, "actor") == [
+        "http://example.org/like/1", "http://example.org/create/1"]
+
+    ENV.m.delete(ENV.c.Like("http://example.org/like/2"), db)
+    assert refs.count(db, note_id, "object") == 2
+    assert refs.referrers(db, bob, "actor") == ["http://example.org/like/0"]
+
+
+def test_ref_removal_touches_one_segment(refs_db, monkeypatch):
+    refs, db = refs_db
+    note_id = "http://example.org/note/1"
+    for i in range(50):
+        ENV.m.save(ENV.c.Like(
+            "http://example.org/like/%d" % i, object=note_id), db)
+
+    loaded = []
+    load_segment = dbm.DbmSortedList._load_segment
+    def counting_load(self, segment_key):
+        loaded.append(segment_key)
+        return load_segment(self, segment_key)
+    monkeypatch.setattr(dbm.DbmSortedList, "_load_segment", counting_load)
+
+    ENV.m.delete(ENV.c.Like("http://example.org/like/20"), db)
+    # One segment from each of the two lists
+    assert len(loaded) == 2
+    assert refs.count(db, note_id, "object") == 49
+    assert "http://example.org/like/20" not in refs.referrers(
+        db, note_id, "object", count=None)
@@ -0,0 +1,100 @@
+## Activipy --- ActivityStreams 2.0 implementation and validator for Python
+## Copyright © 2015 Christopher Allan Webber <cwebber@dustycloud.org>
+##
+## This file is part of Activipy, which is GPLv3+ or Apache v2, your option
+## (see COPYING); since that means effectively Apache v2 here's those headers
+##
+## Apache v2 header:
+##   Licensed under the Apache License, Version 2.0 (the "License");
+##   you may not use this file except in compliance with the License.
+##   You may obtain a copy of the License at
+##
+##       http://www.apache.org/licenses/LICENSE-2.0
+##
+##   Unless required by applicable law or agreed to in writing, software
+##   distributed under the License is distributed on an "AS IS" BASIS,
+##   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##   See the License for the specific language governing permissions and
+##   limitations under the License.
+
+
+
+import pytest
+
+from activipy.demos import dbm
+from activipy.demos.dbm_tags import (
+    HASHTAG, MENTION, OBJECT, TagIndex, hashtag_name, normalize_href)
+
+ENV = dbm.DbmEnv
+EX = "http://example.org/"
+
+
+@pytest.fixture
+def db_tags(tmpdir):
+    tags = TagIndex(ENV, segment_size=4)
+    db = dbm.JsonDBM.open(str(tmpdir.join("test.db")), indexes=[tags])
+    yield db, tags
+    db.close()
+
+
+def test_normalize():
+    assert hashtag_name("#RootBeer") == "rootbeer"
+    assert hashtag_name("#Ｆｌｏａｔｓ") == "floats"
+    assert normalize_href("HTTP://Example.ORG/Bob#me") == (
+        "http://example.org/Bob")
+
+
+def test_tag_index(db_tags):
+    db, tags = db_tags
+    for day in range(1, 11):
+        tag = [{"@type": "Hashtag", "name": "#RootBeer"}]
+        if day % 2:
+            tag.append({"@type": "Mention", "href": EX + "bob"})
+        if day % 5 == 0:
+            tag.append({"name": "#floats"})
+        ENV.m.save(ENV.c.Note(
+            EX + "note/%d" % day, tag=tag,
+            published="2015-10-%02dT12:00:00Z" % day), db)
+    ENV.m.save(ENV.c.Note(EX + "undated", tag=[
+        {"name": "#rootbeer"}, EX + "place/1", "junk-free"]), db)
+
+    assert tags.tags(db[EX + "note/5"]) == {
+        (HASHTAG, "rootbeer"), (HASHTAG, "floats"),
+        (MENTION, EX + "bob")}
+    assert tags.count(db, HASHTAG, "#ROOTBEER") == 11
+    assert tags.count(db, MENTION, EX + "bob") == 5
+    assert tags.count(db, OBJECT, EX + "place/1") == 1
+
+    # Pages, newest first, undated things last
+    ids, cursor = tags.page(db, HASHTAG, "rootbeer", count=4)
+    assert ids == [EX + "note/%d" % day for day in (10, 9, 8, 7)]
+    ids, cursor = tags.page(db, HASHTAG, "rootbeer", before=cursor,
+                            count=4)
+    assert ids == [EX + "note/%d" % day for day in (6, 5, 4, 3)]
+    ids, cursor = tags.page(db, HASHTAG, "rootbeer", before=cursor,
+                            count=4)
+    assert ids == [EX + "note/2", EX + "note/1", EX + "undated"]
+    assert cursor is None
+    assert tags.page(db, MENTION, "HTTP://EXAMPLE.ORG/bob", count=2)[0] == [
+        EX + "note/9", EX + "note/7"]
+    assert tags.page(db, HASHTAG, "nothing") == ([], None)
+
+    # Counts over time (undated things aren't counted)
+    assert tags.trending(db, "2015-10-01T00:00:00Z") == [
+        ("rootbeer", 10), ("floats", 2)]
+    assert tags.counts(db, "2015-10-05T00:00:00Z",
+                       "2015-10-06T00:00:00Z") == {
+        (HASHTAG, "rootbeer"): 1, (HASHTAG, "floats"): 1,
+        (MENTION, EX + "bob"): 1}
+
+    # Editing and deleting keep it all up to date
+    ENV.m.save(ENV.c.Note(
+        EX + "note/5", tag=[{"name": "#icecream"}],
+        published="2015-10-05T12:00:00Z"), db)
+    ENV.m.delete(ENV.c.Note(EX + "note/10"), db)
+    assert tags.count(db, HASHTAG, "floats") == 0
+    assert tags.count(db, MENTION, EX + "bob") == 4
+    assert tags.page(db, HASHTAG, "floats") == ([], None)
+    assert tags.trending(db, "2015-10-01T00:00:00Z", count=2) == [
+        ("rootbeer", 8), ("icecream", 1)]
+    assert tags.counts(db, "2015-10-10T00:00:00Z") == {}
@@ -0,0 +1,174 @@
+## Activipy --- ActivityStreams 2.0 implementation and validator for Python
+## Copyright © 2015 Christopher Allan Webber <cwebber@dustycloud.org>
+##
+## This file is part of Activipy, which is GPLv3+ or Apache v2, your option
+## (see COPYING); since that means effectively Apache v2 here's those headers
+##
+## Apache v2 header:
+##   Licensed under the Apache License, Version 2.0 (the "License");
+##   you may not use this file except in compliance with the License.
+##   You may obtain a copy of the License at
+##
+##       http://www.apache.org/licenses/LICENSE-2.0
+##
+##   Unless required by applicable law or agreed to in writing, software
+##   distributed under the License is distributed on an "AS IS" BASIS,
+##   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##   See the License for the specific language governing permissions and
+##   limitations under the License.
+
+
+
+import random
+
+import pytest
+
+from activipy import vocab
+from activipy.demos import dbm
+from activipy.demos.dbm_text import (
+    PostingList, TextIndex, _decode_varints, _encode_varints, tokens)
+
+ENV = dbm.DbmEnv
+EX = "http://example.org/"
+
+
+@pytest.fixture
+def db_text(tmpdir):
+    text = TextIndex(ENV, segment_size=4)
+    db = dbm.JsonDBM.open(str(tmpdir.join("test.db")), indexes=[text])
+    yield db, text
+    db.close()
+
+
+def ids(results):
+    return [id for id, score in results]
+
+
+def test_tokens():
+    assert tokens("<p>Root-beer <b>FLOATS</b> at the Café &amp; co</p>") == [
+        "root", "beer", "floats", "at", "the", "cafe", "co"]
+    assert tokens("") == []
+    assert tokens("x" * 100 + " ok") == ["ok"]
+
+
+def test_posting_list_compression(tmpdir):
+    values = sorted(random.Random(1).sample(range(1 << 30), 500))
+    assert _decode_varints(_encode_varints(values)) == values
+
+    db = dbm.JsonDBM.open(str(tmpdir.join("test.db")))
+    postings = PostingList(db, "postings", segment_size=64)
+    for value in values:
+        postings.add(value)
+    assert list(postings.iter_from()) == values
+    postings.remove(values[10])
+    assert values[10] not in postings
+    assert len(postings) == 499
+    db.close()
+
+
+def test_search(db_text):
+    db, text = db_text
+    ENV.m.save(ENV.c.Note(
+        EX + "note/1", content="Up for some <b>root beer</b> floats?",
+        attributedTo=EX + "alice", published="2015-10-01T12:00:00Z"), db)
+    ENV.m.save(ENV.c.Article(
+        EX + "article/1", name="Root beer",
+        content="A history of root beer, root beer floats and more",
+        attributedTo=EX + "bob", published="2015-10-02T12:00:00Z"), db)
+    ENV.m.save(ENV.c.Note(
+        EX + "note/2", contentMap={"en": "Ice cream", "fr": "Glace"},
+        attributedTo=EX + "bob", published="2015-10-03T12:00:00Z"), db)
+    ENV.m.save(ENV.c.Person(EX + "alice", name="Alice Rootbeer"), db)
+    ENV.m.save(ENV.c.Like(EX + "like/1", object=EX + "note/1"), db)
+
+    assert text.count(db) == 4
+    # Names count for more, and all terms must be there
+    assert ids(text.search(db, "root beer")) == [
+        EX + "article/1", EX + "note/1"]
+    assert ids(text.search(db, "root beer floats ice")) == []
+    assert ids(text.search(db, "nothing")) == []
+    assert ids(text.search(db, "")) == []
+    # Every language gets indexed
+    assert ids(text.search(db, "glace")) == [EX + "note/2"]
+
+    # Typeahead: the last term is a prefix
+    # (rootbeer being rarer than root, and in a name)
+    assert ids(text.search(db, "roo", prefix=True)) == [
+        EX + "alice", EX + "article/1", EX + "note/1"]
+    assert ids(text.search(db, "beer fl", prefix=True)) == [
+        EX + "article/1", EX + "note/1"]
+    assert ids(text.search(db, "roo")) == []
+
+    # Filters
+    assert ids(text.search(db, "root", astype=vocab.Note)) == [
+        EX + "note/1"]
+    assert ids(text.search(db, "roo", prefix=True,
+                           astype=vocab.Actor)) == [EX + "alice"]
+    assert ids(text.search(db, "root", actor=EX + "alice")) == [
+        EX + "note/1"]
+    assert ids(text.search(
+        db, "root", start="2015-10-02T00:00:00Z")) == [EX + "article/1"]
+    assert ids(text.search(
+        db, "root", end="2015-10-02T00:00:00Z")) == [EX + "note/1"]
+    assert ids(text.search(db, "root", count=1)) == [EX + "article/1"]
+
+    # Edits only change what changed, and deletes clean up
+    ENV.m.save(ENV.c.Note(
+        EX + "note/1", content="Actually, milkshakes",
+        attributedTo=EX + "alice"), db)
+    assert ids(text.search(db, "root beer")) == [EX + "article/1"]
+    assert ids(text.search(db, "milk", prefix=True)) == [EX + "note/1"]
+    ENV.m.delete(ENV.c.Note(EX + "note/1"), db)
+    assert ids(text.search(db, "milkshakes")) == []
+    assert text.count(db) == 3
+    assert "milkshakes" not in text._terms(db)
+
+
+def test_search_many(db_text):
+    db, text = db_text
+    words = ["apple", "banana", "cherry", "damson"]
+    for i in range(200):
+        ENV.m.save(ENV.c.Note(
+            EX + "note/%d" % i,
+            content=" ".join(word for j, word in enumerate(words)
+                             if i % (j + 2) == 0)), db)
+
+    expected = [EX + "note/%d" % i for i in range(199, -1, -1)
+                if i % 2 == 0 and i % 5 == 0]
+    assert ids(text.search(db, "damson apple", count=None)) == expected
+    assert ids(text.search(db, "apple d", prefix=True,
+                           count=None)) == expected
+    # Equal scores come newest first
+    assert ids(text.search(db, "app", prefix=True, count=3)) == [
+        EX + "note/198", EX + "note/196", EX + "note/194"]
+
+
+def test_search_top_k(db_text, monkeypatch):
+    db, text = db_text
+    ENV.m.save(ENV.c.Note(EX + "oldest", name="Apple",
+                          content="apple pie"), db)
+    for i in range(200):
+        ENV.m.save(ENV.c.Note(EX + "note/%d" % i, content="apple"), db)
+
+    loaded = []
+    load_segment = PostingList._load_segment
+    def counting_load(self, segment_key):
+        loaded.append(segment_key)
+        return load_segment(self, segment_key)
+    monkeypatch.setattr(PostingList, "_load_segment", counting_load)
+
+    # The best match is found, and the rest of the page is the
+    # newest, without reading most of the segments
+    assert ids(text.search(db, "apple", count=3)) == [
+        EX + "oldest", EX + "note/199", EX + "note/198"]
+    assert len(loaded) < 10
+    assert ids(text.search(db, "appl", prefix=True, count=2)) == [
+        EX + "oldest", EX + "note/199"]
+    # Filters are applied while searching, not after
+    assert ids(text.search(db, "apple", count=2,
+                           end="2000-01-01T00:00:00Z")) == []
+
+    # Prefixes only read so many postings of each term
+    text.MAX_PREFIX_POSTINGS = 5
+    assert ids(text.search(db, "appl", prefix=True, count=None)) == [
+        EX + "note/%d" % i for i in range(199, 194, -1)]
@@ -0,0 +1,86 @@
+## Activipy --- ActivityStreams 2.0 implementation and validator for Python
+## Copyright © 2015 Christopher Allan Webber <cwebber@dustycloud.org>
+##
+## This file is part of Activipy, which is GPLv3+ or Apache v2, your option
+## (see COPYING); since that means effectively Apache v2 here's those headers
+##
+## Apache v2 header:
+##   Licensed under the Apache License, Version 2.0 (the "License");
+##   you may not use this file except in compliance with the License.
+##   You may obtain a copy of the License at
+##
+##       http://www.apache.org/licenses/LICENSE-2.0
+##
+##   Unless required by applicable law or agreed to in writing, software
+##   distributed under the License is distributed on an "AS IS" BASIS,
+##   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##   See the License for the specific language governing permissions and
+##   limitations under the License.
+
+
+import datetime
+
+import pytest
+
+from activipy import vocab
+from activipy.demos import dbm
+from activipy.demos.dbm_time import TimeIndex
+
+ENV = dbm.DbmEnv
+EX = "http://example.org/"
+
+
+@pytest.fixture
+def db_times(tmpdir):
+    times = TimeIndex(ENV, segment_size=4)
+    db = dbm.JsonDBM.open(str(tmpdir.join("test.db")), indexes=[times])
+    yield db, times
+    db.close()
+
+
+def test_time_index(db_times):
+    db, times = db_times
+    for day in range(1, 11):
+        published = "2015-10-%02dT12:00:00Z" % day
+        ENV.m.save(ENV.c.Note(EX + "note/%d" % day, published=published),
+                   db)
+        ENV.m.save(ENV.c.Like(EX + "like/%d" % day, published=published,
+                              object=EX + "note/%d" % day), db)
+    ENV.m.save(ENV.c.Note(EX + "undated"), db)
+    ENV.m.save(ENV.c.Note(EX + "junk-date", published="yesterday-ish"), db)
+
+    assert times.count(db) == 20
+    assert times.count(db, vocab.Note) == 10
+    assert times.query(db, astype=vocab.Note, count=3) == [
+        EX + "note/10", EX + "note/9", EX + "note/8"]
+    # Filtering on a parent type finds subtypes
+    assert times.query(db, astype=vocab.Activity, count=2) == [
+        EX + "like/10", EX + "like/9"]
+    assert times.query(db, astype=vocab.Object, count=2) == [
+        EX + "note/10", EX + "like/10"]
+    assert times.query(db, astype=vocab.Person) == []
+
+    # Ranges are inclusive, and take strings, datetimes or timestamps
+    assert times.query(
+        db, "2015-10-03T12:00:00Z", "2015-10-04T12:00:00Z",
+        astype=vocab.Note) == [EX + "note/4", EX + "note/3"]
+    assert times.query(
+        db, datetime.datetime(2015, 10, 3, 12, tzinfo=datetime.timezone.utc),
+        dbm.timestamp("2015-10-04T12:00:00Z"), astype=vocab.Note,
+        newest_first=False) == [EX + "note/3", EX + "note/4"]
+    assert times.query(db, end="2015-10-01T23:00:00Z") == [
+        EX + "note/1", EX + "like/1"]
+    assert times.query(db, start="2015-10-10T00:00:00Z",
+                       newest_first=False) == [EX + "like/10", EX + "note/10"]
+    with pytest.raises(ValueError):
+        times.query(db, start="last tuesday")
+
+    # Updates move things; deletes remove them
+    ENV.m.save(ENV.c.Note(EX + "note/1", published="2015-11-01T00:00:00Z",
+                          updated="2015-11-02T00:00:00Z"), db)
+    assert times.query(db, astype=vocab.Note, count=1) == [EX + "note/1"]
+    assert times.query(db, prop="updated") == [EX + "note/1"]
+    ENV.m.delete(ENV.c.Note(EX + "note/1"), db)
+    assert times.query(db, astype=vocab.Note, count=1) == [EX + "note/10"]
+    assert times.query(db, prop="updated") == []
+    assert times.count(db, vocab.Note) == 9
@@ -0,0 +1,124 @@
+## Activipy --- ActivityStreams 2.0 implementation and validator for Python
+## Copyright © 2015 Christopher Allan Webber <cwebber@dustycloud.org>
+##
+## This file is part of Activipy, which is GPLv3+ or Apache v2, your option
+## (see COPYING); since that means effectively Apache v2 here's those headers
+##
+## Apache v2 header:
+##   Licensed under the Apache License, Version 2.0 (the "License");
+##   you may not use this file except in compliance with the License.
+##   You may obtain a copy of the License at
+##
+##       http://www.apache.org/licenses/LICENSE-2.0
+##
+##   Unless required by applicable law or agreed to in writing, software
+##   distributed under the License is distributed on an "AS IS" BASIS,
+##   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##   See the License for the specific language governing permissions and
+##   limitations under the License.
+
+
+from activipy.demos import dbm
+from activipy.demos.dbm_membership import MembershipIndex
+from activipy.demos.dbm_timelines import TimelineStore
+
+ALICE = "http://example.org/alice"
+BOB = "http://example.org/bob"
+CAROL = "http://example.org/carol"
+
+
+ENV = dbm.DbmNormalizedEnv
+
+
+def open_db(tmpdir, timelines):
+    return dbm.JsonDBM.open(str(tmpdir.join("test.db")), indexes=[timelines])
+
+
+def test_timelines(tmpdir):
+    timelines = TimelineStore()
+    db = open_db(tmpdir, timelines)
+    env = ENV
+    for i in range(5):
+        env.m.save(env.c.Create(
+            "http://example.org/create/%d" % i,
+            actor=env.c.Person(ALICE, name="Alice"),
+            to=[BOB], cc=[CAROL, BOB] if i % 2 else [],
+            object=env.c.Note("http://example.org/note/%d" % i,
+                              content="note %d" % i)), db)
+    # Saving again doesn't put it on timelines twice
+    env.m.save(env.c.Create(
+        "http://example.org/create/4", actor=ALICE, to=[BOB],
+        object="http://example.org/note/4"), db)
+    # Only activities go on timelines
+    env.m.save(env.c.Note("http://example.org/note/9", to=[BOB]), db)
+
+    assert timelines.ids(db, BOB, count=3) == [
+        "http://example.org/create/4", "http://example.org/create/3",
+        "http://example.org/create/2"]
+    assert timelines.ids(db, BOB, start=3) == [
+        "http://example.org/create/1", "http://example.org/create/0"]
+    assert timelines.ids(db, CAROL) == [
+        "http://example.org/create/3", "http://example.org/create/1"]
+    assert timelines.count(db, ALICE) == 5
+
+    page = timelines.page(db, env, CAROL)
+    assert [activity["object"]["content"] for activity in page] == [
+        "note 3", "note 1"]
+    assert page[0]["actor"]["name"] == "Alice"
+
+    # Deleted things come off timelines, so pages stay full
+    env.m.delete(env.c.Create("http://example.org/create/3"), db)
+    assert [activity.id for activity in timelines.page(db, env, CAROL)] == [
+        "http://example.org/create/1"]
+    assert timelines.ids(db, BOB, count=3) == [
+        "http://example.org/create/4", "http://example.org/create/2",
+        "http://example.org/create/1"]
+    assert timelines.count(db, ALICE) == 4
+    db.close()
+
+
+def test_timeline_trimming(tmpdir):
+    timelines = TimelineStore(max_len=3, segment_size=2)
+    db = open_db(tmpdir, timelines)
+    env = ENV
+    for i in range(10):
+        env.m.save(env.c.Like("http://example.org/like/%d" % i,
+                              actor=ALICE, to=BOB,
+                              object="http://example.org/note/1"), db)
+    assert timelines.count(db, BOB) == 3
+    assert timelines.ids(db, BOB) == [
+        "http://example.org/like/9", "http://example.org/like/8",
+        "http://example.org/like/7"]
+    db.close()
+
+
+def test_follower_home_timelines(tmpdir):
+    timelines = TimelineStore()
+    # Follows need applying before timelines look at membership
+    db = dbm.JsonDBM.open(str(tmpdir.join("test.db")),
+                          indexes=[MembershipIndex(), timelines])
+    env = ENV
+    env.m.save(env.c.Person(ALICE, name="Alice"), db)
+    for follower in (BOB, CAROL):
+        env.m.save(env.c.Follow(follower + "/follow", actor=follower,
+                                object=ALICE), db)
+    env.m.save(env.c.Create(
+        "http://example.org/create/1", actor=ALICE,
+        to=[ALICE + "/followers"],
+        object=env.c.Note("http://example.org/note/1", content="hi")), db)
+
+    assert timelines.ids(db, BOB) == [
+        "http://example.org/create/1", BOB + "/follow"]
+    assert timelines.ids(db, CAROL) == [
+        "http://example.org/create/1", CAROL + "/follow"]
+    assert timelines.count(db, ALICE + "/followers") == 0
+
+    # Deleting takes it off the timelines it went to, even if the
+    # followers have changed since
+    env.m.save(env.c.Undo("http://example.org/undo/1", actor=CAROL,
+                          object=CAROL + "/follow"), db)
+    env.m.delete(env.c.Create("http://example.org/create/1"), db)
+    assert timelines.ids(db, BOB) == [BOB + "/follow"]
+    assert timelines.ids(db, CAROL) == [
+        "http://example.org/undo/1", CAROL + "/follow"]
+    db.close()
@@ -0,0 +1,171 @@
+## Activipy --- ActivityStreams 2.0 implementation and validator for Python
+## Copyright © 2015 Christopher Allan Webber <cwebber@dustycloud.org>
+##
+## This file is part of Activipy, which is GPLv3+ or Apache v2, your option
+## (see COPYING); since that means effectively Apache v2 here's those headers
+##
+## Apache v2 header:
+##   Licensed under the Apache License, Version 2.0 (the "License");
+##   you may not use this file except in compliance with the License.
+##   You may obtain a copy of the License at
+##
+##       http://www.apache.org/licenses/LICENSE-2.0
+##
+##   Unless required by applicable law or agreed to in writing, software
+##   distributed under the License is distributed on an "AS IS" BASIS,
+##   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##   See the License for the specific language governing permissions and
+##   limitations under the License.
+
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from activipy import core, vocab
+from activipy.demos import delivery
+
+
+class StandInInbox(BaseHTTPRequestHandler):
+    # Set up by the inbox_server fixture
+    received = None
+    failures = None
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.received.append((self.path, json.loads(body.decode("utf-8"))))
+        # (status, number of times to fail, or None for always)
+        status, count = self.failures.get(self.path, (202, 0))
+        if count is None:
+            self.send_response(status)
+        elif count:
+            self.failures[self.path] = (status, count - 1)
+            self.send_response(status)
+        else:
+            self.send_response(202)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def inbox_server():
+    handler = type("Handler", (StandInInbox,),
+                   {"received": [], "failures": {}})
+    server = HTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        yield server, "http://127.0.0.1:%d" % server.server_port
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+def test_deliver(inbox_server):
+    server, base = inbox_server
+    handler = server.RequestHandlerClass
+    # Flaky for two tries, then fine
+    handler.failures["/flaky/inbox"] = (503, 2)
+    # Always rejected
+    handler.failures["/rejecting/inbox"] = (403, None)
+
+    create = delivery.DeliveryEnv.c.Create(
+        "http://example.org/create/1",
+        actor="http://example.org/alice",
+        object={"@type": "Note", "content": "Hello, everyone!"})
+    followers = [
+        {"@type": "Person", "inbox": base + "/bob/inbox",
+         "endpoints": {"sharedInbox": base + "/shared"}},
+        {"@type": "Person", "inbox": base + "/carol/inbox",
+         "endpoints": {"sharedInbox": base + "/shared"}},
+        core.ASObj({"@type": "Person", "inbox": base + "/dave/inbox"}),
+        base + "/flaky/inbox",
+        base + "/rejecting/inbox",
+        base + "/dave/inbox",
+        {"@type": "Person", "name": "Nowhere to deliver"}]
+
+    results = delivery.deliver(create, followers, concurrency=2,
+                               retries=3, backoff=0)
+    by_inbox = {result.inbox: result for result in results}
+    assert [result.inbox for result in results] == [
+        base + "/shared", base + "/dave/inbox", base + "/flaky/inbox",
+        base + "/rejecting/inbox"]
+
+    assert by_inbox[base + "/shared"].ok
+    assert by_inbox[base + "/shared"].attempts == 1
+    assert by_inbox[base + "/flaky/inbox"].ok
+    assert by_inbox[base + "/flaky/inbox"].attempts == 3
+    rejected = by_inbox[base + "/rejecting/inbox"]
+    assert not rejected.ok
+    assert rejected.status == 403
+    assert rejected.attempts == 1
+    for result in results:
+        assert result.latency >= 0
+
+    # Everybody got the same thing, with a context
+    assert len(handler.received) == 6
+    for path, body in handler.received:
+        assert body == dict(create.json(), **{
+            "@context": core.AS2_CONTEXT_URI})
+
+    [result] = delivery.deliver(create, ["mailto:nope@example.org"])
+    assert not result.ok
+    assert result.attempts == 1
+
+    # Give up after enough retries
+    handler.received[:] = []
+    handler.failures["/down/inbox"] = (500, None)
+    [result] = delivery.deliver(create, [base + "/down/inbox"],
+                                retries=2, backoff=0)
+    assert not result.ok
+    assert result.attempts == 3
+    assert result.status == 500
+    assert len(handler.received) == 3
+
+
+def test_deliver_custom_transport():
+    import asyncio
+
+    in_flight = []
+    max_in_flight = []
+    async def fake_deliver(asobj, inbox, body):
+        in_flight.append(inbox)
+        max_in_flight.append(len(in_flight))
+        await asyncio.sleep(0.001)
+        in_flight.remove(inbox)
+        if inbox == "http://example.org/unreachable":
+            raise delivery.DeliveryError("connection refused")
+        if inbox == "http://example.org/buggy":
+            raise KeyError("oops")
+        if inbox == "http://example.org/forgetful":
+            return None
+        return 200
+
+    env = core.Environment(
+        methods={(delivery.deliver_method, vocab.Object):
+                 fake_deliver},
+        snapshot=delivery.DeliveryEnv.snapshot())
+    note = env.c.Note("http://example.org/note/1", content="hi")
+    inboxes = ["http://example.org/%d/inbox" % i for i in range(50)]
+
+    results = delivery.deliver(
+        note, inboxes + ["http://example.org/unreachable",
+                         "http://example.org/buggy",
+                         "http://example.org/forgetful"],
+        concurrency=5, retries=1, backoff=0)
+    assert all(result.ok for result in results[:50])
+    assert results[50] == results[50]._replace(
+        ok=False, status=None, error="connection refused", attempts=2)
+    # Unexpected errors only fail their own delivery
+    assert results[51] == results[51]._replace(
+        ok=False, status=None, error="KeyError: 'oops'", attempts=1)
+    assert results[52] == results[52]._replace(
+        ok=False, status=None,
+        error="deliver method returned None, not a status", attempts=1)
+    assert max(max_in_flight) == 5
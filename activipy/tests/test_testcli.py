@@ -0,0 +1,106 @@
+## Activipy --- ActivityStreams 2.0 implementation and validator for Python
+## Copyright © 2015 Christopher Allan Webber <cwebber@dustycloud.org>
+##
+## This file is part of Activipy, which is GPLv3+ or Apache v2, your option
+## (see COPYING); since that means effectively Apache v2 here's those headers
+##
+## Apache v2 header:
+##   Licensed under the Apache License, Version 2.0 (the "License");
+##   you may not use this file except in compliance with the License.
+##   You may obtain a copy of the License at
+##
+##       http://www.apache.org/licenses/LICENSE-2.0
+##
+##   Unless required by applicable law or agreed to in writing, software
+##   distributed under the License is distributed on an "AS IS" BASIS,
+##   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##   See the License for the specific language governing permissions and
+##   limitations under the License.
+
+import json
+
+import pytest
+
+from activipy import testcli
+
+
+DOCS = [
+    {"@type": "Note", "@id": "http://example.org/1", "content": "hi"},
+    {"@type": "Create", "actor": {"@type": "Person"},
+     "published": "yesterday-ish"},
+    {"type": "Like", "id": "http://example.org/2"}]
+
+
+@pytest.fixture
+def ndjson_file(tmpdir):
+    filename = tmpdir.join("docs.ndjson")
+    filename.write(
+        "\n".join(json.dumps(doc) for doc in DOCS) + "\n\nnot json\n")
+    return str(filename)
+
+
+def _run(capsys, *argv):
+    with pytest.raises(SystemExit) as excinfo:
+        testcli.main(list(argv))
+        # A clean run doesn't exit at all
+        raise SystemExit(0)
+    out, err = capsys.readouterr()
+    return excinfo.value.code, out, err
+
+
+def test_validate(capsys, ndjson_file):
+    code, out, err = _run(capsys, "validate", ndjson_file)
+    assert code == testcli.EXIT_FAILURES
+    assert out == ""
+    assert "docs.ndjson:2: published: expected dateTime" in err
+    assert "docs.ndjson:5: invalid json" in err
+    assert err.count("\n") == 2
+
+
+def test_types_with_jobs_and_stats(capsys, ndjson_file):
+    code, out, err = _run(
+        capsys, "types", "--jobs", "2", "--stats", ndjson_file)
+    assert code == testcli.EXIT_FAILURES
+    assert out == "1\tCreate\n1\tLike\n1\tNote\n"
+    assert "docs: 4 (1 failed)" in err
+    assert "docs/s" in err
+    assert "p99" in err
+    assert "types cache:" in err
+
+
+def test_expand_and_compact(capsys, tmpdir):
+    filename = tmpdir.join("good.ndjson")
+    filename.write(json.dumps(DOCS[0]) + "\n")
+
+    code, out, err = _run(capsys, "expand", str(filename))
+    assert code == 0
+    expanded = json.loads(out)
+    assert expanded[0]["@type"] == [
+        "http://www.w3.org/ns/activitystreams#Note"]
+
+    code, out, err = _run(capsys, "compact", str(filename))
+    assert code == 0
+    compacted = json.loads(out)
+    assert compacted["type"] == "Note"
+    assert compacted["content"] == "hi"
+
+
+def test_bad_env(capsys, ndjson_file):
+    code, out, err = _run(
+        capsys, "validate", "--env", "nowhere", ndjson_file)
+    assert code == 333
+    assert "Can't load environment" in out
+
+
+def test_processing_value_error(capsys, tmpdir, monkeypatch):
+    # Only unparseable lines are reported as invalid json
+    def broken_type_names(asobj):
+        raise ValueError("no such type")
+    monkeypatch.setattr(testcli, "_type_names", broken_type_names)
+
+    filename = tmpdir.join("good.ndjson")
+    filename.write(json.dumps(DOCS[0]) + "\n")
+    code, out, err = _run(capsys, "types", str(filename))
+    assert code == testcli.EXIT_FAILURES
+    assert "good.ndjson:1: ValueError: no such type" in err
+    assert "invalid json" not in err
@@ -74,7 +74,7 @@
 ##    specific, written prior permission. Title to copyright in this
 ##    work will at all times remain with copyright holders.
 
-from .core import ASType
+from .core import ASType, ASProp
 from .core import ASVocab, Environment, shortids_from_vocab
 
 def as_uri(identifier):
@@ -91,7 +91,24 @@ Object = ASType(
         "The Object class serves as the base class for most of the "
         "other kinds of objects defined in the Activity Vocabulary, "
         "include other Core classes such as Activity, "
-        "IntransitiveActivity, Actor, Collection and OrderedCollection."))
+        "IntransitiveActivity, Actor, Collection and OrderedCollection."),
+    props=[
+        ASProp("published", ["dateTime"], functional=True),
+        ASProp("updated", ["dateTime"], functional=True),
+        ASProp("startTime", ["dateTime"], functional=True),
+        ASProp("endTime", ["dateTime"], functional=True),
+        ASProp("duration", ["duration"], functional=True),
+        ASProp("mediaType", ["mediaType"], functional=True),
+        ASProp("replies", ["reference"], functional=True),
+        ASProp("attributedTo", ["reference"]),
+        ASProp("inReplyTo", ["reference"]),
+        ASProp("location", ["reference"]),
+        ASProp("tag", ["reference"]),
+        ASProp("to", ["reference"]),
+        ASProp("bto", ["reference"]),
+        ASProp("cc", ["reference"]),
+        ASProp("bcc", ["reference"]),
+        ASProp("audience", ["reference"])])
 
 Link = ASType(
     as_uri("Link"), [], "Link",
@@ -101,7 +118,14 @@ Link = ASType(
         "Many of the properties defined by the Activity Vocabulary allow "
         "values that are either instances of Object or Link. When a Link is "
         "used, it establishes a qualified relation connecting the subject "
-        "(the containing object) to the resource identified by the href."))
+        "(the containing object) to the resource identified by the href."),
+    props=[
+        ASProp("href", ["iri"], functional=True),
+        ASProp("hreflang", ["string"], functional=True),
+        ASProp("mediaType", ["mediaType"], functional=True),
+        ASProp("height", ["nonNegativeInteger"], functional=True),
+        ASProp("width", ["nonNegativeInteger"], functional=True),
+        ASProp("rel", ["string"])])
 
 Activity = ASType(
     as_uri("Activity"), [Object], "Activity",
@@ -111,7 +135,14 @@ Activity = ASType(
         "happened. The Activity class itself serves as an abstract base "
         "class for all types of activities. It is important to note that "
         "the Activity class itself does not carry any specific semantics "
-        "about the kind of action being taken."))
+        "about the kind of action being taken."),
+    props=[
+        ASProp("actor", ["reference"]),
+        ASProp("object", ["reference"]),
+        ASProp("target", ["reference"]),
+        ASProp("result", ["reference"]),
+        ASProp("origin", ["reference"]),
+        ASProp("instrument", ["reference"])])
 
 IntransitiveActivity = ASType(
     as_uri("IntransitiveActivity"), [Activity], "IntransitiveActivity",
@@ -132,7 +163,13 @@ Collection = ASType(
         "A Collection is a subclass of Object that represents ordered or "
         "unordered sets of Object or Link instances.\n\n"
         "Refer to the Activity Streams 2.0 Core specification for a complete"
-        "description of the Collection type."))
+        "description of the Collection type."),
+    props=[
+        ASProp("totalItems", ["nonNegativeInteger"], functional=True),
+        ASProp("current", ["reference"], functional=True),
+        ASProp("first", ["reference"], functional=True),
+        ASProp("last", ["reference"], functional=True),
+        ASProp("items", ["reference"])])
 
 OrderedCollection = ASType(
     as_uri("OrderedCollection"), [Collection], "OrderedCollection",
@@ -145,7 +182,11 @@ CollectionPage = ASType(
     notes=(
         "Used to represent distinct subsets of items from a Collection. "
         "Refer to the Activity Streams 2.0 Core for a complete description of "
-        "the CollectionPage object."))
+        "the CollectionPage object."),
+    props=[
+        ASProp("partOf", ["reference"], functional=True),
+        ASProp("next", ["reference"], functional=True),
+        ASProp("prev", ["reference"], functional=True)])
 
 OrderedCollectionPage = ASType(
     as_uri("OrderedCollectionPage"), [OrderedCollection, CollectionPage],
@@ -153,7 +194,9 @@ OrderedCollectionPage = ASType(
     notes=(
         "Used to represent ordered subsets of items from an OrderedCollection. "
         "Refer to the Activity Streams 2.0 Core for a complete description of "
-        "the OrderedCollectionPage object."))
+        "the OrderedCollectionPage object."),
+    props=[
+        ASProp("startIndex", ["nonNegativeInteger"], functional=True)])
 
 
 
@@ -431,7 +474,9 @@ Relationship = ASType(
         "The subject and object properties are used to identify the "
         "connected individuals.\n\n"
         "See 3.3.1 [of ActivityStreams 2.0 Vocabulary document] Representing "
-        "Relationships Between Entities for additional information."))
+        "Relationships Between Entities for additional information."),
+    props=[
+        ASProp("subject", ["reference"], functional=True)])
 
 Content = ASType(
     as_uri("Content"), [Object],
@@ -512,7 +557,10 @@ Question = ASType(
         "Represents a question being asked. Question objects are unique in "
         "that they are an extension of both Content and IntransitiveActivity. "
         "That is, the Question object is an Activity but the direct object is "
-        "the question itself."))
+        "the question itself."),
+    props=[
+        ASProp("oneOf", ["reference"]),
+        ASProp("anyOf", ["reference"])])
 
 Event = ASType(
     as_uri("Event"), [Object],
@@ -526,7 +574,14 @@ Place = ASType(
     notes=(
         "Represents a logical or physical location. "
         "See 3.3.2 Representing Places [of ActivityStreams 2.0 Vocabulary "
-        "document] for additional information."))
+        "document] for additional information."),
+    props=[
+        ASProp("accuracy", ["number"], functional=True),
+        ASProp("altitude", ["number"], functional=True),
+        ASProp("latitude", ["number"], functional=True),
+        ASProp("longitude", ["number"], functional=True),
+        ASProp("radius", ["number"], functional=True),
+        ASProp("units", ["string"], functional=True)])
 
 Mention = ASType(
     as_uri("Mention"), [Link],
@@ -540,7 +595,9 @@ Profile = ASType(
     notes=(
         "A Profile is a content object that describes another Object, "
         "typically used to describe Actor, objects. The describes property "
-        "is used to reference the object being described by the profile."))
+        "is used to reference the object being described by the profile."),
+    props=[
+        ASProp("describes", ["reference"], functional=True)])
 
 
 
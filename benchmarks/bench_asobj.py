@@ -0,0 +1,126 @@
+## Activipy --- ActivityStreams 2.0 implementation and validator for Python
+## Copyright © 2015 Christopher Allan Webber <cwebber@dustycloud.org>
+##
+## This file is part of Activipy, which is GPLv3+ or Apache v2, your option
+## (see COPYING); since that means effectively Apache v2 here's those headers
+##
+## Apache v2 header:
+##   Licensed under the Apache License, Version 2.0 (the "License");
+##   you may not use this file except in compliance with the License.
+##   You may obtain a copy of the License at
+##
+##       http://www.apache.org/licenses/LICENSE-2.0
+##
+##   Unless required by applicable law or agreed to in writing, software
+##   distributed under the License is distributed on an "AS IS" BASIS,
+##   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##   See the License for the specific language governing permissions and
+##   limitations under the License.
+
+"""
+Measure ASObj construction and method dispatch on a nested activity,
+and folding a method over a long inheritance chain.
+
+  python -m benchmarks.bench_asobj
+"""
+
+import timeit
+
+from activipy import core, vocab
+from activipy.demos import dbm
+
+# Lots of short batches, taking the best one, is a lot less noisy
+# than a few long ones on a busy machine
+RUNS = 500
+REPEAT = 30
+
+NESTED_ACTIVITY = {
+    "@type": "Announce",
+    "@id": "http://example.org/announce/1",
+    "actor": {
+        "@type": "Person",
+        "@id": "http://example.org/bob",
+        "name": "Bob"},
+    "to": ["http://example.org/alice/followers"],
+    "published": "2015-10-01T12:00:00Z",
+    "object": {
+        "@type": "Create",
+        "@id": "http://example.org/create/1",
+        "actor": {
+            "@type": "Person",
+            "@id": "http://example.org/alice",
+            "name": "Alice"},
+        "object": {
+            "@type": "Note",
+            "@id": "http://example.org/note/1",
+            "content": "Up for some root beer floats?",
+            "tag": [{"@type": "Mention",
+                     "href": "http://example.org/bob"}]}}}
+
+ENV = dbm.DbmNormalizedEnv
+
+
+def construct():
+    return core.ASObj(NESTED_ACTIVITY, ENV)
+
+
+def construct_and_dispatch():
+    asobj = core.ASObj(NESTED_ACTIVITY, ENV)
+    return ENV.asobj_get_method(asobj, dbm.dbm_denormalize_method)
+
+
+def construct_and_query():
+    asobj = core.ASObj(NESTED_ACTIVITY, ENV)
+    return (asobj.types, asobj.id,
+            ENV.asobj_get_method(asobj, dbm.dbm_denormalize_method))
+
+
+BIG_NOTE = vocab.Note(
+    "http://example.org/note/big",
+    content="words " * 100,
+    tag=[{"@type": "Mention", "href": "http://example.org/user/%d" % i}
+         for i in range(200)])
+
+def wrap_big():
+    return vocab.Announce(
+        "http://example.org/announce/big",
+        object=vocab.Create("http://example.org/create/big",
+                            object=BIG_NOTE))
+
+def evolve_big():
+    return BIG_NOTE.evolve(content="edited")
+
+
+# Fold over a six level inheritance chain, as a renderer might
+render = core.MethodId("render", "Render things", core.handle_fold)
+
+def _render_step(asobj, val):
+    return val + 1
+
+RENDER_ENV = core.Environment(
+    methods={(render, astype): _render_step
+             for astype in core.astype_inheritance_list(
+                 vocab.OrderedCollectionPage)},
+    snapshot=vocab.BasicEnv.snapshot())
+PAGE = core.ASObj({"@type": "OrderedCollectionPage"}, RENDER_ENV)
+
+def fold_chain():
+    return RENDER_ENV.m.render(PAGE, 0)
+
+
+def report(name, func, runs=RUNS):
+    elapsed = min(timeit.repeat(func, number=runs, repeat=REPEAT))
+    print("%-40s %8.1fus" % (name, elapsed / runs * 1000000))
+
+
+def main():
+    report("ASObj construction", construct)
+    report("ASObj construction + first dispatch", construct_and_dispatch)
+    report("... + types and id", construct_and_query)
+    report("Announce(Create(big note))", wrap_big)
+    report("big_note.evolve(content=...)", evolve_big)
+    report("fold over inheritance chain", fold_chain)
+
+
+if __name__ == "__main__":
+    main()
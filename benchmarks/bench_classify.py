@@ -0,0 +1,62 @@
+## Activipy --- ActivityStreams 2.0 implementation and validator for Python
+## Copyright © 2015 Christopher Allan Webber <cwebber@dustycloud.org>
+##
+## This file is part of Activipy, which is GPLv3+ or Apache v2, your option
+## (see COPYING); since that means effectively Apache v2 here's those headers
+##
+## Apache v2 header:
+##   Licensed under the Apache License, Version 2.0 (the "License");
+##   you may not use this file except in compliance with the License.
+##   You may obtain a copy of the License at
+##
+##       http://www.apache.org/licenses/LICENSE-2.0
+##
+##   Unless required by applicable law or agreed to in writing, software
+##   distributed under the License is distributed on an "AS IS" BASIS,
+##   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##   See the License for the specific language governing permissions and
+##   limitations under the License.
+
+"""
+Compare routing a batch of objects by type with is_astype in a loop
+against Environment.classify.
+
+  python -m benchmarks.bench_classify
+"""
+
+import timeit
+
+from activipy import core, vocab
+
+ENV = vocab.BasicEnv
+TYPES = ["Note", "Like", "Create", "Follow", "Announce", "Person", "Image"]
+BATCH = [core.ASObj({"@type": TYPES[i % len(TYPES)]}) for i in range(1000)]
+FILTER_TYPES = [vocab.Note, vocab.Activity, vocab.Actor, vocab.Object,
+                vocab.Create, vocab.Follow, vocab.Announce, vocab.Like,
+                vocab.Image, vocab.Document, vocab.Person, vocab.Update]
+
+
+def with_is_astype():
+    return {astype: [i for i, obj in enumerate(BATCH)
+                     if ENV.is_astype(obj, astype)]
+            for astype in FILTER_TYPES}
+
+
+def with_classify():
+    return ENV.classify(BATCH, FILTER_TYPES)
+
+
+def report(name, func, runs=10):
+    elapsed = min(timeit.repeat(func, number=runs, repeat=3))
+    print("%-30s %8.2fms" % (name, elapsed / runs * 1000))
+
+
+def main():
+    assert with_is_astype() == with_classify()
+    print("%d objects, %d types" % (len(BATCH), len(FILTER_TYPES)))
+    report("is_astype loop", with_is_astype)
+    report("Environment.classify", with_classify)
+
+
+if __name__ == "__main__":
+    main()
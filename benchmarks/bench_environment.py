@@ -0,0 +1,75 @@
+## Activipy --- ActivityStreams 2.0 implementation and validator for Python
+## Copyright © 2015 Christopher Allan Webber <cwebber@dustycloud.org>
+##
+## This file is part of Activipy, which is GPLv3+ or Apache v2, your option
+## (see COPYING); since that means effectively Apache v2 here's those headers
+##
+## Apache v2 header:
+##   Licensed under the Apache License, Version 2.0 (the "License");
+##   you may not use this file except in compliance with the License.
+##   You may obtain a copy of the License at
+##
+##       http://www.apache.org/licenses/LICENSE-2.0
+##
+##   Unless required by applicable law or agreed to in writing, software
+##   distributed under the License is distributed on an "AS IS" BASIS,
+##   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##   See the License for the specific language governing permissions and
+##   limitations under the License.
+
+"""
+Measure how long it takes to construct an Environment, both from
+scratch and from an EnvironmentSnapshot.
+
+  python -m benchmarks.bench_environment
+"""
+
+import os
+import tempfile
+import timeit
+
+from activipy import core, vocab
+from activipy.demos import dbm
+
+RUNS = 2000
+
+
+def from_scratch():
+    return core.Environment(
+        vocabs=[vocab.CoreVocab],
+        methods=dbm.DbmNormalizedEnv.methods,
+        shortids=core.shortids_from_vocab(vocab.CoreVocab),
+        c_accessors=core.shortids_from_vocab(vocab.CoreVocab))
+
+
+SNAPSHOT = vocab.BasicEnv.snapshot()
+
+def from_snapshot():
+    return core.Environment(
+        methods=dbm.DbmNormalizedEnv.methods,
+        snapshot=SNAPSHOT)
+
+
+def report(name, func, runs=RUNS):
+    elapsed = min(timeit.repeat(func, number=runs, repeat=3))
+    print("%-30s %8.1fus" % (name, elapsed / runs * 1000000))
+
+
+def main():
+    report("Environment from scratch", from_scratch)
+    report("Environment from snapshot", from_snapshot)
+
+    fd, filename = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    try:
+        SNAPSHOT.save(filename)
+        report("EnvironmentSnapshot.load",
+               lambda: core.EnvironmentSnapshot.load(
+                   filename, [vocab.CoreVocab]),
+               runs=200)
+    finally:
+        os.remove(filename)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+## Activipy --- ActivityStreams 2.0 implementation and validator for Python
+## Copyright © 2015 Christopher Allan Webber <cwebber@dustycloud.org>
+##
+## This file is part of Activipy, which is GPLv3+ or Apache v2, your option
+## (see COPYING); since that means effectively Apache v2 here's those headers
+##
+## Apache v2 header:
+##   Licensed under the Apache License, Version 2.0 (the "License");
+##   you may not use this file except in compliance with the License.
+##   You may obtain a copy of the License at
+##
+##       http://www.apache.org/licenses/LICENSE-2.0
+##
+##   Unless required by applicable law or agreed to in writing, software
+##   distributed under the License is distributed on an "AS IS" BASIS,
+##   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##   See the License for the specific language governing permissions and
+##   limitations under the License.
+
+"""
+Measure how long it takes to import activipy's vocabularies.
+
+Each module is imported in a fresh interpreter several times and the
+best run is compared against its budget.  Exits non-zero if any
+module is over budget, or if importing it drags in a module that's
+supposed to stay lazy.
+
+  python -m benchmarks.bench_import
+"""
+
+import subprocess
+import sys
+
+# module: budget in milliseconds
+IMPORT_BUDGETS = {
+    "activipy.vocab": 60,
+    "activipy.jf2_vocab": 70}
+
+# These should only be imported once they're actually needed
+LAZY_MODULES = ["pyld", "pkg_resources"]
+
+RUNS = 5
+
+MEASURE_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import %(module)s
+elapsed = time.perf_counter() - start
+print(elapsed * 1000)
+print(" ".join(name for name in %(lazy)r if name in sys.modules))
+"""
+
+
+def measure(module):
+    best = None
+    eager = set()
+    for i in range(RUNS):
+        output = subprocess.check_output(
+            [sys.executable, "-c",
+             MEASURE_SCRIPT % {"module": module, "lazy": LAZY_MODULES}],
+            universal_newlines=True).splitlines()
+        elapsed = float(output[0])
+        if len(output) > 1:
+            eager.update(output[1].split())
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, eager
+
+
+def main():
+    failed = False
+    for module, budget in sorted(IMPORT_BUDGETS.items()):
+        elapsed, eager = measure(module)
+        status = "ok" if elapsed <= budget else "OVER BUDGET"
+        print("%-20s %7.1fms (budget %dms) %s" % (
+            module, elapsed, budget, status))
+        if eager:
+            print("  ... but eagerly imported: %s" % ", ".join(sorted(eager)))
+            failed = True
+        if elapsed > budget:
+            failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()